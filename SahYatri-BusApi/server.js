@@ -62,6 +62,55 @@ app.post('/api/occupancy', async (req, res) => {
   }
 });
 
+// POST /api/occupancy/bulk
+app.post('/api/occupancy/bulk', async (req, res) => {
+  try {
+    const records = Array.isArray(req.body) ? req.body : req.body.records;
+
+    if (!Array.isArray(records) || records.length === 0) {
+      return res.status(400).json({ error: 'A non-empty records array is required' });
+    }
+
+    // Invalid rows are reported back instead of failing the whole batch
+    const valid = [];
+    const rejected = [];
+    records.forEach((record, index) => {
+      const { camera_id, occupancy, capacity } = record || {};
+      if (!camera_id || occupancy === undefined || capacity === undefined) {
+        rejected.push({ index, error: 'All fields are required' });
+      } else if (occupancy > capacity) {
+        rejected.push({ index, error: 'Occupancy cannot exceed capacity' });
+      } else {
+        valid.push(record);
+      }
+    });
+
+    if (valid.length === 0) {
+      return res.status(400).json({ error: 'No valid records', rejected });
+    }
+
+    const values = [];
+    const rows = valid.map((record, i) => {
+      values.push(record.camera_id, record.occupancy, record.capacity, record.timestamp || null);
+      const p = i * 4;
+      return `($${p + 1}, $${p + 2}, $${p + 3}, COALESCE($${p + 4}::timestamptz, NOW()))`;
+    });
+
+    const query = `
+      INSERT INTO occupancy (camera_id, occupancy, capacity, timestamp)
+      VALUES ${rows.join(', ')}
+      RETURNING *;
+    `;
+
+    const result = await pool.query(query, values);
+    console.log(`Inserted ${result.rowCount} occupancy records in bulk`);
+    res.status(201).json({ inserted: result.rows, rejected });
+  } catch (error) {
+    console.error('Error inserting occupancy records in bulk:', error);
+    res.status(500).json({ error: 'Internal server error' });
+  }
+});
+
 // GET /api/occupancy
 app.get('/api/occupancy', async (req, res) => {
   try {
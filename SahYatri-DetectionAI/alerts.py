@@ -0,0 +1,216 @@
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from registry import CameraConfig
+from sharedstate import SqliteFile
+
+LEVELS = ("normal", "near_full", "full")
+NORMAL, NEAR_FULL, FULL = range(len(LEVELS))
+
+
+class AlertDecision(NamedTuple):
+    """Outcome of evaluating the alert rules for one occupancy."""
+
+    level: str  # current alert level of the camera
+    fire: Optional[str]  # level to send a warning for, if any
+
+
+class CameraAlertState:
+    """Current level and last fire time per level of one camera."""
+
+    __slots__ = ("level", "fired_at")
+
+    def __init__(self):
+        self.level = NORMAL
+        self.fired_at = [-math.inf] * len(LEVELS)
+
+
+def _enter_threshold(level: int, config: CameraConfig) -> float:
+    """Lowest occupancy at which a camera is at level."""
+    if level == FULL:
+        return config.capacity + 1
+    if level == NEAR_FULL and 0 < config.near_full_ratio < 1:
+        return math.ceil(config.near_full_ratio * config.capacity)
+    return math.inf if level == NEAR_FULL else 0
+
+
+class AlertEngine:
+    """
+    Alert rules evaluated on every smoothed occupancy.
+
+    A camera is at level full above its capacity and near_full from
+    near_full_ratio * capacity. It moves up a level as soon as the threshold is
+    crossed, but only back down once occupancy is hysteresis below it, so a
+    count hovering around a threshold does not flap. Entering near_full or full
+    fires a warning unless the same level fired within the camera's cooldown or
+    the local time is within its quiet hours.
+
+    now is wall-clock epoch seconds, so an engine fed replayed readings with
+    their capture time (main.py keeps a separate one for /detect/batch) judges
+    them against that time: cooldown and quiet hours apply as they would have
+    live, and a reading older than the level's last warning never fires again.
+
+    State per camera is a level and the last fire time per level; evaluate()
+    does a few comparisons and only looks at the clock when it is about to fire.
+    """
+
+    def __init__(self, hysteresis: int = 3, max_cameras: int = 1024):
+        self.hysteresis = max(0, hysteresis)
+        self.max_cameras = max(1, max_cameras)
+        self._states: "OrderedDict[str, CameraAlertState]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.fired = {level: 0 for level in LEVELS[1:]}
+        self.cooldown_suppressed = 0
+        self.quiet_suppressed = 0
+        self.evictions = 0
+
+    def _state(self, camera_id: str) -> CameraAlertState:
+        state = self._states.get(camera_id)
+        if state is None:
+            state = self._states[camera_id] = CameraAlertState()
+            while len(self._states) > self.max_cameras:
+                self._states.popitem(last=False)
+                self.evictions += 1
+        self._states.move_to_end(camera_id)
+        return state
+
+    def _decide(self, state: CameraAlertState, occupancy: int, config: CameraConfig,
+                now: Optional[float]) -> Tuple[AlertDecision, Optional[str]]:
+        """Step the camera's state; the outcome is "fired", "cooldown", "quiet" or None."""
+        level = state.level
+        target = max(index for index in range(len(LEVELS)) if occupancy >= _enter_threshold(index, config))
+        if target > level:
+            level = target
+        while level > target and occupancy < _enter_threshold(level, config) - self.hysteresis:
+            level -= 1
+        escalated = level > state.level
+        state.level = level
+        if not escalated:
+            return AlertDecision(LEVELS[level], None), None
+
+        now = time.time() if now is None else now
+        if now - state.fired_at[level] < config.cooldown:
+            return AlertDecision(LEVELS[level], None), "cooldown"
+        if config.quiet_hours:
+            local = time.localtime(now)
+            if config.in_quiet_hours(local.tm_hour * 60 + local.tm_min):
+                return AlertDecision(LEVELS[level], None), "quiet"
+        state.fired_at[level] = now
+        return AlertDecision(LEVELS[level], LEVELS[level]), "fired"
+
+    def evaluate(self, camera_id: str, occupancy: int, config: CameraConfig,
+                 now: Optional[float] = None) -> AlertDecision:
+        """Update the camera's level and decide whether to send a warning; now defaults to the current time."""
+        with self._lock:
+            decision, outcome = self._decide(self._state(camera_id), occupancy, config, now)
+            if outcome == "fired":
+                self.fired[decision.level] += 1
+            elif outcome == "cooldown":
+                self.cooldown_suppressed += 1
+            elif outcome == "quiet":
+                self.quiet_suppressed += 1
+            return decision
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "cameras": len(self._states),
+            "at_level": {
+                name: sum(1 for state in self._states.values() if state.level == index)
+                for index, name in enumerate(LEVELS[1:], start=1)
+            },
+            "fired": dict(self.fired),
+            "cooldown_suppressed": self.cooldown_suppressed,
+            "quiet_suppressed": self.quiet_suppressed,
+            "evictions": self.evictions,
+        }
+
+
+ALERT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS alert_states (
+    namespace TEXT NOT NULL,
+    camera_id TEXT NOT NULL,
+    level INTEGER NOT NULL,
+    fired_at TEXT NOT NULL,
+    seen_at REAL NOT NULL,
+    PRIMARY KEY (namespace, camera_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS alert_states_seen ON alert_states (namespace, seen_at);
+CREATE TABLE IF NOT EXISTS alert_counters (
+    namespace TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (namespace, name)
+) WITHOUT ROWID;
+"""
+
+
+class SharedAlertEngine(AlertEngine):
+    """
+    AlertEngine whose per-camera level and fire times live in a SQLite file shared by all uvicorn workers.
+
+    Per-worker state would let every worker escalate on its own and send its
+    own warning for the same crossing. Here each evaluation reads, steps and
+    writes the camera's state in one transaction, so a crossing fires once
+    and the cooldown holds across workers. Namespaces (live, replay) are
+    kept apart.
+    """
+
+    def __init__(self, path: str, namespace: str = "live", **kwargs):
+        super().__init__(**kwargs)
+        self.namespace = namespace
+        self.db = SqliteFile(path, ALERT_SCHEMA)
+
+    def _count(self, db, name: str) -> None:
+        db.execute(
+            "INSERT INTO alert_counters VALUES (?, ?, 1) "
+            "ON CONFLICT (namespace, name) DO UPDATE SET value = value + 1",
+            (self.namespace, name),
+        )
+
+    def evaluate(self, camera_id: str, occupancy: int, config: CameraConfig,
+                 now: Optional[float] = None) -> AlertDecision:
+        """Update the camera's level and decide whether to send a warning; now defaults to the current time."""
+        key = (self.namespace, camera_id)
+        with self.db.transaction() as db:
+            row = db.execute(
+                "SELECT level, fired_at FROM alert_states WHERE namespace = ? AND camera_id = ?", key
+            ).fetchone()
+            state = CameraAlertState()
+            if row is None:
+                (cameras,) = db.execute(
+                    "SELECT COUNT(*) FROM alert_states WHERE namespace = ?", (self.namespace,)
+                ).fetchone()
+                if cameras >= self.max_cameras:
+                    db.execute("DELETE FROM alert_states WHERE namespace = ? AND camera_id = "
+                               "(SELECT camera_id FROM alert_states WHERE namespace = ? ORDER BY seen_at LIMIT 1)",
+                               (self.namespace, self.namespace))
+                    self._count(db, "evictions")
+            else:
+                state.level, state.fired_at = row[0], json.loads(row[1])
+            decision, outcome = self._decide(state, occupancy, config, now)
+            db.execute("INSERT OR REPLACE INTO alert_states VALUES (?, ?, ?, ?, ?)",
+                       (*key, state.level, json.dumps(state.fired_at), time.time()))
+            if outcome == "fired":
+                self._count(db, f"fired_{decision.level}")
+            elif outcome:
+                self._count(db, f"{outcome}_suppressed")
+        return decision
+
+    def snapshot(self) -> Dict[str, Any]:
+        db = self.db.connection()
+        counters = dict(db.execute("SELECT name, value FROM alert_counters WHERE namespace = ?", (self.namespace,)))
+        levels = dict(db.execute(
+            "SELECT level, COUNT(*) FROM alert_states WHERE namespace = ? GROUP BY level", (self.namespace,)
+        ))
+        return {
+            "cameras": sum(levels.values()),
+            "at_level": {name: levels.get(index, 0) for index, name in enumerate(LEVELS[1:], start=1)},
+            "fired": {level: counters.get(f"fired_{level}", 0) for level in LEVELS[1:]},
+            "cooldown_suppressed": counters.get("cooldown_suppressed", 0),
+            "quiet_suppressed": counters.get("quiet_suppressed", 0),
+            "evictions": counters.get("evictions", 0),
+        }
@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when the inference queue is at capacity and cannot accept more work."""
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    """Return the pct-th percentile of samples (nearest-rank)."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class BatchStats:
+    """Rolling batch-size and queue-wait statistics for the inference batcher."""
+
+    def __init__(self, window: int = 1024):
+        self.batches = 0
+        self.items = 0
+        self.batch_sizes: Counter = Counter()
+        self.queue_waits_ms: Deque[float] = deque(maxlen=window)
+        self.inference_ms: Deque[float] = deque(maxlen=window)
+
+    def record(self, batch_size: int, waits_ms: List[float], inference_ms: float) -> None:
+        self.batches += 1
+        self.items += batch_size
+        self.batch_sizes[batch_size] += 1
+        self.queue_waits_ms.extend(waits_ms)
+        self.inference_ms.append(inference_ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        waits = list(self.queue_waits_ms)
+        inference = list(self.inference_ms)
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "batch_size_histogram": {str(k): v for k, v in sorted(self.batch_sizes.items())},
+            "queue_wait_ms": {
+                "p50": round(_percentile(waits, 50), 2),
+                "p99": round(_percentile(waits, 99), 2),
+                "max": round(max(waits), 2) if waits else 0.0,
+            },
+            "inference_ms": {
+                "p50": round(_percentile(inference, 50), 2),
+                "p99": round(_percentile(inference, 99), 2),
+            },
+        }
+
+
+class InferenceBatcher:
+    """
+    Gathers concurrent inference requests into micro-batches.
+
+    Requests are queued as they arrive. The worker takes the first queued item,
+    then keeps collecting until either max_batch_size items are pending or
+    max_wait_ms has passed, and runs the whole batch through infer_fn in one call.
+
+    infer_fn runs on a dedicated thread so the event loop is never blocked by
+    inference. The queue holds at most max_queue_size pending items; submit()
+    raises QueueFullError beyond that so callers can shed load. on_batch, if
+    given, is called with the batch size and per-item queue waits (ms) after
+    every batch. A failing batch or callback is logged and fails only that
+    batch's requests; should the worker die anyway, a new one is started so
+    queued requests are not left waiting forever.
+    """
+
+    def __init__(
+        self,
+        infer_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        max_queue_size: int = 64,
+        on_batch: Optional[Callable[[int, List[float]], None]] = None,
+    ):
+        self.infer_fn = infer_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.max_queue_size = max(1, max_queue_size)
+        self.stats = BatchStats()
+        self.rejected = 0
+        self.on_batch = on_batch
+        self._executor: ThreadPoolExecutor = None
+        self._queue: "asyncio.Queue[Tuple[Any, asyncio.Future, float]]" = None
+        self._worker: asyncio.Task = None
+
+    async def start(self) -> None:
+        """Start the background batching worker."""
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self._start_worker()
+        logger.info(
+            f"Inference batcher started (max_batch_size={self.max_batch_size}, "
+            f"max_wait_ms={self.max_wait * 1000:.1f}, max_queue_size={self.max_queue_size})"
+        )
+
+    def _start_worker(self) -> None:
+        self._worker = asyncio.create_task(self._run())
+        self._worker.add_done_callback(self._worker_done)
+
+    def _worker_done(self, task: asyncio.Task) -> None:
+        if task.cancelled() or task is not self._worker:
+            return
+        logger.error(f"Inference batcher worker died, restarting: {task.exception()!r}")
+        self._start_worker()
+
+    async def stop(self) -> None:
+        """Cancel the worker and fail any requests still waiting."""
+        if self._worker:
+            worker, self._worker = self._worker, None
+            worker.cancel()
+            try:
+                await worker
+            except asyncio.CancelledError:
+                pass
+        while self._queue and not self._queue.empty():
+            _, future, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Inference batcher stopped"))
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item for inference and wait for its own result."""
+        if self._worker is None:
+            raise RuntimeError("Inference batcher is not running")
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((item, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFullError(f"Inference queue is full ({self.max_queue_size} pending)")
+        return await future
+
+    async def submit_many(self, items: List[Any]) -> List[Any]:
+        """Queue several items together (all or none) and wait for their results in order."""
+        if self._worker is None:
+            raise RuntimeError("Inference batcher is not running")
+        if self._queue.qsize() + len(items) > self.max_queue_size:
+            self.rejected += len(items)
+            raise QueueFullError(f"Inference queue cannot take {len(items)} more items ({self.max_queue_size} max)")
+        loop = asyncio.get_running_loop()
+        enqueued = time.perf_counter()
+        futures = []
+        for item in items:
+            future = loop.create_future()
+            self._queue.put_nowait((item, future, enqueued))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    async def _collect(self) -> List[Tuple[Any, asyncio.Future, float]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    @staticmethod
+    def _fail(batch: List[Tuple[Any, asyncio.Future, float]], error: Exception) -> None:
+        for _, future, _ in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            try:
+                await self._process(batch)
+            except Exception as e:
+                logger.error(f"Inference batch of {len(batch)} failed: {str(e)}")
+                self._fail(batch, e)
+
+    async def _process(self, batch: List[Tuple[Any, asyncio.Future, float]]) -> None:
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        waits_ms = [(started - enqueued) * 1000 for _, _, enqueued in batch]
+        items = [item for item, _, _ in batch]
+        try:
+            results = await loop.run_in_executor(self._executor, self.infer_fn, items)
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        finally:
+            try:
+                self.stats.record(len(batch), waits_ms, (time.perf_counter() - started) * 1000)
+                if self.on_batch:
+                    self.on_batch(len(batch), waits_ms)
+            except Exception as e:
+                logger.error(f"Batch stats callback failed: {str(e)}")
+
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
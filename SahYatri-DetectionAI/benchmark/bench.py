@@ -0,0 +1,382 @@
+"""
+Load-test the detection service and report throughput, latency and memory.
+
+Each sweep point starts a local uvicorn with the given worker count, model tier,
+batch size and inference size, points its Bus/Warning API at local stand-ins,
+drives /detect with a synthetic bus-camera corpus and records the results.
+
+    python benchmark/bench.py --workers 1 2 4 --tiers n s --batch-sizes 1 8 \\
+        --imgsz 480 640 --concurrency 16 --duration 30 --output results.json
+
+    # Compare against an earlier run and fail on >10% regressions
+    python benchmark/bench.py --baseline results.json --max-regression 0.1
+
+Use --url to drive an already running server instead (no sweep).
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import signal
+import socket
+import subprocess
+import tempfile
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+from corpus import build_corpus
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".corpus")
+REQUEST_TIMEOUT = 60  # seconds per /detect request, warm-up included
+# Metrics where a higher value is better; for the rest lower is better
+HIGHER_IS_BETTER = {"throughput_rps"}
+COMPARED_METRICS = ("throughput_rps", "latency_p50_ms", "latency_p95_ms", "latency_p99_ms", "rss_peak_mb")
+
+
+# ========================
+# Bus/Warning API stand-ins
+# ========================
+class StandInAPI:
+    """Local HTTP server that accepts occupancy posts the way the Bus and Warning APIs do."""
+
+    def __init__(self):
+        self.posts = 0
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                stand_in.posts += 1
+                body = b'{"rejected": []}'
+                self.send_response(201)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+
+
+# ========================
+# Process helpers
+# ========================
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def process_tree_rss_mb(root_pid: int) -> float:
+    """Resident memory of a process and all its descendants (Linux /proc)."""
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            children.setdefault(ppid, []).append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    total_kb = 0
+    pending = [root_pid]
+    while pending:
+        pid = pending.pop()
+        pending.extend(children.get(pid, []))
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+    return total_kb / 1024
+
+
+class RssSampler:
+    """Samples the RSS of a process tree in the background and keeps the peak."""
+
+    def __init__(self, pid: Optional[int], interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        if self.pid:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, process_tree_rss_mb(self.pid))
+
+
+def start_server(port: int, workers: int, env: Dict[str, str], startup_timeout: float,
+                 model_server: bool = False) -> Tuple[subprocess.Popen, float]:
+    """
+    Start uvicorn for main:app (through start.sh when model_server is set) and
+    wait for /health; returns (process, startup seconds).
+    """
+    started = time.perf_counter()
+    if model_server:
+        command = ["sh", "start.sh"]
+        env = {**env, "HOST": "127.0.0.1", "PORT": str(port), "WORKERS": str(workers),
+               "MODEL_SERVER_SOCKET": os.path.join(tempfile.gettempdir(), f"sahyatri-bench-{port}.sock")}
+    else:
+        command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+                   "--workers", str(workers), "--log-level", "warning"]
+    process = subprocess.Popen(
+        command,
+        cwd=SERVICE_DIR,
+        env={**os.environ, **env},
+        start_new_session=True,
+    )
+    url = f"http://127.0.0.1:{port}/health"
+    while time.perf_counter() - started < startup_timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode} during startup")
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return process, time.perf_counter() - started
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    stop_server(process)
+    raise RuntimeError(f"Server did not become healthy within {startup_timeout}s")
+
+
+def stop_server(process: subprocess.Popen) -> None:
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+# ========================
+# Load generation
+# ========================
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def drive_load(base_url: str, corpus: List[Tuple[str, bytes]], concurrency: int, duration: float,
+               warmup: int, cameras: int) -> Dict[str, Any]:
+    """Post corpus frames to /detect from concurrent clients for duration seconds."""
+    url = f"{base_url}/detect"
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    lock = threading.Lock()
+    deadline = [0.0]
+
+    def client(worker: int) -> None:
+        session = requests.Session()
+        camera_id = f"bench-{worker % cameras}"
+        index = worker
+        try:
+            for _ in range(warmup):
+                name, data = corpus[index % len(corpus)]
+                index += 1
+                try:
+                    session.post(url, params={"camera_id": camera_id},
+                                 files={"image": (name, data, "image/jpeg")}, timeout=REQUEST_TIMEOUT)
+                except requests.RequestException:
+                    pass
+        finally:
+            # Always reach the barrier, or the run would wait for this client forever
+            barrier.wait()
+        while time.perf_counter() < deadline[0]:
+            name, data = corpus[index % len(corpus)]
+            index += concurrency
+            started = time.perf_counter()
+            try:
+                response = session.post(url, params={"camera_id": camera_id},
+                                        files={"image": (name, data, "image/jpeg")}, timeout=REQUEST_TIMEOUT)
+                outcome = "ok" if response.status_code == 200 else str(response.status_code)
+            except requests.RequestException as e:
+                outcome = type(e).__name__
+            elapsed = time.perf_counter() - started
+            with lock:
+                if outcome == "ok":
+                    latencies.append(elapsed)
+                else:
+                    errors[outcome] = errors.get(outcome, 0) + 1
+
+    barrier = threading.Barrier(concurrency + 1)
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    deadline[0] = started + duration
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "latency_p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "latency_p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "latency_p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "latency_max_ms": round(max(latencies) * 1000, 1) if latencies else 0.0,
+    }
+
+
+# ========================
+# Runs and comparison
+# ========================
+def run_point(args, corpus, stand_in: StandInAPI, workers: int, tier: str, batch: int, imgsz: int) -> Dict[str, Any]:
+    config = {"workers": workers, "tier": tier, "batch_size": batch, "imgsz": imgsz,
+              "backend": args.backend, "concurrency": args.concurrency}
+    if args.model_server:
+        config["model_server"] = True
+    env = {
+        "MODEL_BACKEND": args.backend,
+        "MODEL_TIER": tier,
+        "BATCH_MAX_SIZE": str(batch),
+        "INFER_IMGSZ": str(imgsz),
+        "FRAME_CACHE_ENABLED": "1" if args.frame_cache else "0",
+        "BUS_API_URL": f"{stand_in.url}/api/occupancy",
+        "WARNING_API_URL": f"{stand_in.url}/api/alert",
+        "DELIVERY_SPILL_PATH": os.path.join(CORPUS_DIR, "bench_outbox.jsonl"),
+    }
+    print(f"[bench] {config}", flush=True)
+    port = free_port()
+    process, startup = start_server(port, workers, env, args.startup_timeout, args.model_server)
+    try:
+        with RssSampler(process.pid) as rss:
+            result = drive_load(f"http://127.0.0.1:{port}", corpus, args.concurrency, args.duration,
+                                args.warmup, args.cameras)
+        result["rss_peak_mb"] = round(max(rss.peak, process_tree_rss_mb(process.pid)), 1)
+        result["startup_s"] = round(startup, 2)
+    finally:
+        stop_server(process)
+    print(f"[bench]   {result}", flush=True)
+    return {"config": config, "result": result}
+
+
+def point_key(point: Dict[str, Any]) -> str:
+    return json.dumps(point["config"], sort_keys=True)
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """List metrics that got worse than baseline by more than max_regression (a fraction)."""
+    previous = {point_key(point): point["result"] for point in baseline["runs"]}
+    regressions = []
+    for point in current["runs"]:
+        before = previous.get(point_key(point))
+        if not before:
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = before.get(metric), point["result"].get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            if worse > max_regression:
+                regressions.append(f"{point['config']} {metric}: {old} -> {new} ({change:+.1%})")
+    return regressions
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=SERVICE_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="benchmark an already running server instead of sweeping local ones")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1])
+    parser.add_argument("--tiers", nargs="+", default=["n"])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8])
+    parser.add_argument("--imgsz", type=int, nargs="+", default=[640])
+    parser.add_argument("--backend", default="torch")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20.0, help="measured seconds per sweep point")
+    parser.add_argument("--warmup", type=int, default=2, help="unmeasured requests per client before timing")
+    parser.add_argument("--cameras", type=int, default=8, help="distinct camera_ids the clients post as")
+    parser.add_argument("--frames", type=int, default=32, help="synthetic corpus size")
+    parser.add_argument("--resolution", default="640x480", help="synthetic frame WIDTHxHEIGHT")
+    parser.add_argument("--frame-cache", action="store_true", help="leave the frame dedup cache enabled")
+    parser.add_argument("--model-server", action="store_true",
+                        help="run the workers against one shared model server (start.sh)")
+    parser.add_argument("--startup-timeout", type=float, default=600.0)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="earlier JSON results to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.1)
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.resolution.lower().split("x"))
+    corpus = build_corpus(CORPUS_DIR, args.frames, width, height)
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "host": {"platform": platform.platform(), "cpus": os.cpu_count(), "python": platform.python_version()},
+        "corpus": {"frames": len(corpus), "resolution": args.resolution},
+        "runs": [],
+    }
+
+    if args.url:
+        result = drive_load(args.url.rstrip("/"), corpus, args.concurrency, args.duration, args.warmup, args.cameras)
+        report["runs"].append({"config": {"url": args.url, "concurrency": args.concurrency}, "result": result})
+        print(f"[bench] {result}")
+    else:
+        stand_in = StandInAPI()
+        try:
+            for workers, tier, batch, imgsz in itertools.product(args.workers, args.tiers, args.batch_sizes, args.imgsz):
+                report["runs"].append(run_point(args, corpus, stand_in, workers, tier, batch, imgsz))
+        finally:
+            report["stand_in_posts"] = stand_in.posts
+            stand_in.close()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[bench] Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        for line in regressions:
+            print(f"[bench] REGRESSION {line}")
+        if regressions:
+            return 1
+        print("[bench] No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
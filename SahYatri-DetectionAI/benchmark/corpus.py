@@ -0,0 +1,77 @@
+import os
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+
+
+def _bus_interior(rng: np.random.RandomState, width: int, height: int) -> np.ndarray:
+    """Seat rows, windows and an aisle in perspective, roughly like a ceiling camera view."""
+    frame = np.full((height, width, 3), rng.randint(70, 110, 3), dtype=np.uint8)
+    horizon = height // 3
+    # Windows along both sides
+    for side in (0, 1):
+        for i in range(6):
+            x = int(width * (0.02 + i * 0.08)) if side == 0 else int(width * (0.98 - (i + 1) * 0.08))
+            cv2.rectangle(frame, (x, horizon // 3), (x + int(width * 0.06), horizon), (200, 190, 170), -1)
+    # Aisle
+    aisle = np.array([[width * 0.45, horizon], [width * 0.55, horizon], [width * 0.7, height], [width * 0.3, height]])
+    cv2.fillPoly(frame, [aisle.astype(np.int32)], (60, 60, 70))
+    # Seat rows
+    for row in range(5):
+        y = horizon + int((height - horizon) * row / 5)
+        depth = 0.4 + 0.6 * row / 5
+        seat_w = int(width * 0.12 * depth)
+        for x in (int(width * 0.45 - 2.2 * seat_w), int(width * 0.45 - 1.1 * seat_w),
+                  int(width * 0.55 + 0.1 * seat_w), int(width * 0.55 + 1.2 * seat_w)):
+            cv2.rectangle(frame, (x, y), (x + seat_w, y + int(seat_w * 0.8)), (40, 70, 150), -1)
+    return frame
+
+
+def _draw_passenger(frame: np.ndarray, rng: np.random.RandomState) -> None:
+    """A standing or seated person-like figure: head, torso and legs."""
+    height, width = frame.shape[:2]
+    scale = rng.uniform(0.5, 1.0)
+    cx = rng.randint(int(width * 0.1), int(width * 0.9))
+    base = rng.randint(height // 2, height)
+    body_h = int(height * 0.35 * scale)
+    head_r = max(3, body_h // 8)
+    shirt = tuple(int(c) for c in rng.randint(0, 255, 3))
+    skin = tuple(int(c) for c in rng.randint(90, 220, 3))
+    top = base - body_h
+    cv2.rectangle(frame, (cx - body_h // 8, top + body_h // 2), (cx + body_h // 8, base), (40, 40, 40), -1)
+    cv2.rectangle(frame, (cx - body_h // 5, top + 2 * head_r), (cx + body_h // 5, top + body_h // 2 + head_r), shirt, -1)
+    cv2.circle(frame, (cx, top + head_r), head_r, skin, -1)
+
+
+def synthetic_frame(seed: int, width: int = 640, height: int = 480, passengers: int = None) -> np.ndarray:
+    """Deterministic synthetic bus-camera frame for a seed."""
+    rng = np.random.RandomState(seed)
+    frame = _bus_interior(rng, width, height)
+    for _ in range(rng.randint(0, 30) if passengers is None else passengers):
+        _draw_passenger(frame, rng)
+    noise = rng.normal(0, 4, frame.shape)
+    return np.clip(frame + noise, 0, 255).astype(np.uint8)
+
+
+def build_corpus(directory: str, count: int = 32, width: int = 640, height: int = 480,
+                 quality: int = 90) -> List[Tuple[str, bytes]]:
+    """
+    Return (name, jpeg bytes) for count synthetic frames, generating them into
+    directory the first time so repeated runs use identical inputs.
+    """
+    target = os.path.join(directory, f"{width}x{height}_q{quality}")
+    os.makedirs(target, exist_ok=True)
+    corpus = []
+    for seed in range(count):
+        path = os.path.join(target, f"frame_{seed:03d}.jpg")
+        if not os.path.exists(path):
+            ok, encoded = cv2.imencode(".jpg", synthetic_frame(seed, width, height),
+                                       [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if not ok:
+                raise RuntimeError(f"Failed to encode synthetic frame {seed}")
+            with open(path, "wb") as f:
+                f.write(encoded.tobytes())
+        with open(path, "rb") as f:
+            corpus.append((os.path.basename(path), f.read()))
+    return corpus
@@ -0,0 +1,392 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryError(Exception):
+    """Raised when a batch could not be delivered and should be retried."""
+
+
+class RejectedError(DeliveryError):
+    """Raised when the upstream refused a bulk post outright (a 4xx other than 408/429); retrying will not help."""
+
+
+class DeliveryClient:
+    """
+    Background delivery of occupancy readings to the Bus and Warning APIs.
+
+    Readings are queued in a bounded in-memory outbox, coalesced per camera_id
+    (a newer reading replaces one that has not been sent yet) and flushed in bulk
+    by a worker thread over a keep-alive session. Historical readings, such as
+    frames replayed by a reconnecting depot, can skip coalescing so every one of
+    them is delivered. Failed flushes are retried with exponential backoff; once
+    retries are exhausted, or the outbox overflows, the readings are appended to
+    a local spill file and replayed when the upstream recovers.
+
+    Bulk posts carry at most replay_chunk records, halved whenever the Bus API
+    answers 413. A bulk post refused with a client error is bisected down to
+    single records, and records refused on their own are moved to a
+    quarantine file instead of blocking the outbox or spill forever. Server
+    errors, 408/429 and network failures only ever mean "retry later".
+    """
+
+    def __init__(
+        self,
+        bus_api_url: str,
+        warning_api_url: str,
+        bus_api_bulk_url: Optional[str] = None,
+        spill_path: str = "outbox.jsonl",
+        max_outbox: int = 1000,
+        flush_interval: float = 2.0,
+        max_retries: int = 5,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        pool_size: int = 10,
+        timeout: float = 5.0,
+        replay_chunk: int = 100,
+        on_post: Optional[Callable[[str, float, str], None]] = None,
+    ):
+        self.bus_api_url = bus_api_url
+        self.warning_api_url = warning_api_url
+        self.bus_api_bulk_url = bus_api_bulk_url
+        self.spill_path = spill_path
+        self.max_outbox = max(1, max_outbox)
+        self.flush_interval = flush_interval
+        self.max_retries = max(1, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.replay_chunk = max(1, replay_chunk)
+        self.quarantine_path = spill_path + ".quarantine"
+        self._bulk_chunk = self.replay_chunk  # Lowered when the Bus API refuses a body as too large
+        # Called with (target, seconds, outcome) after every post attempt
+        self.on_post = on_post
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._outboxes: Dict[str, "OrderedDict[str, Dict[str, Any]]"] = {
+            "bus": OrderedDict(),
+            "warning": OrderedDict(),
+        }
+        self._history: Dict[str, List[Dict[str, Any]]] = {"bus": [], "warning": []}
+        self._lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._bulk_supported = bus_api_bulk_url is not None
+
+        self.stats = {
+            "enqueued": 0,
+            "coalesced": 0,
+            "sent": 0,
+            "rejected": 0,
+            "failed_attempts": 0,
+            "spilled": 0,
+            "replayed": 0,
+            "quarantined": 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def start(self) -> None:
+        """Start the background flush worker."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="delivery", daemon=True)
+        self._thread.start()
+        logger.info(f"Delivery client started (flush_interval={self.flush_interval}s, spill={self.spill_path})")
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Flush what is pending once more, then stop the worker."""
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        # Anything still pending after the final flush goes to disk
+        for target in self._outboxes:
+            leftover = self._drain(target)
+            if leftover:
+                self._spill(target, leftover)
+        self.session.close()
+
+    def enqueue(self, record: Dict[str, Any], warning: bool = False, coalesce: bool = True) -> None:
+        """
+        Queue a reading for the Bus API and, if warning is set, the Warning API.
+
+        With coalesce=False the reading is kept even if a newer one for the same
+        camera arrives before the next flush.
+        """
+        record = dict(record)
+        record.setdefault("timestamp", time.strftime("%Y-%m-%dT%H:%M:%S%z"))
+        put = self._put if coalesce else self._append
+        put("bus", record)
+        if warning:
+            put("warning", record)
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(len(outbox) for outbox in self._outboxes.values()) + \
+                sum(len(history) for history in self._history.values())
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "pending": self.pending(),
+            "spill_bytes": os.path.getsize(self.spill_path) if os.path.exists(self.spill_path) else 0,
+            "quarantine_bytes": (
+                os.path.getsize(self.quarantine_path) if os.path.exists(self.quarantine_path) else 0
+            ),
+            "bulk_chunk": self._bulk_chunk,
+            "bulk_supported": self._bulk_supported,
+        }
+
+    # ------------------------------------------------------------------
+    # Outbox
+    # ------------------------------------------------------------------
+    def _put(self, target: str, record: Dict[str, Any]) -> None:
+        overflow = None
+        with self._lock:
+            outbox = self._outboxes[target]
+            camera_id = record["camera_id"]
+            if camera_id in outbox:
+                self.stats["coalesced"] += 1
+                del outbox[camera_id]
+            outbox[camera_id] = record
+            self.stats["enqueued"] += 1
+            if len(outbox) > self.max_outbox:
+                _, overflow = outbox.popitem(last=False)
+        if overflow is not None:
+            self._spill(target, [overflow])
+
+    def _append(self, target: str, record: Dict[str, Any]) -> None:
+        overflow = None
+        with self._lock:
+            history = self._history[target]
+            history.append(record)
+            self.stats["enqueued"] += 1
+            if len(history) > self.max_outbox:
+                overflow = history[:len(history) - self.max_outbox]
+                del history[:len(overflow)]
+        if overflow:
+            self._spill(target, overflow)
+
+    def _drain(self, target: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            outbox = self._outboxes[target]
+            records = self._history[target] + list(outbox.values())
+            self._history[target] = []
+            outbox.clear()
+        return records
+
+    # ------------------------------------------------------------------
+    # Spill file
+    # ------------------------------------------------------------------
+    def _spill(self, target: str, records: List[Dict[str, Any]], respill: bool = False,
+               path: Optional[str] = None) -> None:
+        path = path or self.spill_path
+        try:
+            with self._spill_lock, open(path, "a") as f:
+                for record in records:
+                    f.write(json.dumps({"target": target, "record": record}) + "\n")
+            if not respill:
+                self.stats["spilled"] += len(records)
+                logger.warning(f"Spilled {len(records)} {target} record(s) to {path}")
+        except OSError as e:
+            logger.error(f"Failed to spill {len(records)} {target} record(s): {str(e)}")
+
+    def _quarantine(self, target: str, records: List[Dict[str, Any]]) -> None:
+        """Set aside records the upstream refuses every time, for manual inspection."""
+        self.stats["quarantined"] += len(records)
+        logger.error(f"Quarantining {len(records)} {target} record(s) in {self.quarantine_path}: {records[0]}")
+        self._spill(target, records, respill=True, path=self.quarantine_path)
+
+    def _isolate(self, target: str, records: List[Dict[str, Any]]) -> None:
+        """
+        Send records a bulk post refused as a whole in halves, down to single records.
+
+        A single record refused by the upstream is quarantined. Raises
+        DeliveryError on a transient failure; records then holds the unsent ones.
+        """
+        while records:
+            part = records[:max(1, len(records) // 2)]
+            size = len(part)
+            try:
+                try:
+                    self._send(target, part)
+                except RejectedError:
+                    self._isolate(target, part)
+            except DeliveryError:
+                # part holds the unsent tail of this half
+                del records[:size - len(part)]
+                raise
+            del records[:size]
+
+    def _replay_spill(self) -> None:
+        """Send spilled records in chunks; on a transient failure keep the rest on disk and stop."""
+        with self._spill_lock:
+            if not os.path.exists(self.spill_path) or os.path.getsize(self.spill_path) == 0:
+                return
+            replay_path = self.spill_path + ".replay"
+            os.replace(self.spill_path, replay_path)
+
+        entries: Dict[str, List[Dict[str, Any]]] = {"bus": [], "warning": []}
+        with open(replay_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    entries[entry["target"]].append(entry["record"])
+                except (ValueError, KeyError):
+                    logger.error(f"Skipping corrupt spill entry: {line.strip()[:100]}")
+
+        for target, records in entries.items():
+            for start in range(0, len(records), self.replay_chunk):
+                end = start + self.replay_chunk
+                chunk = records[start:end]
+                count = len(chunk)
+                try:
+                    try:
+                        self._send(target, chunk)
+                    except RejectedError as e:
+                        logger.warning(f"Replay of {count} {target} record(s) refused, isolating bad records: {str(e)}")
+                        # chunk now holds only its unsent tail
+                        self._isolate(target, chunk)
+                    self.stats["replayed"] += count
+                except DeliveryError as e:
+                    logger.error(f"Replay of {target} records failed, keeping them spilled: {str(e)}")
+                    self._spill(target, chunk + records[end:], respill=True)
+                    break
+        os.remove(replay_path)
+
+    # ------------------------------------------------------------------
+    # Sending
+    # ------------------------------------------------------------------
+    def _post(self, target: str, url: str, payload: Any) -> requests.Response:
+        started = time.perf_counter()
+        try:
+            response = self.session.post(url, json=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            self._observe(target, started, "error")
+            raise DeliveryError(str(e))
+        self._observe(target, started, str(response.status_code))
+        if response.status_code >= 500 or response.status_code in (408, 429):
+            raise DeliveryError(f"HTTP {response.status_code} from {url}")
+        return response
+
+    def _observe(self, target: str, started: float, outcome: str) -> None:
+        if self.on_post:
+            self.on_post(target, time.perf_counter() - started, outcome)
+
+    def _send_bulk(self, records: List[Dict[str, Any]]) -> bool:
+        """
+        Post records to the bulk endpoint in chunks, removing each chunk once it is answered.
+
+        Returns False if the Bus API has no bulk endpoint and raises RejectedError
+        if a chunk is refused outright; records then holds the unsent ones.
+        """
+        while records:
+            chunk = records[:self._bulk_chunk]
+            response = self._post("bus_bulk", self.bus_api_bulk_url, {"records": chunk})
+            if response.status_code == 404:
+                logger.warning("Bus API has no bulk endpoint, falling back to per-record posts")
+                self._bulk_supported = False
+                return False
+            if response.status_code == 413 and len(chunk) > 1:
+                self._bulk_chunk = max(1, len(chunk) // 2)
+                logger.warning(f"Bulk body of {len(chunk)} records too large, sending {self._bulk_chunk} at a time")
+                continue
+            if response.status_code >= 400:
+                raise RejectedError(f"HTTP {response.status_code} from bulk endpoint: {response.text[:200]}")
+            try:
+                body = response.json()
+            except ValueError:
+                body = {}
+            rejected = len(body.get("rejected", [])) if isinstance(body, dict) else 0
+            self.stats["rejected"] += rejected
+            self.stats["sent"] += len(chunk) - rejected
+            del records[:len(chunk)]
+        return True
+
+    def _send(self, target: str, records: List[Dict[str, Any]]) -> None:
+        if target == "bus" and self._bulk_supported and len(records) > 1:
+            if self._send_bulk(records):
+                return
+
+        url = self.bus_api_url if target == "bus" else self.warning_api_url
+        for index, record in enumerate(records):
+            try:
+                response = self._post(target, url, record)
+            except DeliveryError:
+                # Keep only the unsent tail for the retry
+                del records[:index]
+                raise
+            if response.status_code >= 400:
+                # Client errors will not succeed on retry; set the record aside
+                self.stats["rejected"] += 1
+                logger.error(f"{url} rejected record: HTTP {response.status_code} {response.text[:200]}")
+                self._quarantine(target, [record])
+            else:
+                self.stats["sent"] += 1
+
+    def _send_with_retry(self, target: str, records: List[Dict[str, Any]]) -> bool:
+        for attempt in range(self.max_retries):
+            try:
+                try:
+                    self._send(target, records)
+                except RejectedError as e:
+                    logger.warning(f"Bulk delivery of {len(records)} {target} record(s) refused, isolating bad records: {str(e)}")
+                    self._isolate(target, records)
+                return True
+            except DeliveryError as e:
+                self.stats["failed_attempts"] += 1
+                delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+                delay *= random.uniform(0.5, 1.0)
+                logger.warning(
+                    f"Delivery of {len(records)} {target} record(s) failed "
+                    f"(attempt {attempt + 1}/{self.max_retries}): {str(e)}"
+                )
+                if attempt + 1 < self.max_retries and self._stopping.wait(delay):
+                    break
+        self._spill(target, records)
+        return False
+
+    def _flush(self) -> Optional[bool]:
+        """Flush all outboxes; None if there was nothing to send."""
+        result = None
+        for target in self._outboxes:
+            records = self._drain(target)
+            if records:
+                delivered = self._send_with_retry(target, records)
+                result = delivered if result is None else result and delivered
+        return result
+
+    def _run(self) -> None:
+        last_replay = 0.0
+        # Readings arriving between flushes coalesce per camera
+        while not self._stopping.wait(self.flush_interval):
+            try:
+                delivered = self._flush()
+                # Replay right after a successful flush; when idle, probe at most every backoff_max
+                if delivered or (delivered is None and time.monotonic() - last_replay >= self.backoff_max):
+                    last_replay = time.monotonic()
+                    self._replay_spill()
+            except Exception as e:
+                logger.error(f"Delivery worker error: {str(e)}")
+        try:
+            self._flush()
+        except Exception as e:
+            logger.error(f"Final delivery flush failed: {str(e)}")
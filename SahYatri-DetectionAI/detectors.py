@@ -0,0 +1,365 @@
+import glob
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# COCO class index for "person"
+PERSON_CLASS = 0
+MODEL_TIERS = ("n", "s", "m", "l", "x")
+BACKENDS = ("torch", "onnx", "openvino")
+
+
+def weights_name(tier: str) -> str:
+    """Ultralytics weights file for a YOLOv5u size tier."""
+    if tier not in MODEL_TIERS:
+        raise ValueError(f"Unknown model tier '{tier}', expected one of {', '.join(MODEL_TIERS)}")
+    return f"yolov5{tier}u.pt"
+
+
+def to_rgb_array(image: Any) -> np.ndarray:
+    """Convert a PIL image or BGR numpy array into a contiguous RGB uint8 array."""
+    if isinstance(image, Image.Image):
+        return np.asarray(image.convert("RGB"))
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def letterbox(image: np.ndarray, shape: Tuple[int, int]) -> np.ndarray:
+    """Resize keeping aspect ratio and pad to (height, width) with YOLO gray padding."""
+    height, width = image.shape[:2]
+    scale = min(shape[0] / height, shape[1] / width)
+    new_w, new_h = int(round(width * scale)), int(round(height * scale))
+    if (new_w, new_h) != (width, height):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top = (shape[0] - new_h) // 2
+    left = (shape[1] - new_w) // 2
+    return cv2.copyMakeBorder(
+        image, top, shape[0] - new_h - top, left, shape[1] - new_w - left,
+        cv2.BORDER_CONSTANT, value=(114, 114, 114)
+    )
+
+
+def input_shape(frames: List[np.ndarray], size: int, rect: bool, stride: int = 32) -> Tuple[int, int]:
+    """
+    Network input (height, width) for a batch.
+
+    With rect, the long side is scaled to size and the short side is only padded
+    up to the next stride multiple, so a 640x480 camera frame runs at 640x480
+    instead of 640x640.
+    """
+    if not rect:
+        return size, size
+    aspect_h = max(frame.shape[0] / max(frame.shape[:2]) for frame in frames)
+    aspect_w = max(frame.shape[1] / max(frame.shape[:2]) for frame in frames)
+    return (
+        int(np.ceil(size * aspect_h / stride) * stride),
+        int(np.ceil(size * aspect_w / stride) * stride),
+    )
+
+
+def preprocess(images: List[Any], size: int, rect: bool = False) -> np.ndarray:
+    """Build an NCHW float32 batch in [0, 1] from a list of images."""
+    frames = [to_rgb_array(image) for image in images]
+    shape = input_shape(frames, size, rect)
+    batch = np.stack([letterbox(frame, shape) for frame in frames])
+    return np.ascontiguousarray(batch.transpose(0, 3, 1, 2), dtype=np.float32) / 255.0
+
+
+def count_from_raw(output: np.ndarray, conf: float, iou: float, max_det: int = 300) -> List[int]:
+    """
+    Count people in raw YOLOv5u/v8 head output of shape (batch, 4 + classes, anchors).
+
+    Only anchors whose person score clears conf are considered, and of those only
+    the ones whose best class is person (Ultralytics' class assignment) go into NMS,
+    so the other 79 classes never reach the NMS step.
+    """
+    counts = []
+    for prediction in output:
+        candidates = np.flatnonzero(prediction[4 + PERSON_CLASS] > conf)
+        if candidates.size == 0:
+            counts.append(0)
+            continue
+        scores = prediction[4:, candidates]
+        candidates = candidates[scores.argmax(axis=0) == PERSON_CLASS]
+        if candidates.size == 0:
+            counts.append(0)
+            continue
+        xywh = prediction[:4, candidates]
+        boxes = np.stack((xywh[0] - xywh[2] / 2, xywh[1] - xywh[3] / 2, xywh[2], xywh[3]), axis=1)
+        person_scores = prediction[4 + PERSON_CLASS, candidates]
+        indices = cv2.dnn.NMSBoxes(boxes.tolist(), person_scores.tolist(), conf, iou, top_k=max_det)
+        counts.append(len(indices))
+    return counts
+
+
+class Detector:
+    """Base class for person-count backends."""
+
+    name = "base"
+
+    def __init__(
+        self,
+        tier: str = "x",
+        imgsz: int = 640,
+        conf: float = 0.25,
+        iou: float = 0.7,
+        max_det: int = 300,
+    ):
+        self.tier = tier
+        self.imgsz = imgsz
+        self.conf = conf
+        self.iou = iou
+        self.max_det = max_det
+        # Seconds spent per stage (preprocess, inference, postprocess) by the last count_batch call
+        self.last_timings: Dict[str, float] = {}
+
+    def count_batch(self, images: List[Any]) -> List[int]:
+        """Return the number of people in each image."""
+        raise NotImplementedError
+
+    def describe(self) -> Dict[str, Any]:
+        return {"backend": self.name, "tier": self.tier, "imgsz": self.imgsz, "conf": self.conf, "iou": self.iou}
+
+
+class TorchDetector(Detector):
+    """Eager PyTorch inference through Ultralytics."""
+
+    name = "torch"
+
+    def __init__(self, tier: str = "x", **kwargs):
+        super().__init__(tier, **kwargs)
+        from ultralytics import YOLO
+
+        self.model = YOLO(weights_name(tier))
+
+    def count_batch(self, images: List[Any]) -> List[int]:
+        results = self.model(
+            images,
+            imgsz=self.imgsz,
+            conf=self.conf,
+            iou=self.iou,
+            max_det=self.max_det,
+            classes=[PERSON_CLASS],
+            verbose=False,
+        )
+        started = time.perf_counter()
+        counts = [int((result.boxes.cls == PERSON_CLASS).sum()) for result in results]
+        # Ultralytics reports per-image milliseconds for each stage of the batch
+        self.last_timings = {
+            stage: sum(result.speed[stage] for result in results) / 1000
+            for stage in ("preprocess", "inference", "postprocess")
+        }
+        self.last_timings["postprocess"] += time.perf_counter() - started
+        return counts
+
+
+def export_model(tier: str, backend: str, imgsz: int, int8: bool = False) -> str:
+    """
+    Export Ultralytics weights for a CPU runtime, reusing a previous export.
+
+    ONNX INT8 uses dynamic weight quantization from onnxruntime; OpenVINO INT8
+    uses Ultralytics' NNCF post-training quantization. Exports are named after
+    everything they were built with (tier, imgsz, dynamic shapes, int8), so
+    changing INFER_IMGSZ exports again instead of reusing a model built for
+    another input shape.
+    """
+    stem = os.path.splitext(weights_name(tier))[0]
+    if backend == "onnx":
+        path = f"{stem}_{imgsz}_dynamic.onnx"
+        if not os.path.exists(path):
+            from ultralytics import YOLO
+
+            logger.info(f"Exporting {stem} to ONNX at {imgsz}px")
+            exported = YOLO(weights_name(tier)).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+            os.replace(exported, path)
+        if int8:
+            quantized = f"{stem}_{imgsz}_dynamic_int8.onnx"
+            if not os.path.exists(quantized):
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+
+                logger.info(f"Quantizing {path} to INT8")
+                quantize_dynamic(path, quantized, weight_type=QuantType.QUInt8)
+            path = quantized
+        return path
+
+    if backend == "openvino":
+        # Static input shape, so imgsz must match the detector's
+        path = f"{stem}_{imgsz}{'_int8' if int8 else ''}_openvino_model"
+        if not os.path.isdir(path):
+            from ultralytics import YOLO
+
+            logger.info(f"Exporting {stem} to OpenVINO{' INT8' if int8 else ''} at {imgsz}px")
+            exported = YOLO(weights_name(tier)).export(format="openvino", imgsz=imgsz, int8=int8, half=False)
+            os.replace(exported, path)
+        return path
+
+    raise ValueError(f"No export for backend '{backend}'")
+
+
+class OnnxDetector(Detector):
+    """ONNX Runtime on CPU, optionally with INT8 weights."""
+
+    name = "onnx"
+
+    def __init__(self, tier: str = "x", int8: bool = False, threads: int = 0, **kwargs):
+        super().__init__(tier, **kwargs)
+        import onnxruntime as ort
+
+        self.int8 = int8
+        self.path = export_model(tier, "onnx", self.imgsz, int8)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(self.path, options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # A fixed batch dimension means the export was static; feed images one by one
+        self.dynamic_batch = not isinstance(model_input.shape[0], int)
+
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: batch})[0]
+
+    def count_batch(self, images: List[Any]) -> List[int]:
+        started = time.perf_counter()
+        # Dynamic exports also take any stride-aligned height/width, so skip square padding
+        batch = preprocess(images, self.imgsz, rect=self.dynamic_batch)
+        preprocessed = time.perf_counter()
+        if self.dynamic_batch:
+            output = self._run(batch)
+        else:
+            output = np.concatenate([self._run(batch[i:i + 1]) for i in range(len(batch))])
+        inferred = time.perf_counter()
+        counts = count_from_raw(output, self.conf, self.iou, self.max_det)
+        self.last_timings = {
+            "preprocess": preprocessed - started,
+            "inference": inferred - preprocessed,
+            "postprocess": time.perf_counter() - inferred,
+        }
+        return counts
+
+    def describe(self) -> Dict[str, Any]:
+        return {**super().describe(), "int8": self.int8, "path": self.path}
+
+
+class OpenVinoDetector(Detector):
+    """OpenVINO Runtime on CPU, optionally with INT8 weights."""
+
+    name = "openvino"
+
+    def __init__(self, tier: str = "x", int8: bool = False, **kwargs):
+        super().__init__(tier, **kwargs)
+        from openvino.runtime import Core
+
+        self.int8 = int8
+        self.path = export_model(tier, "openvino", self.imgsz, int8)
+        xml = glob.glob(os.path.join(self.path, "*.xml"))[0]
+        core = Core()
+        self.compiled = core.compile_model(core.read_model(xml), "CPU", {"PERFORMANCE_HINT": "THROUGHPUT"})
+        self.output = self.compiled.output(0)
+
+    def count_batch(self, images: List[Any]) -> List[int]:
+        started = time.perf_counter()
+        batch = preprocess(images, self.imgsz)
+        preprocessed = time.perf_counter()
+        # Ultralytics exports OpenVINO with a static batch of 1
+        output = np.concatenate([self.compiled([batch[i:i + 1]])[self.output] for i in range(len(batch))])
+        inferred = time.perf_counter()
+        counts = count_from_raw(output, self.conf, self.iou, self.max_det)
+        self.last_timings = {
+            "preprocess": preprocessed - started,
+            "inference": inferred - preprocessed,
+            "postprocess": time.perf_counter() - inferred,
+        }
+        return counts
+
+    def describe(self) -> Dict[str, Any]:
+        return {**super().describe(), "int8": self.int8, "path": self.path}
+
+
+def load_detector(backend: str = "torch", tier: str = "x", int8: bool = False, **kwargs) -> Detector:
+    """Create the detector for a backend name and model tier."""
+    if backend == "torch":
+        if int8:
+            logger.warning("INT8 is only supported by the onnx and openvino backends, ignoring")
+        return TorchDetector(tier, **kwargs)
+    if backend == "onnx":
+        return OnnxDetector(tier, int8=int8, **kwargs)
+    if backend == "openvino":
+        return OpenVinoDetector(tier, int8=int8, **kwargs)
+    raise ValueError(f"Unknown backend '{backend}', expected one of {', '.join(BACKENDS)}")
+
+
+def load_checked_detector(backend: str, tier: str, check_dir: Optional[str] = None, check_tolerance: int = 0,
+                          check_strict: bool = False, **kwargs) -> Tuple[Detector, float]:
+    """
+    Load the detector and run the backend agreement check, as every serving process does at startup.
+
+    Returns the detector and its load time in seconds (export included).
+    """
+    started = time.perf_counter()
+    detector = load_detector(backend, tier, **kwargs)
+    load_seconds = time.perf_counter() - started
+    logger.info(f"YOLOv5{tier}u model loaded in {load_seconds:.2f}s ({detector.describe()})")
+    check_agreement(detector, check_dir, check_tolerance, check_strict)
+    return detector, load_seconds
+
+
+def load_reference_images(directory: str) -> List[Tuple[str, Image.Image]]:
+    """Load the reference image set used by the backend agreement check."""
+    paths = sorted(
+        path for path in glob.glob(os.path.join(directory, "*"))
+        if path.lower().endswith((".jpg", ".jpeg", ".png"))
+    )
+    return [(os.path.basename(path), Image.open(path).convert("RGB")) for path in paths]
+
+
+def verify_backends(
+    detector: Detector,
+    reference: Detector,
+    images: List[Tuple[str, Image.Image]],
+    tolerance: int = 0,
+) -> List[Dict[str, Any]]:
+    """
+    Compare person counts of detector against reference on the same images.
+
+    Returns one entry per image whose counts differ by more than tolerance.
+    """
+    if not images:
+        return []
+    names = [name for name, _ in images]
+    frames = [image for _, image in images]
+    counts = detector.count_batch(frames)
+    expected = reference.count_batch(frames)
+    return [
+        {"image": name, detector.name: got, reference.name: want}
+        for name, got, want in zip(names, counts, expected)
+        if abs(got - want) > tolerance
+    ]
+
+
+def check_agreement(detector: Detector, directory: Optional[str], tolerance: int = 0, strict: bool = False) -> None:
+    """Startup check that a non-torch backend agrees with eager PyTorch on a reference set."""
+    if not directory or detector.name == "torch":
+        return
+    images = load_reference_images(directory)
+    if not images:
+        logger.warning(f"No reference images found in {directory}, skipping backend check")
+        return
+    reference = TorchDetector(
+        detector.tier, imgsz=detector.imgsz, conf=detector.conf, iou=detector.iou, max_det=detector.max_det
+    )
+    mismatches = verify_backends(detector, reference, images, tolerance)
+    if not mismatches:
+        logger.info(f"Backend check passed: {detector.name} matches torch on {len(images)} reference image(s)")
+        return
+    message = f"Backend check: {len(mismatches)}/{len(images)} image(s) disagree: {mismatches}"
+    if strict:
+        raise RuntimeError(message)
+    logger.warning(message)
@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+THUMBNAIL_SIZE = (32, 24)
+
+
+def frame_signature(frame: np.ndarray) -> np.ndarray:
+    """Tiny grayscale thumbnail used to compare consecutive frames of a camera."""
+    small = cv2.resize(frame, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    # Blur away sensor noise so it does not register as scene change
+    return cv2.GaussianBlur(small, (3, 3), 0).astype(np.int16)
+
+
+def frame_difference(a: np.ndarray, b: np.ndarray) -> float:
+    """Mean absolute pixel difference (0-255) between two signatures."""
+    return float(np.abs(a - b).mean())
+
+
+class FrameCache:
+    """
+    Per-camera cache of the last inferred occupancy.
+
+    Each entry keeps the signature of the frame that was actually run through the
+    model. A new frame whose signature differs by at most threshold reuses that
+    count. Entries expire after ttl seconds, so a parked bus still gets a fresh
+    inference now and then, and the least recently used camera is evicted once
+    max_entries is reached.
+    """
+
+    def __init__(self, threshold: float = 3.0, ttl: float = 60.0, max_entries: int = 1024):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[str, Tuple[np.ndarray, int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def lookup(self, camera_id: str, frame: np.ndarray) -> Tuple[Optional[int], np.ndarray]:
+        """Return (cached occupancy or None, signature of frame)."""
+        signature = frame_signature(frame)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(camera_id)
+            if entry is not None:
+                cached_signature, occupancy, stored_at = entry
+                if now - stored_at > self.ttl:
+                    self.expired += 1
+                    del self._entries[camera_id]
+                elif cached_signature.shape == signature.shape and \
+                        frame_difference(cached_signature, signature) <= self.threshold:
+                    self.hits += 1
+                    self._entries.move_to_end(camera_id)
+                    return occupancy, signature
+            self.misses += 1
+        return None, signature
+
+    def store(self, camera_id: str, signature: np.ndarray, occupancy: int) -> None:
+        """Remember the occupancy inferred for a camera's frame."""
+        with self._lock:
+            self._entries[camera_id] = (signature, occupancy, time.monotonic())
+            self._entries.move_to_end(camera_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "threshold": self.threshold,
+            "ttl_seconds": self.ttl,
+        }
@@ -0,0 +1,131 @@
+import io
+import logging
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+from fastapi import HTTPException, UploadFile
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 64 * 1024
+# Allowance for multipart boundaries and part headers on top of the image itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+try:
+    from turbojpeg import TurboJPEG
+
+    _turbojpeg: Optional["TurboJPEG"] = TurboJPEG()
+except Exception:  # PyTurboJPEG or libturbojpeg not installed
+    _turbojpeg = None
+
+_REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def _too_large(limit: int, what: str = "Image size") -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"{what} exceeds {limit/1024/1024}MB limit"
+    )
+
+
+class BodySizeLimitMiddleware:
+    """
+    ASGI middleware that rejects oversized request bodies while they stream in.
+
+    A declared Content-Length above the limit is refused before any of the body
+    is read; otherwise the received bytes are counted and the request is aborted
+    with 413 as soon as they pass the limit, so an oversized upload is never
+    spooled in full.
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = dict(limits)
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope.get("headers", []):
+            if name == b"content-length" and value.isdigit() and int(value) > limit:
+                error = _too_large(limit - MULTIPART_OVERHEAD, "Upload")
+                await send({
+                    "type": "http.response.start",
+                    "status": error.status_code,
+                    "headers": [(b"content-type", b"application/json"), (b"connection", b"close")],
+                })
+                await send({"type": "http.response.body", "body": b'{"detail":"%s"}' % error.detail.encode()})
+                return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise _too_large(limit - MULTIPART_OVERHEAD, "Upload")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def read_upload(upload: UploadFile, limit: int) -> bytes:
+    """Read an uploaded file in chunks, stopping as soon as it exceeds limit."""
+    if upload.size is not None and upload.size > limit:
+        raise _too_large(limit)
+    buffer = bytearray()
+    while True:
+        chunk = await upload.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer += chunk
+        if len(buffer) > limit:
+            raise _too_large(limit)
+    return bytes(buffer)
+
+
+def _image_size(data: bytes) -> Tuple[int, int]:
+    """Read (width, height) from the image header without decoding pixels."""
+    with Image.open(io.BytesIO(data)) as image:
+        return image.size
+
+
+def draft_scale(width: int, height: int, target: int) -> int:
+    """Largest JPEG DCT scale (1, 2, 4 or 8) that keeps the long side at or above target."""
+    scale = 1
+    while scale < 8 and max(width, height) // (scale * 2) >= target:
+        scale *= 2
+    return scale
+
+
+def decode_image(data: bytes, target: int) -> np.ndarray:
+    """
+    Decode an encoded image straight into a BGR numpy array.
+
+    JPEGs much larger than the inference size are decoded in draft mode, where
+    libjpeg scales by 1/2, 1/4 or 1/8 during the IDCT instead of producing a full
+    resolution bitmap that would be resized again. libjpeg-turbo is used when
+    PyTurboJPEG is installed; OpenCV's decoder is the fallback.
+    """
+    is_jpeg = data[:2] == b"\xff\xd8"
+    if is_jpeg and _turbojpeg is not None:
+        width, height, _, _ = _turbojpeg.decode_header(data)
+        scale = draft_scale(width, height, target)
+        return _turbojpeg.decode(data, scaling_factor=(1, scale))
+
+    scale = draft_scale(*_image_size(data), target) if is_jpeg else 1
+    frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), _REDUCED_FLAGS[scale])
+    if frame is None:
+        raise ValueError("Unsupported or corrupt image data")
+    return frame
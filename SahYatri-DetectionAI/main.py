@@ -1,14 +1,37 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Query
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Query, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from ultralytics import YOLO
-import requests
-import io
-from PIL import Image
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+import numpy as np
+import asyncio
+from functools import partial
+from typing import List, Optional
+import json
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
 import os
 import sys
+import time
+
+# Taken before the heavy imports below, for the reported startup time
+PROCESS_STARTED = time.perf_counter()
+
+from batching import InferenceBatcher, QueueFullError
+from delivery import DeliveryClient
+from detectors import load_checked_detector
+from frame_cache import FrameCache
+from metrics import (
+    CONTENT_TYPE_LATEST, IN_FLIGHT, MODEL_LOAD_SECONDS, QUEUE_DEPTH, REQUESTS, STARTUP_SECONDS,
+    StageTimer, observe_batch, observe_post, render
+)
+from imaging import MULTIPART_OVERHEAD, BodySizeLimitMiddleware, decode_image, read_upload
+from model_server import WARMUP_SHAPE, RemoteDetector
+from streaming import MjpegPuller, StreamStats, parse_pull_sources, serve_camera_socket
+from tracking import OccupancyTracker, SharedOccupancyTracker
+from registry import CameraConfig, CameraRegistry, parse_quiet_hours
+from alerts import AlertEngine, SharedAlertEngine
+from timeseries import ROLLUP_SECONDS, SharedTimeSeriesStore, TimeSeriesStore, parse_timestamp
 
 # Configure logging
 logging.basicConfig(
@@ -18,13 +41,54 @@ logging.basicConfig(
         logging.StreamHandler(sys.stdout)
     ]
 )
-logger = logging.getLogger(_name_)
+logger = logging.getLogger(__name__)
 
 # Constants
-MAX_CAPACITY = 40
+DEFAULT_CAPACITY = int(os.getenv("DEFAULT_CAPACITY", "40"))
 MAX_IMAGE_SIZE = 5 * 1024 * 1024  # 5MB
-BUS_API_URL = "https://bus-api-ihcu.onrender.com/api/occupancy"
-WARNING_API_URL = "https://warning-api.onrender.com/api/alert"
+BUS_API_URL = os.getenv("BUS_API_URL", "https://bus-api-ihcu.onrender.com/api/occupancy")
+WARNING_API_URL = os.getenv("WARNING_API_URL", "https://warning-api.onrender.com/api/alert")
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "10"))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "64"))
+RETRY_AFTER_SECONDS = 1
+DETECT_BATCH_MAX_FRAMES = int(os.getenv("DETECT_BATCH_MAX_FRAMES", "256"))
+DETECT_BATCH_MAX_BYTES = int(os.getenv("DETECT_BATCH_MAX_BYTES", str(64 * 1024 * 1024)))
+BUS_API_BULK_URL = os.getenv("BUS_API_BULK_URL", f"{BUS_API_URL}/bulk")
+DELIVERY_FLUSH_INTERVAL = float(os.getenv("DELIVERY_FLUSH_INTERVAL", "2"))
+DELIVERY_SPILL_PATH = os.getenv("DELIVERY_SPILL_PATH", "outbox.jsonl")
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "torch")  # torch, onnx or openvino
+MODEL_TIER = os.getenv("MODEL_TIER", "x")  # n, s, m, l or x
+MODEL_INT8 = os.getenv("MODEL_INT8", "0") == "1"
+INFER_IMGSZ = int(os.getenv("INFER_IMGSZ", "640"))
+INFER_CONF = float(os.getenv("INFER_CONF", "0.25"))
+INFER_IOU = float(os.getenv("INFER_IOU", "0.7"))
+FRAME_CACHE_ENABLED = os.getenv("FRAME_CACHE_ENABLED", "1") == "1"
+FRAME_CACHE_THRESHOLD = float(os.getenv("FRAME_CACHE_THRESHOLD", "3.0"))
+FRAME_CACHE_TTL = float(os.getenv("FRAME_CACHE_TTL", "60"))
+FRAME_CACHE_MAX_CAMERAS = int(os.getenv("FRAME_CACHE_MAX_CAMERAS", "1024"))
+TIMING_HEADERS = os.getenv("TIMING_HEADERS", "0") == "1"
+STREAM_SAMPLE_FPS = float(os.getenv("STREAM_SAMPLE_FPS", "2"))
+STREAM_PULL_SOURCES = parse_pull_sources(os.getenv("STREAM_PULL_SOURCES", ""))
+BACKEND_CHECK_DIR = os.getenv("BACKEND_CHECK_DIR")
+BACKEND_CHECK_TOLERANCE = int(os.getenv("BACKEND_CHECK_TOLERANCE", "0"))
+BACKEND_CHECK_STRICT = os.getenv("BACKEND_CHECK_STRICT", "0") == "1"
+MODEL_SERVER_SOCKET = os.getenv("MODEL_SERVER_SOCKET")  # use the shared model server instead of loading here
+WARMUP_ROUNDS = int(os.getenv("WARMUP_ROUNDS", "2"))
+SMOOTHING_METHOD = os.getenv("SMOOTHING_METHOD", "median")  # median, ema or none
+SMOOTHING_WINDOW = int(os.getenv("SMOOTHING_WINDOW", "5"))
+SMOOTHING_ALPHA = float(os.getenv("SMOOTHING_ALPHA", "0.3"))
+PUBLISH_MIN_CHANGE = int(os.getenv("PUBLISH_MIN_CHANGE", "1"))
+PUBLISH_HEARTBEAT = float(os.getenv("PUBLISH_HEARTBEAT", "60"))
+ALERT_HYSTERESIS = int(os.getenv("ALERT_HYSTERESIS", "3"))
+ALERT_NEAR_FULL_RATIO = float(os.getenv("ALERT_NEAR_FULL_RATIO", "0"))  # 0 = warn only when over capacity
+ALERT_COOLDOWN = float(os.getenv("ALERT_COOLDOWN", "300"))
+ALERT_QUIET_HOURS = parse_quiet_hours(filter(None, os.getenv("ALERT_QUIET_HOURS", "").split(",")))
+CAMERA_CONFIG_PATH = os.getenv("CAMERA_CONFIG_PATH", "cameras.json")
+CAMERA_CONFIG_RELOAD_INTERVAL = float(os.getenv("CAMERA_CONFIG_RELOAD_INTERVAL", "5"))
+HISTORY_RAW_SIZE = int(os.getenv("HISTORY_RAW_SIZE", "720"))  # raw readings kept per camera
+HISTORY_MAX_CAMERAS = int(os.getenv("HISTORY_MAX_CAMERAS", "1024"))
+STATE_DB_PATH = os.getenv("STATE_DB_PATH")  # SQLite file shared by all workers; per-process memory when unset
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -42,103 +106,384 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize YOLO model
-try:
-    model = YOLO('yolov5xu.pt')
-    logger.info("YOLOv5xu model loaded successfully")
-except Exception as e:
-    logger.error(f"Failed to load YOLOv5x model: {str(e)}")
-    raise
-
-def validate_image_size(image_data: bytes) -> None:
-    """Validate image size before processing."""
-    if len(image_data) > MAX_IMAGE_SIZE:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Image size exceeds {MAX_IMAGE_SIZE/1024/1024}MB limit"
+# Refuse oversized uploads while they stream in, before they are spooled
+app.add_middleware(BodySizeLimitMiddleware, limits={
+    "/detect": MAX_IMAGE_SIZE + MULTIPART_OVERHEAD,
+    "/detect/batch": DETECT_BATCH_MAX_BYTES + MULTIPART_OVERHEAD,
+})
+
+# Initialize YOLO detector, or a proxy to the model server shared by all workers
+if MODEL_SERVER_SOCKET:
+    detector = RemoteDetector(MODEL_SERVER_SOCKET)
+    logger.info(f"Using shared model server at {MODEL_SERVER_SOCKET}")
+else:
+    try:
+        detector, load_seconds = load_checked_detector(
+            MODEL_BACKEND, MODEL_TIER, BACKEND_CHECK_DIR, BACKEND_CHECK_TOLERANCE, BACKEND_CHECK_STRICT,
+            int8=MODEL_INT8, imgsz=INFER_IMGSZ, conf=INFER_CONF, iou=INFER_IOU
         )
+        MODEL_LOAD_SECONDS.set(load_seconds)
+    except Exception as e:
+        logger.error(f"Failed to load YOLOv5{MODEL_TIER}u model: {str(e)}")
+        raise
 
-def process_image(image_data: bytes) -> Image.Image:
-    """Process image data and return PIL Image object."""
+# Filled in once warm-up inference has run; /health reports 503 until then
+startup = {"ready": False, "error": None, "warmup_seconds": None, "startup_seconds": None}
+
+def process_image(image_data: bytes) -> np.ndarray:
+    """Decode image data into a BGR array sized for inference."""
     try:
-        return Image.open(io.BytesIO(image_data))
+        return decode_image(image_data, INFER_IMGSZ)
     except Exception as e:
         logger.error(f"Failed to process image: {str(e)}")
         raise HTTPException(status_code=400, detail="Invalid image format")
 
-def count_people(image: Image.Image) -> int:
-    """Run YOLO inference and count people."""
+def count_people_batch(images: List[np.ndarray]) -> List[int]:
+    """Run YOLO inference on a batch of images and count people in each."""
     try:
-        results = model(image)
-        return sum(1 for box in results[0].boxes if box.cls == 0)
+        return detector.count_batch(images)
     except Exception as e:
         logger.error(f"YOLO inference failed: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to process image with YOLO")
 
-def send_to_apis(camera_id: str, occupancy: int) -> None:
-    """Send occupancy data to remote APIs."""
+def count_people(image: np.ndarray) -> int:
+    """Run YOLO inference and count people."""
+    return count_people_batch([image])[0]
+
+def record_batch(batch_size: int, waits_ms: List[float]) -> None:
+    """Export batch size, queue waits and model stage timings of a finished batch."""
+    observe_batch(batch_size, waits_ms, detector.last_timings)
+    QUEUE_DEPTH.set(batcher.queue_depth)
+
+# Requests arriving within the batching window share one forward pass
+batcher = InferenceBatcher(
+    count_people_batch,
+    max_batch_size=BATCH_MAX_SIZE,
+    max_wait_ms=BATCH_MAX_WAIT_MS,
+    max_queue_size=INFERENCE_QUEUE_SIZE,
+    on_batch=record_batch,
+)
+
+# Skip inference for frames that barely differ from the camera's last inferred frame
+frame_cache = FrameCache(
+    threshold=FRAME_CACHE_THRESHOLD,
+    ttl=FRAME_CACHE_TTL,
+    max_entries=FRAME_CACHE_MAX_CAMERAS,
+)
+
+# Pooled, coalescing delivery to the Bus and Warning APIs
+delivery = DeliveryClient(
+    BUS_API_URL,
+    WARNING_API_URL,
+    bus_api_bulk_url=BUS_API_BULK_URL,
+    spill_path=DELIVERY_SPILL_PATH,
+    flush_interval=DELIVERY_FLUSH_INTERVAL,
+    on_post=observe_post,
+)
+
+def make_tracker(namespace: str) -> OccupancyTracker:
+    """Smoothing state per camera, in STATE_DB_PATH when set so every worker advances the same window."""
+    settings = dict(
+        method=SMOOTHING_METHOD,
+        window=SMOOTHING_WINDOW,
+        alpha=SMOOTHING_ALPHA,
+        min_change=PUBLISH_MIN_CHANGE,
+        heartbeat=PUBLISH_HEARTBEAT,
+    )
+    if STATE_DB_PATH:
+        return SharedOccupancyTracker(STATE_DB_PATH, namespace, **settings)
+    return OccupancyTracker(**settings)
+
+# Smooth live counts per camera and publish only real changes
+tracker = make_tracker("live")
+
+# Capacity and alert settings per camera, reloaded when the file changes
+cameras = CameraRegistry(
+    CAMERA_CONFIG_PATH,
+    CameraConfig(DEFAULT_CAPACITY, ALERT_NEAR_FULL_RATIO, ALERT_COOLDOWN, ALERT_QUIET_HOURS),
+    reload_interval=CAMERA_CONFIG_RELOAD_INTERVAL,
+)
+
+def make_alert_engine(namespace: str) -> AlertEngine:
+    """Alert level and cooldowns per camera, in STATE_DB_PATH when set so a crossing fires once across workers."""
+    if STATE_DB_PATH:
+        return SharedAlertEngine(STATE_DB_PATH, namespace, hysteresis=ALERT_HYSTERESIS)
+    return AlertEngine(hysteresis=ALERT_HYSTERESIS)
+
+alerts = make_alert_engine("live")
+
+# /detect/batch readings are replayed history; they get their own smoothing and
+# alert state so old frames never move the live level or cooldowns
+replay_tracker = make_tracker("replay")
+replay_alerts = make_alert_engine("replay")
+
+# Recent occupancy per camera with 1m/5m/1h rollups, served by /occupancy
+if STATE_DB_PATH:
+    history = SharedTimeSeriesStore(STATE_DB_PATH, raw_size=HISTORY_RAW_SIZE, max_cameras=HISTORY_MAX_CAMERAS)
+else:
+    history = TimeSeriesStore(raw_size=HISTORY_RAW_SIZE, max_cameras=HISTORY_MAX_CAMERAS)
+
+# Continuous camera streams (WebSocket push and MJPEG pull)
+stream_stats = StreamStats()
+pullers = []
+
+def camera_label(camera_id: str) -> str:
+    """camera_id as a metrics label; clients pick it freely, so unconfigured cameras share "other"."""
+    return camera_id if camera_id in STREAM_PULL_SOURCES or cameras.known(camera_id) else "other"
+
+def make_location(lat: Optional[float], lon: Optional[float]) -> Optional[dict]:
+    """Coordinates reported by a capture node, or None unless both are valid."""
+    if not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in (lat, lon)):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return {"lat": lat, "lon": lon}
+
+def send_to_apis(camera_id: str, occupancy: int, capacity: int, timestamp: Optional[str] = None,
+                 alert: Optional[str] = None, location: Optional[dict] = None) -> None:
+    """Queue occupancy data for delivery to remote APIs."""
     data = {
         "camera_id": camera_id,
         "occupancy": occupancy,
-        "capacity": MAX_CAPACITY
+        "capacity": capacity
+    }
+    if timestamp:
+        data["timestamp"] = timestamp
+    if location:
+        data["location"] = location
+
+    # Warning goes out as well when an alert fired
+    if alert:
+        data["alert"] = alert
+        logger.warning(f"Queueing {alert} warning for camera {camera_id}: occupancy {occupancy}/{capacity}")
+    # Timestamped (replayed) readings are history, so keep every one of them
+    delivery.enqueue(data, warning=alert is not None, coalesce=timestamp is None)
+
+def publish_occupancy(camera_id: str, count: int, location: Optional[dict] = None) -> dict:
+    """Smooth a live count, evaluate the camera's alert rules and queue the reading if it changed."""
+    config = cameras.get(camera_id)
+    update = tracker.update(camera_id, count)
+    decision = alerts.evaluate(camera_id, update.occupancy, config)
+    history.record(camera_id, update.occupancy, config.capacity)
+    published = update.publish or decision.fire is not None
+    if published:
+        send_to_apis(camera_id, update.occupancy, config.capacity, alert=decision.fire, location=location)
+    return {
+        "smoothed_occupancy": update.occupancy,
+        "published": published,
+        "capacity": config.capacity,
+        "alert_level": decision.level,
+    }
+
+def publish_replayed(camera_id: str, count: int, captured_at: Optional[float], timestamp: Optional[str],
+                     location: Optional[dict] = None) -> dict:
+    """Smooth, alert and queue a /detect/batch reading against the replay state, at its capture time."""
+    config = cameras.get(camera_id)
+    now = time.time() if captured_at is None else captured_at
+    update = replay_tracker.update(camera_id, count, now=now)
+    decision = replay_alerts.evaluate(camera_id, update.occupancy, config, now=now)
+    history.record(camera_id, update.occupancy, config.capacity, captured_at)
+    # History is kept whole, so every reading is forwarded
+    send_to_apis(camera_id, update.occupancy, config.capacity, timestamp, alert=decision.fire, location=location)
+    return {
+        "smoothed_occupancy": update.occupancy,
+        "capacity": config.capacity,
+        "alert_level": decision.level,
     }
-    
-    # Send to bus API
+
+async def warm_up_model() -> None:
+    """Run warm-up inferences through the batcher, then mark the service ready."""
     try:
-        response = requests.post(BUS_API_URL, json=data, timeout=5)
-        response.raise_for_status()
-        logger.info(f"Successfully sent data to bus API for camera {camera_id}")
+        started = time.perf_counter()
+        for _ in range(WARMUP_ROUNDS):
+            await batcher.submit(np.zeros(WARMUP_SHAPE, dtype=np.uint8))
     except Exception as e:
-        logger.error(f"Failed to send data to bus API: {str(e)}")
+        startup["error"] = getattr(e, "detail", str(e))
+        logger.error(f"Model warm-up failed: {startup['error']}")
+        return
+    if MODEL_SERVER_SOCKET:
+        # The shared model server loaded the model; report its load time
+        MODEL_LOAD_SECONDS.set(detector.server_info.get("load_seconds", 0))
+    startup["warmup_seconds"] = round(time.perf_counter() - started, 3)
+    startup["startup_seconds"] = round(time.perf_counter() - PROCESS_STARTED, 3)
+    startup["ready"] = True
+    STARTUP_SECONDS.set(startup["startup_seconds"])
+    logger.info(f"Ready after {startup['startup_seconds']}s (warm-up {startup['warmup_seconds']}s)")
 
-    # Send warning if occupancy exceeds capacity
-    if occupancy > MAX_CAPACITY:
-        try:
-            response = requests.post(WARNING_API_URL, json=data, timeout=5)
-            response.raise_for_status()
-            logger.warning(f"Warning sent for camera {camera_id}: occupancy {occupancy} > capacity {MAX_CAPACITY}")
-        except Exception as e:
-            logger.error(f"Failed to send warning: {str(e)}")
+@app.on_event("startup")
+async def start_workers():
+    await batcher.start()
+    delivery.start()
+    # Warm up in the background so the process answers /health while it happens
+    app.state.warmup = asyncio.create_task(warm_up_model())
+    for camera_id, url in STREAM_PULL_SOURCES.items():
+        puller = MjpegPuller(camera_id, url, partial(run_detection, route="pull"), STREAM_SAMPLE_FPS, stream_stats)
+        puller.start()
+        pullers.append(puller)
+
+@app.on_event("shutdown")
+async def stop_workers():
+    app.state.warmup.cancel()
+    for puller in pullers:
+        puller.stop()
+    await batcher.stop()
+    delivery.stop()
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
-    return {"status": "healthy"}
+    """Health check endpoint; 503 until the model has been warmed up."""
+    if not startup["ready"]:
+        status = "unavailable" if startup["error"] else "starting"
+        return JSONResponse(status_code=503, content={"status": status, "detail": startup["error"]})
+    return {
+        "status": "healthy",
+        "model": detector.describe(),
+        "warmup_seconds": startup["warmup_seconds"],
+        "startup_seconds": startup["startup_seconds"],
+    }
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus metrics: per-stage latency histograms, outbound posts, queue depth and request rates."""
+    QUEUE_DEPTH.set(batcher.queue_depth)
+    return Response(content=render(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/cameras")
+async def camera_config():
+    """Per-camera capacity and alert settings currently in effect."""
+    cameras.maybe_reload()
+    return cameras.snapshot()
+
+@app.get("/occupancy")
+async def latest_occupancy_all():
+    """Latest smoothed reading of every camera with history."""
+    return history.latest_all()
+
+@app.get("/occupancy/{camera_id}")
+async def latest_occupancy(camera_id: str):
+    """Latest smoothed reading of one camera."""
+    latest = history.latest(camera_id)
+    if latest is None:
+        raise HTTPException(status_code=404, detail=f"No readings for camera {camera_id}")
+    return latest
+
+@app.get("/occupancy/{camera_id}/history")
+async def occupancy_history(
+    camera_id: str,
+    resolution: str = Query("5m", description="Rollup: 1m, 5m, 1h, or raw readings"),
+    minutes: int = Query(60, ge=1, le=7 * 24 * 60, description="How far back to go")
+):
+    """Occupancy trend of one camera from the in-memory rollups."""
+    if resolution != "raw" and resolution not in ROLLUP_SECONDS:
+        raise HTTPException(status_code=400, detail=f"resolution must be one of raw, {', '.join(ROLLUP_SECONDS)}")
+    points = history.history(camera_id, resolution, time.time() - minutes * 60)
+    if points is None:
+        raise HTTPException(status_code=404, detail=f"No readings for camera {camera_id}")
+    return {"camera_id": camera_id, "resolution": resolution, "minutes": minutes, "points": points}
+
+@app.get("/stats")
+async def inference_stats():
+    """Inference batching, frame cache, occupancy tracking, alert, history, outbound delivery and stream statistics."""
+    return {
+        "batching": {
+            "max_batch_size": batcher.max_batch_size,
+            "max_wait_ms": BATCH_MAX_WAIT_MS,
+            "queue_depth": batcher.queue_depth,
+            "max_queue_size": batcher.max_queue_size,
+            "rejected": batcher.rejected,
+            **batcher.stats.snapshot(),
+        },
+        "frame_cache": {"enabled": FRAME_CACHE_ENABLED, **frame_cache.snapshot()},
+        "tracking": {**tracker.snapshot(), "replay": replay_tracker.snapshot()},
+        "alerts": {**alerts.snapshot(), "replay": replay_alerts.snapshot()},
+        "history": history.snapshot(),
+        "delivery": delivery.snapshot(),
+        "streams": {
+            "sample_fps": STREAM_SAMPLE_FPS,
+            **stream_stats.snapshot(),
+            "pull": {puller.camera_id: puller.last_result for puller in pullers},
+        },
+    }
+
+def response_headers(timer: Optional[StageTimer] = None) -> dict:
+    """Backpressure hint for capture nodes (queue fill, 0-1) and optional Server-Timing."""
+    headers = {"X-Backpressure": f"{min(1.0, batcher.queue_depth / batcher.max_queue_size):.2f}"}
+    if TIMING_HEADERS and timer:
+        headers["Server-Timing"] = timer.server_timing()
+    return headers
+
+async def run_detection(
+    camera_id: str,
+    image_data: bytes,
+    timer: Optional[StageTimer] = None,
+    route: str = "detect",
+    location: Optional[dict] = None
+) -> dict:
+    """Decode, count (or reuse a cached count) and queue delivery for one frame."""
+    timer = timer or StageTimer()
+    try:
+        # Decode image off the event loop
+        with timer.stage("decode"):
+            img = await run_in_threadpool(process_image, image_data)
+
+        # Reuse the last count if the scene has not changed
+        person_count, signature = frame_cache.lookup(camera_id, img) if FRAME_CACHE_ENABLED else (None, None)
+        cached = person_count is not None
+
+        # Run YOLO inference (micro-batched with concurrent requests)
+        if not cached:
+            try:
+                with timer.stage("inference"):
+                    person_count = await batcher.submit(img)
+            except QueueFullError as e:
+                logger.warning(f"Rejecting request from camera {camera_id}: {str(e)}")
+                raise HTTPException(
+                    status_code=503,
+                    detail="Inference queue is full, retry later",
+                    headers={"Retry-After": str(RETRY_AFTER_SECONDS), **response_headers()}
+                )
+            if FRAME_CACHE_ENABLED:
+                frame_cache.store(camera_id, signature, person_count)
+    except HTTPException as he:
+        REQUESTS.labels(camera_label(camera_id), route, str(he.status_code)).inc()
+        raise
+
+    REQUESTS.labels(camera_label(camera_id), route, "cached" if cached else "success").inc()
+
+    # Log detection
+    logger.info(f"Camera: {camera_id}, Occupancy: {person_count}{' (cached)' if cached else ''}")
+
+    # Queue smoothed data for the APIs (delivered by the background worker)
+    published = publish_occupancy(camera_id, person_count, location)
+
+    return {
+        "camera_id": camera_id,
+        "occupancy": person_count,
+        **published,
+        "status": "success",
+        "cached": cached
+    }
 
 @app.post("/detect")
 async def detect_occupancy(
     image: UploadFile = File(...),
-    camera_id: str = Query(..., description="Camera identifier")
+    camera_id: str = Query(..., description="Camera identifier"),
+    lat: Optional[float] = Query(None, ge=-90, le=90, description="Latitude of the camera's last position fix"),
+    lon: Optional[float] = Query(None, ge=-180, le=180, description="Longitude of the camera's last position fix")
 ):
     """
     Process image to detect and count people using YOLOv5x.
     """
+    timer = StageTimer()
     try:
-        # Read and validate image
-        image_data = await image.read()
-        validate_image_size(image_data)
-        
-        # Process image
-        img = process_image(image_data)
-        
-        # Run YOLO inference
-        person_count = count_people(img)
-        
-        # Prepare response
-        response_data = {
-            "camera_id": camera_id,
-            "occupancy": person_count,
-            "capacity": MAX_CAPACITY,
-            "status": "success"
-        }
-
-        # Log detection
-        logger.info(f"Camera: {camera_id}, Occupancy: {person_count}")
-
-        # Send data to APIs
-        send_to_apis(camera_id, person_count)
-
-        return JSONResponse(content=response_data)
+        with IN_FLIGHT.track_inprogress():
+            # Read image, rejecting it as soon as it passes the size limit
+            with timer.stage("read"):
+                image_data = await read_upload(image, MAX_IMAGE_SIZE)
+
+            response_data = await run_detection(camera_id, image_data, timer, location=make_location(lat, lon))
+
+        return JSONResponse(content=response_data, headers=response_headers(timer))
 
     except HTTPException as he:
         raise he
@@ -146,6 +491,154 @@ async def detect_occupancy(
         logger.error(f"Error processing request: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-if _name_ == "_main_":
+class CountReport(BaseModel):
+    """A person count made on the capture node itself."""
+    camera_id: str = Field(..., min_length=1)
+    occupancy: int = Field(..., ge=0)
+    confidence: Optional[float] = Field(None, ge=0, le=1)
+    model: Optional[str] = None
+    inference_ms: Optional[float] = None
+    lat: Optional[float] = Field(None, ge=-90, le=90)
+    lon: Optional[float] = Field(None, ge=-180, le=180)
+
+@app.post("/report")
+async def report_occupancy(report: CountReport):
+    """
+    Accept a count from a capture node running its own detector.
+
+    No image is sent; the count is smoothed, checked against the camera's alert
+    rules and forwarded exactly like one from /detect.
+    """
+    REQUESTS.labels(camera_label(report.camera_id), "edge", "success").inc()
+    logger.info(
+        f"Camera: {report.camera_id}, Occupancy: {report.occupancy} "
+        f"(edge {report.model}, confidence {report.confidence})"
+    )
+    content = {
+        "camera_id": report.camera_id,
+        "occupancy": report.occupancy,
+        **publish_occupancy(report.camera_id, report.occupancy, make_location(report.lat, report.lon)),
+        "status": "success"
+    }
+    return JSONResponse(content=content, headers=response_headers())
+
+@app.websocket("/ws/{camera_id}")
+async def detect_stream(websocket: WebSocket, camera_id: str):
+    """
+    Long-lived camera stream: send encoded frames as binary messages and receive
+    an occupancy JSON message for every sampled frame.
+    """
+    await serve_camera_socket(websocket, camera_id, partial(run_detection, route="ws"), STREAM_SAMPLE_FPS, stream_stats)
+
+def parse_batch_metadata(metadata: str, frames: int) -> List[dict]:
+    """Validate the per-frame metadata of a /detect/batch request."""
+    try:
+        entries = json.loads(metadata)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="metadata must be a JSON array")
+    if not isinstance(entries, list) or len(entries) != frames:
+        raise HTTPException(status_code=400, detail=f"metadata must have one entry per image ({frames})")
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict) or not entry.get("camera_id"):
+            raise HTTPException(status_code=400, detail=f"metadata[{index}] is missing camera_id")
+    return entries
+
+def decode_batch(blobs: List[bytes]) -> List[Optional[np.ndarray]]:
+    """Decode a batch of images, using None for frames that cannot be decoded."""
+    frames = []
+    for data in blobs:
+        try:
+            frames.append(decode_image(data, INFER_IMGSZ))
+        except Exception as e:
+            logger.error(f"Failed to process image: {str(e)}")
+            frames.append(None)
+    return frames
+
+@app.post("/detect/batch")
+async def detect_occupancy_batch(
+    images: List[UploadFile] = File(...),
+    metadata: str = Form(..., description='JSON array of {"camera_id": ..., "timestamp": ..., "lat": ..., "lon": ...}, one per image')
+):
+    """
+    Count people in many frames from one request, e.g. buffered frames synced after a reconnect.
+
+    Frames go through the inference batcher in model-sized chunks and results are
+    returned in upload order. Frames that cannot be decoded get an error entry
+    instead of failing the whole batch.
+    """
+    if len(images) > DETECT_BATCH_MAX_FRAMES:
+        raise HTTPException(status_code=400, detail=f"At most {DETECT_BATCH_MAX_FRAMES} images per batch")
+    entries = parse_batch_metadata(metadata, len(images))
+    # Capture times, normalised; frames with an unreadable timestamp are reported and not counted
+    captured_at = [parse_timestamp(entry.get("timestamp")) for entry in entries]
+    bad_timestamps = {
+        index for index, entry in enumerate(entries)
+        if entry.get("timestamp") is not None and captured_at[index] is None
+    }
+
+    timer = StageTimer()
+    try:
+        with timer.stage("read"):
+            blobs = [await read_upload(image, MAX_IMAGE_SIZE) for image in images]
+        with timer.stage("decode"):
+            frames = await run_in_threadpool(decode_batch, blobs)
+        del blobs
+
+        # Submit one model batch at a time so live /detect traffic interleaves
+        valid = [index for index, frame in enumerate(frames) if frame is not None and index not in bad_timestamps]
+        counts = {}
+        chunk_size = batcher.max_batch_size
+        for start in range(0, len(valid), chunk_size):
+            chunk = valid[start:start + chunk_size]
+            try:
+                with timer.stage("inference"):
+                    results = await batcher.submit_many([frames[index] for index in chunk])
+            except QueueFullError as e:
+                logger.warning(f"Rejecting batch of {len(images)} frames: {str(e)}")
+                raise HTTPException(
+                    status_code=503,
+                    detail="Inference queue is full, retry later",
+                    headers={"Retry-After": str(RETRY_AFTER_SECONDS), **response_headers()}
+                )
+            counts.update(zip(chunk, results))
+
+        results = []
+        for index, entry in enumerate(entries):
+            camera_id = entry["camera_id"]
+            timestamp = entry.get("timestamp")
+            REQUESTS.labels(camera_label(camera_id), "batch", "success" if index in counts else "400").inc()
+            if index not in counts:
+                results.append({
+                    "camera_id": camera_id,
+                    "timestamp": timestamp,
+                    "status": "error",
+                    "detail": "Invalid timestamp" if index in bad_timestamps else "Invalid image format"
+                })
+                continue
+            if captured_at[index] is not None:
+                timestamp = datetime.fromtimestamp(captured_at[index], timezone.utc).isoformat()
+            published = publish_replayed(camera_id, counts[index], captured_at[index], timestamp,
+                                         make_location(entry.get("lat"), entry.get("lon")))
+            results.append({
+                "camera_id": camera_id,
+                "timestamp": timestamp,
+                "occupancy": counts[index],
+                **published,
+                "status": "success"
+            })
+
+        logger.info(f"Batch: {len(counts)}/{len(images)} frames processed")
+        return JSONResponse(
+            content={"status": "success", "count": len(results), "results": results},
+            headers=response_headers(timer)
+        )
+
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logger.error(f"Error processing batch request: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
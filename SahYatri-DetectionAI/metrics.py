@@ -0,0 +1,115 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Buckets from 1ms to 10s, covering decode on small frames up to a slow upstream post
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_STAGE_SECONDS = Histogram(
+    "detect_request_stage_seconds",
+    "Per-request time spent in each stage of a detection (read, decode, inference incl. queueing)",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+MODEL_STAGE_SECONDS = Histogram(
+    "detect_model_stage_seconds",
+    "Per-batch model time by stage (queue_wait, preprocess, inference, postprocess)",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+BATCH_SIZE = Histogram(
+    "detect_batch_size",
+    "Number of frames per model forward pass",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+OUTBOUND_POST_SECONDS = Histogram(
+    "outbound_post_seconds",
+    "Duration of posts to the Bus and Warning APIs",
+    ["target", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS = Counter(
+    "detect_requests_total",
+    "Detection requests by camera, ingest route and result",
+    ["camera_id", "route", "result"],
+)
+IN_FLIGHT = Gauge(
+    "detect_requests_in_flight",
+    "Detection requests currently being processed",
+    multiprocess_mode="livesum",
+)
+QUEUE_DEPTH = Gauge(
+    "detect_inference_queue_depth",
+    "Frames waiting in the inference queue",
+    multiprocess_mode="livesum",
+)
+MODEL_LOAD_SECONDS = Gauge(
+    "detect_model_load_seconds",
+    "Time taken to load (and export, if needed) the detector at startup",
+    multiprocess_mode="max",
+)
+STARTUP_SECONDS = Gauge(
+    "detect_startup_seconds",
+    "Time from process start until the warmed-up detector was ready to serve",
+    multiprocess_mode="max",
+)
+
+
+class StageTimer:
+    """Collects the duration of named stages of one request."""
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+            REQUEST_STAGE_SECONDS.labels(name).observe(elapsed)
+
+    def server_timing(self) -> str:
+        """Render the timings as a Server-Timing header value (milliseconds)."""
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.timings.items())
+
+
+def observe_batch(batch_size: int, waits_ms, model_timings: Optional[Dict[str, float]]) -> None:
+    """Record one model forward pass."""
+    BATCH_SIZE.observe(batch_size)
+    for wait in waits_ms:
+        MODEL_STAGE_SECONDS.labels("queue_wait").observe(wait / 1000)
+    for stage, seconds in (model_timings or {}).items():
+        MODEL_STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+def observe_post(target: str, seconds: float, outcome: str) -> None:
+    """Record one outbound post to the Bus or Warning API."""
+    OUTBOUND_POST_SECONDS.labels(target, outcome).observe(seconds)
+
+
+def render() -> bytes:
+    """
+    Prometheus text exposition of all metrics.
+
+    When PROMETHEUS_MULTIPROC_DIR is set (several uvicorn workers), the values
+    of all worker processes are aggregated.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
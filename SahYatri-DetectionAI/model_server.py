@@ -0,0 +1,221 @@
+import json
+import logging
+import os
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from detectors import Detector, load_checked_detector
+
+logger = logging.getLogger(__name__)
+
+HEADER_LENGTH = struct.Struct(">I")
+WARMUP_SHAPE = (480, 640, 3)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], size - received)
+        if n == 0:
+            raise ConnectionError("Model server connection closed")
+        received += n
+    return bytes(buffer)
+
+
+def send_message(sock: socket.socket, header: Dict[str, Any], payload: List[memoryview] = ()) -> None:
+    encoded = json.dumps(header).encode()
+    sock.sendall(HEADER_LENGTH.pack(len(encoded)) + encoded)
+    for chunk in payload:
+        sock.sendall(chunk)
+
+
+def recv_header(sock: socket.socket) -> Dict[str, Any]:
+    (length,) = HEADER_LENGTH.unpack(_recv_exact(sock, HEADER_LENGTH.size))
+    return json.loads(_recv_exact(sock, length))
+
+
+def warm_up(detector: Detector, rounds: int = 2) -> float:
+    """Run a few inferences so lazy initialisation happens before serving; returns seconds."""
+    started = time.perf_counter()
+    frame = np.zeros(WARMUP_SHAPE, dtype=np.uint8)
+    for _ in range(rounds):
+        detector.count_batch([frame])
+    return time.perf_counter() - started
+
+
+class RemoteDetector(Detector):
+    """
+    Detector proxy that forwards frames to a ModelServer over its Unix socket.
+
+    Nothing is loaded in the worker. The first request waits up to
+    startup_timeout for the server to come up (it binds only once warmed up);
+    after that a dead server fails requests within reconnect_timeout.
+    """
+
+    name = "remote"
+
+    def __init__(self, socket_path: str, startup_timeout: float = 300.0, reconnect_timeout: float = 5.0):
+        super().__init__()
+        self.socket_path = socket_path
+        self.startup_timeout = startup_timeout
+        self.reconnect_timeout = reconnect_timeout
+        self.server_info: Dict[str, Any] = {}
+        self._local = threading.local()
+
+    def _connect(self) -> socket.socket:
+        timeout = self.reconnect_timeout if self.server_info else self.startup_timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.socket_path)
+                return sock
+            except (FileNotFoundError, ConnectionRefusedError):
+                sock.close()
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Model server at {self.socket_path} is not available")
+                time.sleep(0.5)
+
+    def _request(self, header: Dict[str, Any], payload: List[memoryview] = ()) -> Dict[str, Any]:
+        # One connection per thread; reconnect once if the server restarted
+        for attempt in range(2):
+            sock = getattr(self._local, "sock", None)
+            if sock is None:
+                sock = self._local.sock = self._connect()
+            try:
+                send_message(sock, header, payload)
+                response = recv_header(sock)
+                break
+            except OSError:
+                sock.close()
+                self._local.sock = None
+                if attempt:
+                    raise
+        if "error" in response:
+            raise RuntimeError(f"Model server error: {response['error']}")
+        return response
+
+    def count_batch(self, images: List[np.ndarray]) -> List[int]:
+        if not self.server_info:
+            self.server_info = self._request({"op": "describe"})["detector"]
+        frames = [np.ascontiguousarray(image, dtype=np.uint8) for image in images]
+        response = self._request(
+            {"op": "count", "shapes": [frame.shape for frame in frames]},
+            [memoryview(frame).cast("B") for frame in frames],
+        )
+        self.last_timings = response.get("timings", {})
+        return response["counts"]
+
+    def describe(self) -> Dict[str, Any]:
+        return {**self.server_info, "backend": f"remote:{self.server_info.get('backend', '?')}",
+                "socket": self.socket_path}
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        server: "ModelServer" = self.server
+        while True:
+            try:
+                header = recv_header(self.request)
+            except OSError:
+                return
+            try:
+                if header.get("op") == "describe":
+                    send_message(self.request, {"detector": server.info})
+                    continue
+                frames = []
+                for shape in header["shapes"]:
+                    size = int(np.prod(shape))
+                    frames.append(np.frombuffer(_recv_exact(self.request, size), dtype=np.uint8).reshape(shape))
+                counts, timings = server.count(frames)
+                send_message(self.request, {"counts": counts, "timings": timings})
+            except OSError:
+                return
+            except Exception as e:
+                logger.error(f"Model server request failed: {str(e)}")
+                send_message(self.request, {"error": str(e)})
+
+
+class ModelServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Shared inference process for all uvicorn workers.
+
+    Loading the detector in every worker keeps one copy of the weights per
+    process and repeats the slow load on each restart. Instead one process loads
+    and warms up the detector and serves counts over a local Unix socket; the
+    HTTP workers only decode images and forward raw frames (see RemoteDetector).
+    Inference is serialised by a lock, the workers already batch their requests.
+
+    Messages in both directions are a 4-byte big-endian header length, a JSON
+    header, then the payload: requests carry the frame shapes in the header and
+    the raw uint8 pixels back to back; responses carry counts and stage timings.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, detector: Detector, info: Dict[str, Any]):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, _Handler)
+        self.detector = detector
+        self.info = info
+        self._lock = threading.Lock()
+
+    def count(self, frames: List[np.ndarray]) -> Tuple[List[int], Dict[str, float]]:
+        with self._lock:
+            counts = self.detector.count_batch(frames)
+            return counts, dict(self.detector.last_timings)
+
+
+def main() -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+    socket_path = os.getenv("MODEL_SERVER_SOCKET", "/tmp/sahyatri-model.sock")
+    backend = os.getenv("MODEL_BACKEND", "torch")
+    tier = os.getenv("MODEL_TIER", "x")
+
+    # Same startup sequence as a worker loading the model itself: load, backend check, warm-up
+    detector, load_seconds = load_checked_detector(
+        backend,
+        tier,
+        os.getenv("BACKEND_CHECK_DIR"),
+        int(os.getenv("BACKEND_CHECK_TOLERANCE", "0")),
+        os.getenv("BACKEND_CHECK_STRICT", "0") == "1",
+        int8=os.getenv("MODEL_INT8", "0") == "1",
+        imgsz=int(os.getenv("INFER_IMGSZ", "640")),
+        conf=float(os.getenv("INFER_CONF", "0.25")),
+        iou=float(os.getenv("INFER_IOU", "0.7")),
+    )
+    warmup_seconds = warm_up(detector, int(os.getenv("WARMUP_ROUNDS", "2")))
+    info = {
+        **detector.describe(),
+        "load_seconds": round(load_seconds, 3),
+        "warmup_seconds": round(warmup_seconds, 3),
+    }
+
+    # Bind only after warm-up, so a connectable socket means the model is ready
+    server = ModelServer(socket_path, detector, info)
+    logger.info(
+        f"Model server ready on {socket_path} (load {load_seconds:.2f}s, warm-up {warmup_seconds:.2f}s)"
+    )
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class CameraConfig(NamedTuple):
+    """Resolved settings of one camera (or the fleet default)."""
+
+    capacity: int
+    near_full_ratio: float  # 0 disables near-full alerts
+    cooldown: float  # seconds before the same alert level may fire again
+    quiet_hours: Tuple[Tuple[int, int], ...]  # (start, end) minutes after midnight, may wrap
+    profile: Optional[str] = None
+
+    def in_quiet_hours(self, minute_of_day: int) -> bool:
+        for start, end in self.quiet_hours:
+            if start <= end:
+                if start <= minute_of_day < end:
+                    return True
+            elif minute_of_day >= start or minute_of_day < end:
+                return True
+        return False
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "capacity": self.capacity,
+            "near_full_ratio": self.near_full_ratio,
+            "cooldown_seconds": self.cooldown,
+            "quiet_hours": [f"{s // 60:02d}:{s % 60:02d}-{e // 60:02d}:{e % 60:02d}" for s, e in self.quiet_hours],
+            "profile": self.profile,
+        }
+
+
+def parse_quiet_hours(value: Any) -> Tuple[Tuple[int, int], ...]:
+    """Parse ["23:00-05:30", ...] into minute ranges."""
+    ranges = []
+    for item in value or ():
+        try:
+            start, end = (
+                int(hours) * 60 + int(minutes)
+                for hours, minutes in (part.strip().split(":") for part in item.split("-"))
+            )
+        except (AttributeError, ValueError):
+            raise ValueError(f"Invalid quiet hours '{item}', expected HH:MM-HH:MM")
+        if not (0 <= start < 1440 and 0 <= end <= 1440):
+            raise ValueError(f"Invalid quiet hours '{item}', times must be within a day")
+        ranges.append((start, end))
+    return tuple(ranges)
+
+
+def _resolve(settings: Dict[str, Any], base: CameraConfig, profile: Optional[str]) -> CameraConfig:
+    capacity = int(settings.get("capacity", base.capacity))
+    if capacity <= 0:
+        raise ValueError(f"capacity must be positive, got {capacity}")
+    return CameraConfig(
+        capacity=capacity,
+        near_full_ratio=float(settings.get("near_full_ratio", base.near_full_ratio)),
+        cooldown=float(settings.get("cooldown_seconds", base.cooldown)),
+        quiet_hours=parse_quiet_hours(settings["quiet_hours"]) if "quiet_hours" in settings else base.quiet_hours,
+        profile=profile,
+    )
+
+
+def load_config(data: Dict[str, Any], fallback: CameraConfig) -> Tuple[CameraConfig, Dict[str, CameraConfig]]:
+    """
+    Resolve a config document into (default config, {camera_id: config}).
+
+    Settings are layered: fallback, then "defaults", then the camera's
+    "profile" (e.g. minibus or articulated), then the camera's own entry.
+    """
+    default = _resolve(data.get("defaults", {}), fallback, None)
+    profiles = data.get("profiles", {})
+    cameras = {}
+    for camera_id, settings in data.get("cameras", {}).items():
+        profile = settings.get("profile")
+        base = default
+        if profile is not None:
+            if profile not in profiles:
+                raise ValueError(f"Camera {camera_id} refers to unknown profile '{profile}'")
+            base = _resolve(profiles[profile], default, profile)
+        cameras[camera_id] = _resolve(settings, base, profile)
+    return default, cameras
+
+
+class CameraRegistry:
+    """
+    Per-camera capacity and alert settings, keyed by camera_id.
+
+    The file is resolved into one CameraConfig per camera when it is loaded, so
+    get() is a single dict lookup; unknown cameras get the default config. The
+    file's modification time is checked at most every reload_interval seconds
+    and a changed file is loaded again without a restart. A file that fails to
+    parse is logged and the previous configuration stays in effect.
+    """
+
+    def __init__(self, path: Optional[str], fallback: CameraConfig, reload_interval: float = 5.0):
+        self.path = path
+        self.fallback = fallback
+        self.reload_interval = reload_interval
+        self.default = fallback
+        self._cameras: Dict[str, CameraConfig] = {}
+        self._mtime: Optional[float] = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+        self.reload_errors = 0
+        self.maybe_reload(force=True)
+
+    def get(self, camera_id: str) -> CameraConfig:
+        self.maybe_reload()
+        return self._cameras.get(camera_id, self.default)
+
+    def known(self, camera_id: str) -> bool:
+        """Whether camera_id has its own entry in the config file."""
+        self.maybe_reload()
+        return camera_id in self._cameras
+
+    def maybe_reload(self, force: bool = False) -> None:
+        """Load the file again if it changed since the last load."""
+        now = time.monotonic()
+        if not self.path or (not force and now < self._next_check):
+            return
+        with self._lock:
+            self._next_check = now + self.reload_interval
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except FileNotFoundError:
+                if force:
+                    logger.info(f"No camera config at {self.path}, using defaults for all cameras")
+                return
+            if mtime == self._mtime:
+                return
+            self._mtime = mtime
+            try:
+                with open(self.path) as f:
+                    default, cameras = load_config(json.load(f), self.fallback)
+            except (OSError, ValueError, TypeError, AttributeError) as e:
+                self.reload_errors += 1
+                logger.error(f"Failed to load camera config {self.path}, keeping the previous one: {str(e)}")
+                return
+            # Swap in whole; readers never see a half-updated mapping
+            self.default, self._cameras = default, cameras
+            self.reloads += 1
+            logger.info(f"Loaded camera config {self.path} ({len(cameras)} cameras)")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+            "default": self.default.describe(),
+            "cameras": {camera_id: config.describe() for camera_id, config in self._cameras.items()},
+        }
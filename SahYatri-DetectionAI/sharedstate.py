@@ -0,0 +1,45 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class SqliteFile:
+    """
+    A SQLite file shared by all uvicorn worker processes.
+
+    Each worker keeps its own copy of in-memory state, so with several
+    workers every one of them would only see the requests it happened to
+    handle. State that has to be the same for the whole service lives in
+    this file instead. It runs in WAL mode so readers never wait for a
+    writer, and writers wait up to busy_timeout for each other. Every thread
+    gets its own connection.
+    """
+
+    def __init__(self, path: str, schema: str = "", busy_timeout: float = 5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        if schema:
+            self.connection().executescript(schema)
+
+    def connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Write transaction; other processes' writes wait until it commits."""
+        db = self.connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
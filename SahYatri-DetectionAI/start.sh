@@ -0,0 +1,18 @@
+#!/bin/sh
+# Load the model once in a shared model server and start thin uvicorn workers against it
+set -e
+
+export MODEL_SERVER_SOCKET="${MODEL_SERVER_SOCKET:-/tmp/sahyatri-model.sock}"
+# Occupancy history shared by all workers
+export STATE_DB_PATH="${STATE_DB_PATH:-/tmp/sahyatri-state.db}"
+
+python model_server.py &
+MODEL_SERVER_PID=$!
+
+uvicorn main:app --host "${HOST:-0.0.0.0}" --port "${PORT:-8000}" --workers "${WORKERS:-4}" &
+UVICORN_PID=$!
+
+# Forward container stop signals to both processes
+trap 'kill $UVICORN_PID $MODEL_SERVER_PID 2>/dev/null' INT TERM
+wait $UVICORN_PID || true
+kill $MODEL_SERVER_PID 2>/dev/null || true
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import requests
+from fastapi import WebSocket, WebSocketDisconnect
+
+logger = logging.getLogger(__name__)
+
+# Coroutine that turns (camera_id, encoded frame) into an occupancy result
+DetectFn = Callable[[str, bytes], Awaitable[Dict[str, Any]]]
+
+JPEG_START = b"\xff\xd8"
+JPEG_END = b"\xff\xd9"
+
+
+class StreamStats:
+    """Counters shared by all streaming sessions."""
+
+    def __init__(self):
+        self.active = 0
+        self.frames_received = 0
+        self.frames_processed = 0
+        self.frames_dropped = 0
+
+    def snapshot(self) -> Dict[str, int]:
+        return {
+            "active": self.active,
+            "frames_received": self.frames_received,
+            "frames_processed": self.frames_processed,
+            "frames_dropped": self.frames_dropped,
+        }
+
+
+class LatestFrame:
+    """
+    Single-slot mailbox holding the newest frame of a stream.
+
+    A frame that is replaced before the sampler picks it up is dropped, so a
+    camera sending faster than the sampling rate never builds up a backlog.
+    """
+
+    def __init__(self, stats: StreamStats):
+        self.stats = stats
+        self._frame: Optional[bytes] = None
+        self._event = asyncio.Event()
+
+    def put(self, frame: bytes) -> None:
+        self.stats.frames_received += 1
+        if self._frame is not None:
+            self.stats.frames_dropped += 1
+        self._frame = frame
+        self._event.set()
+
+    async def take(self) -> bytes:
+        await self._event.wait()
+        self._event.clear()
+        frame, self._frame = self._frame, None
+        return frame
+
+
+async def _sample(camera_id: str, mailbox: LatestFrame, detect: DetectFn, interval: float,
+                  on_result: Callable[[Dict[str, Any]], Awaitable[None]], stats: StreamStats) -> None:
+    """Run detect on the newest frame at most once per interval and report each result."""
+    loop = asyncio.get_running_loop()
+    next_due = 0.0
+    while True:
+        delay = next_due - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        frame = await mailbox.take()
+        next_due = loop.time() + interval
+        try:
+            result = await detect(camera_id, frame)
+        except Exception as e:
+            detail = getattr(e, "detail", str(e))
+            result = {"camera_id": camera_id, "status": "error", "detail": detail}
+        else:
+            stats.frames_processed += 1
+        await on_result(result)
+
+
+async def serve_camera_socket(websocket: WebSocket, camera_id: str, detect: DetectFn,
+                              sample_fps: float, stats: StreamStats) -> None:
+    """
+    Serve one long-lived camera connection.
+
+    The camera sends encoded frames as binary messages at whatever rate it likes;
+    they are sampled at sample_fps, and every occupancy result is pushed back as
+    a JSON message on the same socket.
+    """
+    await websocket.accept()
+    stats.active += 1
+    mailbox = LatestFrame(stats)
+    sampler = asyncio.create_task(
+        _sample(camera_id, mailbox, detect, 1.0 / sample_fps, websocket.send_json, stats)
+    )
+    logger.info(f"Stream opened for camera {camera_id} ({sample_fps} fps sampling)")
+    try:
+        while True:
+            frame = await websocket.receive_bytes()
+            mailbox.put(frame)
+            if sampler.done():
+                # Surface the sampler's failure (e.g. the socket closed while sending)
+                sampler.result()
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Stream for camera {camera_id} failed: {str(e)}")
+    finally:
+        sampler.cancel()
+        stats.active -= 1
+        logger.info(f"Stream closed for camera {camera_id}")
+
+
+class MjpegPuller:
+    """
+    Pulls a camera's multipart MJPEG feed (e.g. the capture node's /video_feed).
+
+    A reader thread splits the byte stream on JPEG start/end markers and hands the
+    newest frame to the event loop; an asyncio task samples it like a WebSocket
+    stream. The connection is re-established after errors.
+    """
+
+    def __init__(self, camera_id: str, url: str, detect: DetectFn, sample_fps: float,
+                 stats: StreamStats, reconnect_delay: float = 5.0):
+        self.camera_id = camera_id
+        self.url = url
+        self.detect = detect
+        self.sample_fps = sample_fps
+        self.stats = stats
+        self.reconnect_delay = reconnect_delay
+        self.last_result: Optional[Dict[str, Any]] = None
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._sampler: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        mailbox = LatestFrame(self.stats)
+        self._sampler = asyncio.create_task(
+            _sample(self.camera_id, mailbox, self.detect, 1.0 / self.sample_fps, self._on_result, self.stats)
+        )
+        self._thread = threading.Thread(
+            target=self._read, args=(loop, mailbox), name=f"mjpeg-{self.camera_id}", daemon=True
+        )
+        self._thread.start()
+        self.stats.active += 1
+        logger.info(f"Pulling MJPEG stream for camera {self.camera_id} from {self.url}")
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._sampler:
+            self._sampler.cancel()
+            self.stats.active -= 1
+            self._sampler = None
+
+    async def _on_result(self, result: Dict[str, Any]) -> None:
+        self.last_result = result
+
+    def _read(self, loop: asyncio.AbstractEventLoop, mailbox: LatestFrame) -> None:
+        while not self._stopping.is_set():
+            try:
+                with requests.get(self.url, stream=True, timeout=(5, 30)) as response:
+                    response.raise_for_status()
+                    buffer = bytearray()
+                    for chunk in response.iter_content(chunk_size=16 * 1024):
+                        if self._stopping.is_set():
+                            return
+                        buffer += chunk
+                        start = buffer.find(JPEG_START)
+                        end = buffer.find(JPEG_END, start + 2) if start >= 0 else -1
+                        while start >= 0 and end >= 0:
+                            frame = bytes(buffer[start:end + 2])
+                            del buffer[:end + 2]
+                            loop.call_soon_threadsafe(mailbox.put, frame)
+                            start = buffer.find(JPEG_START)
+                            end = buffer.find(JPEG_END, start + 2) if start >= 0 else -1
+                        if start < 0:
+                            # Keep a trailing 0xFF in case a start marker is split across chunks
+                            del buffer[:-1]
+                        elif start > 0:
+                            del buffer[:start]
+            except Exception as e:
+                logger.error(f"MJPEG stream for camera {self.camera_id} failed: {str(e)}")
+            self._stopping.wait(self.reconnect_delay)
+
+
+def parse_pull_sources(value: str) -> Dict[str, str]:
+    """Parse "camera_id=url,camera_id=url" into a mapping."""
+    sources = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        camera_id, _, url = item.partition("=")
+        if not url:
+            raise ValueError(f"Invalid stream source '{item}', expected camera_id=url")
+        sources[camera_id.strip()] = url.strip()
+    return sources
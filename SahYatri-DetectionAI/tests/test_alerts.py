@@ -0,0 +1,45 @@
+import multiprocessing
+
+from alerts import AlertEngine, SharedAlertEngine
+from registry import CameraConfig
+
+CONFIG = CameraConfig(capacity=40, near_full_ratio=0.8, cooldown=600, quiet_hours=())
+
+
+def feed(path, readings, results):
+    """Runs in its own process, like one uvicorn worker receiving part of a camera's frames."""
+    engine = SharedAlertEngine(path, hysteresis=3)
+    for now, occupancy in readings:
+        results.put(engine.evaluate("bus-1", occupancy, CONFIG, now=now).fire)
+
+
+def test_workers_fire_a_crossing_once(tmp_path):
+    path = str(tmp_path / "state.db")
+    readings = [(1000.0 + i, occupancy) for i, occupancy in enumerate([10, 33, 34, 45, 44, 20, 10, 35, 45])]
+    expected = AlertEngine(hysteresis=3)
+    expected_fires = [expected.evaluate("bus-1", occupancy, CONFIG, now=now).fire for now, occupancy in readings]
+
+    # Every reading lands on a different worker process, one after another
+    results = multiprocessing.Queue()
+    fires = []
+    for reading in readings:
+        worker = multiprocessing.Process(target=feed, args=(path, [reading], results))
+        worker.start()
+        worker.join(30)
+        assert worker.exitcode == 0
+        fires.append(results.get(timeout=5))
+
+    assert fires == expected_fires
+    assert fires.count("near_full") == 1 and fires.count("full") == 1
+    snapshot = SharedAlertEngine(path).snapshot()
+    assert snapshot["fired"] == expected.snapshot()["fired"]
+    assert snapshot["cooldown_suppressed"] == expected.snapshot()["cooldown_suppressed"]
+
+
+def test_namespaces_are_separate(tmp_path):
+    path = str(tmp_path / "state.db")
+    live = SharedAlertEngine(path, "live")
+    replay = SharedAlertEngine(path, "replay")
+    live.evaluate("bus-1", 10, CONFIG, now=1000.0)
+    assert replay.evaluate("bus-1", 45, CONFIG, now=400.0).fire == "full"
+    assert live.evaluate("bus-1", 45, CONFIG, now=1001.0).fire == "full"
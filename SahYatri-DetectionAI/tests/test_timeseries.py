@@ -0,0 +1,68 @@
+import multiprocessing
+import time
+
+from timeseries import SharedTimeSeriesStore, TimeSeriesStore
+
+
+def record_readings(path, camera_id, readings):
+    """Runs in its own process, like one uvicorn worker handling part of the traffic."""
+    store = SharedTimeSeriesStore(path)
+    for timestamp, occupancy in readings:
+        store.record(camera_id, occupancy, 40, timestamp)
+
+
+def read_back(path, camera_id, since, results):
+    store = SharedTimeSeriesStore(path)
+    results.put((store.latest(camera_id), store.history(camera_id, "raw", since), store.snapshot()["readings"]))
+
+
+def test_history_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / "state.db")
+    start = time.time() - 600
+    readings = [(start + 10 * i, i % 40) for i in range(40)]
+    # Two workers each handle every other reading of the same camera
+    workers = [
+        multiprocessing.Process(target=record_readings, args=(path, "bus-1", readings[offset::2]))
+        for offset in (0, 1)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+        assert worker.exitcode == 0
+
+    # A third worker sees all of them
+    results = multiprocessing.Queue()
+    reader = multiprocessing.Process(target=read_back, args=(path, "bus-1", start - 1, results))
+    reader.start()
+    latest, raw, recorded = results.get(timeout=30)
+    reader.join(30)
+
+    assert recorded == len(readings)
+    assert [point["occupancy"] for point in raw] == [occupancy for _, occupancy in readings]
+    assert latest["occupancy"] == readings[-1][1]
+
+
+def test_shared_store_matches_in_memory_store(tmp_path):
+    memory = TimeSeriesStore(raw_size=20, max_cameras=2)
+    shared = SharedTimeSeriesStore(str(tmp_path / "state.db"), raw_size=20, max_cameras=2)
+    now = time.time()
+    for i in range(200):
+        camera_id = f"bus-{i % 3}"
+        timestamp = now - 7200 + 37 * i
+        for store in (memory, shared):
+            store.record(camera_id, i % 50, 40, timestamp)
+
+    assert list(memory.latest_all()) == list(shared.latest_all())
+    for camera_id in memory.latest_all():
+        for resolution in ("raw", "1m", "5m", "1h"):
+            assert memory.history(camera_id, resolution, now - 86400) == shared.history(camera_id, resolution, now - 86400)
+    assert memory.snapshot()["evicted"] == shared.snapshot()["evicted"]
+
+
+def test_future_timestamps_do_not_pin_latest(tmp_path):
+    store = SharedTimeSeriesStore(str(tmp_path / "state.db"))
+    store.record("bus-1", 5, 40, time.time() + 3600)
+    store.record("bus-1", 7, 40)
+    assert store.latest("bus-1")["occupancy"] == 7
+    assert store.snapshot()["clamped"] == 1
@@ -0,0 +1,40 @@
+import multiprocessing
+
+from tracking import OccupancyTracker, SharedOccupancyTracker
+
+
+def feed(path, frames, results):
+    """Runs in its own process, like one uvicorn worker receiving part of a camera's frames."""
+    tracker = SharedOccupancyTracker(path, window=5)
+    for now, count in frames:
+        results.put((now, tracker.update("bus-1", count, now=now).occupancy))
+
+
+def test_workers_share_one_smoothing_window(tmp_path):
+    path = str(tmp_path / "state.db")
+    frames = [(1000.0 + i, count) for i, count in enumerate([10, 12, 30, 11, 13, 12, 40, 12, 14, 13])]
+    expected = OccupancyTracker(window=5)
+    expected_occupancy = [expected.update("bus-1", count, now=now).occupancy for now, count in frames]
+
+    # Every frame lands on a different worker process, one after another
+    results = multiprocessing.Queue()
+    smoothed = []
+    for frame in frames:
+        worker = multiprocessing.Process(target=feed, args=(path, [frame], results))
+        worker.start()
+        worker.join(30)
+        assert worker.exitcode == 0
+        smoothed.append(results.get(timeout=5)[1])
+
+    assert smoothed == expected_occupancy
+
+
+def test_namespaces_are_separate(tmp_path):
+    path = str(tmp_path / "state.db")
+    live = SharedOccupancyTracker(path, "live", method="none")
+    replay = SharedOccupancyTracker(path, "replay", method="none")
+    live.update("bus-1", 10, now=1000.0)
+    replay.update("bus-1", 45, now=400.0)
+    assert live.update("bus-1", 10, now=1001.0).publish is False
+    assert live.snapshot()["updates"] == 2
+    assert replay.snapshot()["updates"] == 1
@@ -0,0 +1,396 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from sharedstate import SqliteFile
+
+# Rollup resolutions in seconds and how many buckets of each are kept
+ROLLUP_SECONDS = {"1m": 60, "5m": 300, "1h": 3600}
+ROLLUP_RETENTION = {"1m": 180, "5m": 288, "1h": 168}  # 3 hours, 1 day, 1 week
+
+
+def _isoformat(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec="seconds")
+
+
+def _bucket(resolution: int, bucket: int, count: int, total: float, maximum: float,
+            percent_total: float, percent_max: float) -> Dict[str, Any]:
+    return {
+        "start": _isoformat(bucket * resolution),
+        "count": count,
+        "mean": round(total / count, 2),
+        "max": int(maximum),
+        "mean_percent": round(percent_total / count, 1),
+        "max_percent": round(percent_max, 1),
+    }
+
+
+def _latest(camera_id: str, timestamp: float, occupancy: int, capacity: int, now: float) -> Dict[str, Any]:
+    return {
+        "camera_id": camera_id,
+        "occupancy": occupancy,
+        "capacity": capacity,
+        "percent": round(100.0 * occupancy / max(capacity, 1), 1),
+        "timestamp": _isoformat(timestamp),
+        "age_seconds": round(now - timestamp, 1),
+    }
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[float]:
+    """Epoch seconds of an ISO 8601 timestamp (naive ones are taken as UTC), or None."""
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class Rollup:
+    """
+    Fixed ring of time buckets at one resolution.
+
+    Bucket n covers [n * resolution, (n + 1) * resolution) and lives in slot
+    n % size, so adding a reading is O(1): the slot is reset when it still
+    holds an older bucket, and readings older than the retention are dropped.
+    """
+
+    __slots__ = ("resolution", "size", "buckets", "counts", "sums", "maxes", "percent_sums", "percent_maxes")
+
+    def __init__(self, resolution: int, size: int):
+        self.resolution = resolution
+        self.size = size
+        self.buckets = np.full(size, -1, dtype=np.int64)
+        self.counts = np.zeros(size, dtype=np.int32)
+        self.sums = np.zeros(size, dtype=np.float64)
+        self.maxes = np.zeros(size, dtype=np.float32)
+        self.percent_sums = np.zeros(size, dtype=np.float64)
+        self.percent_maxes = np.zeros(size, dtype=np.float32)
+
+    def add(self, timestamp: float, occupancy: int, percent: float) -> None:
+        bucket = int(timestamp // self.resolution)
+        slot = bucket % self.size
+        if self.buckets[slot] != bucket:
+            if self.buckets[slot] > bucket:
+                return  # Older than anything this ring still holds
+            self.buckets[slot] = bucket
+            self.counts[slot] = 0
+            self.sums[slot] = self.maxes[slot] = 0
+            self.percent_sums[slot] = self.percent_maxes[slot] = 0
+        self.counts[slot] += 1
+        self.sums[slot] += occupancy
+        self.maxes[slot] = max(self.maxes[slot], occupancy)
+        self.percent_sums[slot] += percent
+        self.percent_maxes[slot] = max(self.percent_maxes[slot], percent)
+
+    def query(self, since: float, until: float) -> List[Dict[str, Any]]:
+        """Buckets overlapping [since, until], oldest first."""
+        selected = np.flatnonzero(
+            (self.buckets >= int(since // self.resolution)) & (self.buckets <= int(until // self.resolution))
+            & (self.counts > 0)
+        )
+        selected = selected[np.argsort(self.buckets[selected])]
+        return [
+            _bucket(self.resolution, int(self.buckets[slot]), int(self.counts[slot]), float(self.sums[slot]),
+                    float(self.maxes[slot]), float(self.percent_sums[slot]), float(self.percent_maxes[slot]))
+            for slot in selected
+        ]
+
+
+class CameraSeries:
+    """Raw readings ring, rollups and latest value of one camera."""
+
+    __slots__ = ("timestamps", "occupancy", "capacity", "next", "filled", "rollups", "latest")
+
+    def __init__(self, raw_size: int):
+        self.timestamps = np.zeros(raw_size, dtype=np.float64)
+        self.occupancy = np.zeros(raw_size, dtype=np.int32)
+        self.capacity = np.zeros(raw_size, dtype=np.int32)
+        self.next = 0
+        self.filled = 0
+        self.rollups = {name: Rollup(seconds, ROLLUP_RETENTION[name]) for name, seconds in ROLLUP_SECONDS.items()}
+        self.latest: Optional[tuple] = None  # (timestamp, occupancy, capacity)
+
+    def add(self, timestamp: float, occupancy: int, capacity: int) -> None:
+        size = len(self.timestamps)
+        self.timestamps[self.next] = timestamp
+        self.occupancy[self.next] = occupancy
+        self.capacity[self.next] = capacity
+        self.next = (self.next + 1) % size
+        self.filled = min(self.filled + 1, size)
+        percent = 100.0 * occupancy / max(capacity, 1)
+        for rollup in self.rollups.values():
+            rollup.add(timestamp, occupancy, percent)
+        if self.latest is None or timestamp >= self.latest[0]:
+            self.latest = (timestamp, occupancy, capacity)
+
+    def raw(self, since: float, until: float) -> List[Dict[str, Any]]:
+        """Raw readings in [since, until] still in the ring, oldest first."""
+        stamps = self.timestamps[:self.filled]
+        selected = np.flatnonzero((stamps >= since) & (stamps <= until))
+        selected = selected[np.argsort(stamps[selected], kind="stable")]
+        return [
+            {
+                "timestamp": _isoformat(float(stamps[index])),
+                "occupancy": int(self.occupancy[index]),
+                "capacity": int(self.capacity[index]),
+            }
+            for index in selected
+        ]
+
+
+class TimeSeriesStore:
+    """
+    In-memory occupancy history per camera, for dashboards and the mobile app.
+
+    Each camera keeps its last raw_size readings in fixed numpy rings plus 1
+    minute, 5 minute and hourly rollups (count, mean, max and percent of
+    capacity) that are updated as readings arrive. Latest-value reads are
+    O(1) and trend reads only scan the small bucket arrays, with no
+    database round trip.
+
+    Memory is bounded: the least recently updated camera is evicted once
+    max_cameras is reached.
+
+    Capture times more than max_skew seconds in the future (a Pi uploading
+    before NTP sync) are clamped to the arrival time, so they cannot pin
+    the latest value ahead of every live reading that follows.
+    """
+
+    def __init__(self, raw_size: int = 720, max_cameras: int = 1024, max_skew: float = 30.0):
+        self.raw_size = max(1, raw_size)
+        self.max_skew = max(0.0, max_skew)
+        self.max_cameras = max(1, max_cameras)
+        self._series: "OrderedDict[str, CameraSeries]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.readings = 0
+        self.evicted = 0
+        self.clamped = 0
+
+    def record(self, camera_id: str, occupancy: int, capacity: int, timestamp: Optional[float] = None) -> None:
+        """Add one reading, at its capture time when given."""
+        now = time.time()
+        if timestamp is None:
+            timestamp = now
+        elif timestamp > now + self.max_skew:
+            timestamp = now
+            self.clamped += 1
+        with self._lock:
+            series = self._series.get(camera_id)
+            if series is None:
+                if len(self._series) >= self.max_cameras:
+                    self._series.popitem(last=False)
+                    self.evicted += 1
+                series = self._series[camera_id] = CameraSeries(self.raw_size)
+            else:
+                self._series.move_to_end(camera_id)
+            series.add(timestamp, occupancy, capacity)
+            self.readings += 1
+
+    def latest(self, camera_id: str) -> Optional[Dict[str, Any]]:
+        """Newest reading of a camera, or None if it has none."""
+        with self._lock:
+            series = self._series.get(camera_id)
+            return _latest(camera_id, *series.latest, time.time()) if series else None
+
+    def latest_all(self) -> Dict[str, Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            return {camera_id: _latest(camera_id, *series.latest, now) for camera_id, series in self._series.items()}
+
+    def history(self, camera_id: str, resolution: str, since: float,
+                until: Optional[float] = None) -> Optional[List[Dict[str, Any]]]:
+        """Rollup buckets (resolution "1m", "5m" or "1h") or raw readings ("raw"); None for an unknown camera."""
+        until = time.time() if until is None else until
+        with self._lock:
+            series = self._series.get(camera_id)
+            if series is None:
+                return None
+            if resolution == "raw":
+                return series.raw(since, until)
+            return series.rollups[resolution].query(since, until)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "cameras": len(self._series),
+                "readings": self.readings,
+                "raw_size": self.raw_size,
+                "rollups": {name: {"seconds": ROLLUP_SECONDS[name], "buckets": ROLLUP_RETENTION[name]}
+                            for name in ROLLUP_SECONDS},
+                "evicted": self.evicted,
+                "clamped": self.clamped,
+            }
+
+
+HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history_cameras (
+    camera_id TEXT PRIMARY KEY,
+    seen_at REAL NOT NULL,
+    latest_at REAL NOT NULL,
+    occupancy INTEGER NOT NULL,
+    capacity INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_cameras_seen ON history_cameras (seen_at);
+CREATE TABLE IF NOT EXISTS history_raw (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    camera_id TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    occupancy INTEGER NOT NULL,
+    capacity INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_raw_camera ON history_raw (camera_id, id);
+CREATE TABLE IF NOT EXISTS history_rollups (
+    camera_id TEXT NOT NULL,
+    resolution TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    total REAL NOT NULL,
+    maximum INTEGER NOT NULL,
+    percent_total REAL NOT NULL,
+    percent_max REAL NOT NULL,
+    PRIMARY KEY (camera_id, resolution, bucket)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS history_counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+class SharedTimeSeriesStore:
+    """
+    TimeSeriesStore kept in a SQLite file, so all uvicorn workers share one history.
+
+    Same readings, rollups, retention, eviction and clamping as the in-memory
+    store and the same read methods, but every worker process reads and
+    writes the same file. With several workers, /occupancy then answers the
+    same whichever worker serves it. Each reading is one short write
+    transaction: the raw row, three rollup upserts and the latest value.
+    """
+
+    def __init__(self, path: str, raw_size: int = 720, max_cameras: int = 1024, max_skew: float = 30.0):
+        self.raw_size = max(1, raw_size)
+        self.max_cameras = max(1, max_cameras)
+        self.max_skew = max(0.0, max_skew)
+        self.db = SqliteFile(path, HISTORY_SCHEMA)
+
+    @staticmethod
+    def _count(db, name: str, amount: int = 1) -> None:
+        db.execute(
+            "INSERT INTO history_counters VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+            (name, amount),
+        )
+
+    def _forget(self, db, camera_id: str) -> None:
+        for table in ("history_cameras", "history_raw", "history_rollups"):
+            db.execute(f"DELETE FROM {table} WHERE camera_id = ?", (camera_id,))
+
+    def record(self, camera_id: str, occupancy: int, capacity: int, timestamp: Optional[float] = None) -> None:
+        """Add one reading, at its capture time when given."""
+        now = time.time()
+        clamped = timestamp is not None and timestamp > now + self.max_skew
+        if timestamp is None or clamped:
+            timestamp = now
+        percent = 100.0 * occupancy / max(capacity, 1)
+        with self.db.transaction() as db:
+            known = db.execute("SELECT latest_at FROM history_cameras WHERE camera_id = ?", (camera_id,)).fetchone()
+            if known is None:
+                if db.execute("SELECT COUNT(*) FROM history_cameras").fetchone()[0] >= self.max_cameras:
+                    (oldest,) = db.execute("SELECT camera_id FROM history_cameras ORDER BY seen_at LIMIT 1").fetchone()
+                    self._forget(db, oldest)
+                    self._count(db, "evicted")
+                db.execute("INSERT INTO history_cameras VALUES (?, ?, ?, ?, ?)",
+                           (camera_id, now, timestamp, occupancy, capacity))
+            elif timestamp >= known[0]:
+                db.execute("UPDATE history_cameras SET seen_at = ?, latest_at = ?, occupancy = ?, capacity = ? "
+                           "WHERE camera_id = ?", (now, timestamp, occupancy, capacity, camera_id))
+            else:
+                db.execute("UPDATE history_cameras SET seen_at = ? WHERE camera_id = ?", (now, camera_id))
+
+            db.execute("INSERT INTO history_raw (camera_id, timestamp, occupancy, capacity) VALUES (?, ?, ?, ?)",
+                       (camera_id, timestamp, occupancy, capacity))
+            db.execute("DELETE FROM history_raw WHERE camera_id = ? AND id <= (SELECT id FROM history_raw "
+                       "WHERE camera_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                       (camera_id, camera_id, self.raw_size))
+
+            for name, seconds in ROLLUP_SECONDS.items():
+                bucket = int(timestamp // seconds)
+                (newest,) = db.execute("SELECT MAX(bucket) FROM history_rollups WHERE camera_id = ? AND resolution = ?",
+                                       (camera_id, name)).fetchone()
+                if newest is not None and bucket <= newest - ROLLUP_RETENTION[name]:
+                    continue  # Older than anything this resolution still holds
+                db.execute(
+                    "INSERT INTO history_rollups VALUES (?, ?, ?, 1, ?, ?, ?, ?) "
+                    "ON CONFLICT (camera_id, resolution, bucket) DO UPDATE SET "
+                    "count = count + 1, total = total + excluded.total, maximum = MAX(maximum, excluded.maximum), "
+                    "percent_total = percent_total + excluded.percent_total, "
+                    "percent_max = MAX(percent_max, excluded.percent_max)",
+                    (camera_id, name, bucket, occupancy, occupancy, percent, percent),
+                )
+                if newest is None or bucket > newest:
+                    db.execute("DELETE FROM history_rollups WHERE camera_id = ? AND resolution = ? AND bucket <= ?",
+                               (camera_id, name, bucket - ROLLUP_RETENTION[name]))
+            self._count(db, "readings")
+            if clamped:
+                self._count(db, "clamped")
+
+    def latest(self, camera_id: str) -> Optional[Dict[str, Any]]:
+        """Newest reading of a camera, or None if it has none."""
+        row = self.db.connection().execute(
+            "SELECT latest_at, occupancy, capacity FROM history_cameras WHERE camera_id = ?", (camera_id,)
+        ).fetchone()
+        return _latest(camera_id, *row, time.time()) if row else None
+
+    def latest_all(self) -> Dict[str, Dict[str, Any]]:
+        now = time.time()
+        rows = self.db.connection().execute(
+            "SELECT camera_id, latest_at, occupancy, capacity FROM history_cameras ORDER BY seen_at"
+        )
+        return {row[0]: _latest(*row, now) for row in rows}
+
+    def history(self, camera_id: str, resolution: str, since: float,
+                until: Optional[float] = None) -> Optional[List[Dict[str, Any]]]:
+        """Rollup buckets (resolution "1m", "5m" or "1h") or raw readings ("raw"); None for an unknown camera."""
+        until = time.time() if until is None else until
+        db = self.db.connection()
+        if db.execute("SELECT 1 FROM history_cameras WHERE camera_id = ?", (camera_id,)).fetchone() is None:
+            return None
+        if resolution == "raw":
+            rows = db.execute(
+                "SELECT timestamp, occupancy, capacity FROM history_raw "
+                "WHERE camera_id = ? AND timestamp BETWEEN ? AND ? ORDER BY timestamp, id",
+                (camera_id, since, until),
+            )
+            return [
+                {"timestamp": _isoformat(timestamp), "occupancy": occupancy, "capacity": capacity}
+                for timestamp, occupancy, capacity in rows
+            ]
+        seconds = ROLLUP_SECONDS[resolution]
+        rows = db.execute(
+            "SELECT bucket, count, total, maximum, percent_total, percent_max FROM history_rollups "
+            "WHERE camera_id = ? AND resolution = ? AND bucket BETWEEN ? AND ? ORDER BY bucket",
+            (camera_id, resolution, int(since // seconds), int(until // seconds)),
+        )
+        return [_bucket(seconds, *row) for row in rows]
+
+    def snapshot(self) -> Dict[str, Any]:
+        db = self.db.connection()
+        counters = dict(db.execute("SELECT name, value FROM history_counters"))
+        return {
+            "path": self.db.path,
+            "cameras": db.execute("SELECT COUNT(*) FROM history_cameras").fetchone()[0],
+            "readings": counters.get("readings", 0),
+            "raw_size": self.raw_size,
+            "rollups": {name: {"seconds": ROLLUP_SECONDS[name], "buckets": ROLLUP_RETENTION[name]}
+                        for name in ROLLUP_SECONDS},
+            "evicted": counters.get("evicted", 0),
+            "clamped": counters.get("clamped", 0),
+        }
@@ -0,0 +1,215 @@
+import json
+import statistics
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, NamedTuple, Optional
+
+from sharedstate import SqliteFile
+
+SMOOTHING_METHODS = ("median", "ema", "none")
+
+
+class TrackUpdate(NamedTuple):
+    """Outcome of feeding one raw count into a camera's track."""
+
+    occupancy: int  # smoothed occupancy
+    publish: bool  # send it to the Bus API
+
+
+class CameraTrack:
+    """Smoothing window and publish state of one camera."""
+
+    __slots__ = ("window", "ema", "published", "published_at", "seen_at")
+
+    def __init__(self, window: int):
+        self.window: Deque[int] = deque(maxlen=window)
+        self.ema: Optional[float] = None
+        self.published: Optional[int] = None
+        self.published_at = 0.0
+        self.seen_at = 0.0
+
+
+class OccupancyTracker:
+    """
+    Per-camera temporal smoothing of person counts.
+
+    Single-frame detector noise is smoothed with a running median over the last
+    window counts (or an exponential moving average with factor alpha). The
+    smoothed occupancy is only published when it moved by at least min_change
+    since the last published value, or when heartbeat seconds have passed, so a
+    steady bus does not write a new row for every frame.
+
+    Cameras idle for idle_ttl seconds are forgotten, and the least recently seen
+    one is evicted once max_cameras is reached.
+    """
+
+    def __init__(self, method: str = "median", window: int = 5, alpha: float = 0.3, min_change: int = 1,
+                 heartbeat: float = 60.0, idle_ttl: float = 600.0,
+                 max_cameras: int = 1024):
+        if method not in SMOOTHING_METHODS:
+            raise ValueError(f"Unknown smoothing method '{method}', expected one of {', '.join(SMOOTHING_METHODS)}")
+        self.method = method
+        self.window = 1 if method == "none" else max(1, window)
+        self.alpha = alpha
+        self.min_change = max(1, min_change)
+        self.heartbeat = heartbeat
+        self.idle_ttl = idle_ttl
+        self.max_cameras = max(1, max_cameras)
+        self._tracks: "OrderedDict[str, CameraTrack]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.updates = 0
+        self.published = 0
+        self.suppressed = 0
+        self.evictions = 0
+
+    def _smooth(self, track: CameraTrack, count: int) -> int:
+        track.window.append(count)
+        if self.method == "median":
+            return int(round(statistics.median(track.window)))
+        if self.method == "ema":
+            track.ema = count if track.ema is None else self.alpha * count + (1 - self.alpha) * track.ema
+            return int(round(track.ema))
+        return count
+
+    def _track(self, camera_id: str, now: float) -> CameraTrack:
+        track = self._tracks.get(camera_id)
+        if track is not None and now - track.seen_at > self.idle_ttl:
+            # Stale state from before a long gap would only delay the new readings
+            track = None
+        if track is None:
+            track = self._tracks[camera_id] = CameraTrack(self.window)
+            while len(self._tracks) > self.max_cameras:
+                self._tracks.popitem(last=False)
+                self.evictions += 1
+        self._tracks.move_to_end(camera_id)
+        track.seen_at = now
+        return track
+
+    def _step(self, track: CameraTrack, count: int, now: float) -> TrackUpdate:
+        occupancy = self._smooth(track, count)
+        publish = (
+            track.published is None
+            or abs(occupancy - track.published) >= self.min_change
+            or now - track.published_at >= self.heartbeat
+        )
+        if publish:
+            track.published = occupancy
+            track.published_at = now
+        return TrackUpdate(occupancy, publish)
+
+    def update(self, camera_id: str, count: int, now: Optional[float] = None) -> TrackUpdate:
+        """Feed one raw count and decide whether to publish the smoothed occupancy."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.updates += 1
+            update = self._step(self._track(camera_id, now), count, now)
+            if update.publish:
+                self.published += 1
+            else:
+                self.suppressed += 1
+            return update
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "method": self.method,
+            "window": self.window,
+            "cameras": len(self._tracks),
+            "updates": self.updates,
+            "published": self.published,
+            "suppressed": self.suppressed,
+            "evictions": self.evictions,
+        }
+
+
+TRACK_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    namespace TEXT NOT NULL,
+    camera_id TEXT NOT NULL,
+    counts TEXT NOT NULL,
+    ema REAL,
+    published INTEGER,
+    published_at REAL NOT NULL,
+    seen_at REAL NOT NULL,
+    PRIMARY KEY (namespace, camera_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tracks_seen ON tracks (namespace, seen_at);
+CREATE TABLE IF NOT EXISTS track_counters (
+    namespace TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (namespace, name)
+) WITHOUT ROWID;
+"""
+
+
+class SharedOccupancyTracker(OccupancyTracker):
+    """
+    OccupancyTracker whose per-camera state lives in a SQLite file shared by all uvicorn workers.
+
+    With several workers each one would otherwise smooth only the frames it
+    happened to receive, a quarter of them with four workers, and their
+    diverging windows would make the published occupancy jump between
+    workers. Here every update reads the camera's track, steps it and writes
+    it back in one transaction, so all workers advance the same window.
+    Tracks of different namespaces (live, replay) are kept apart.
+
+    now defaults to wall-clock time, since the file outlives the processes.
+    """
+
+    def __init__(self, path: str, namespace: str = "live", **kwargs):
+        super().__init__(**kwargs)
+        self.namespace = namespace
+        self.db = SqliteFile(path, TRACK_SCHEMA)
+
+    def _count(self, db, name: str) -> None:
+        db.execute(
+            "INSERT INTO track_counters VALUES (?, ?, 1) "
+            "ON CONFLICT (namespace, name) DO UPDATE SET value = value + 1",
+            (self.namespace, name),
+        )
+
+    def update(self, camera_id: str, count: int, now: Optional[float] = None) -> TrackUpdate:
+        """Feed one raw count and decide whether to publish the smoothed occupancy."""
+        now = time.time() if now is None else now
+        key = (self.namespace, camera_id)
+        with self.db.transaction() as db:
+            row = db.execute(
+                "SELECT counts, ema, published, published_at, seen_at FROM tracks WHERE namespace = ? AND camera_id = ?",
+                key,
+            ).fetchone()
+            track = CameraTrack(self.window)
+            if row is None:
+                (cameras,) = db.execute("SELECT COUNT(*) FROM tracks WHERE namespace = ?", (self.namespace,)).fetchone()
+                if cameras >= self.max_cameras:
+                    db.execute("DELETE FROM tracks WHERE namespace = ? AND camera_id = "
+                               "(SELECT camera_id FROM tracks WHERE namespace = ? ORDER BY seen_at LIMIT 1)",
+                               (self.namespace, self.namespace))
+                    self._count(db, "evictions")
+            elif now - row[4] <= self.idle_ttl:
+                # Stale state from before a long gap would only delay the new readings
+                counts, track.ema, track.published, track.published_at, _ = row
+                track.window.extend(json.loads(counts))
+            track.seen_at = now
+            update = self._step(track, count, now)
+            db.execute(
+                "INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (*key, json.dumps(list(track.window)), track.ema, track.published, track.published_at, now),
+            )
+            self._count(db, "updates")
+            self._count(db, "published" if update.publish else "suppressed")
+        return update
+
+    def snapshot(self) -> Dict[str, Any]:
+        db = self.db.connection()
+        counters = dict(db.execute("SELECT name, value FROM track_counters WHERE namespace = ?", (self.namespace,)))
+        (cameras,) = db.execute("SELECT COUNT(*) FROM tracks WHERE namespace = ?", (self.namespace,)).fetchone()
+        return {
+            "method": self.method,
+            "window": self.window,
+            "cameras": cameras,
+            "updates": counters.get("updates", 0),
+            "published": counters.get("published", 0),
+            "suppressed": counters.get("suppressed", 0),
+            "evictions": counters.get("evictions", 0),
+        }
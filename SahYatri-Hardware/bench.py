@@ -0,0 +1,208 @@
+"""
+Benchmark the capture node on a plain Linux box, without a Pi.
+
+Replays a video file or image directory through the simulated camera and
+LCD, runs the frame producer, MJPEG viewers, capture loop and uploader
+against a local stand-in for the detection service, and reports per-stage
+timings, CPU use and sustained FPS.
+
+    python bench.py --source ../video.mp4 --duration 30 --viewers 2 --output results.json
+
+    # Adaptive capture scheduling instead of a fixed interval, slower API
+    python bench.py --capture-interval 0 --api-latency-ms 200
+
+Set --edge-model to include on-device inference in the capture path.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+# ========================
+# Detection service stand-in
+# ========================
+class StandInDetector:
+    """Local HTTP server answering /detect, /report, /detect/batch and /health like DetectionAI."""
+
+    def __init__(self, latency_ms=50.0, capacity=40):
+        self.requests = {}
+        self.bytes_received = 0
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("X-Backpressure", "0.00")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._reply({"status": "ok"})
+
+            def do_POST(self):
+                path = self.path.split("?")[0]
+                length = int(self.headers.get("Content-Length", 0))
+                self.rfile.read(length)
+                stand_in.bytes_received += length
+                count = stand_in.requests[path] = stand_in.requests.get(path, 0) + 1
+                time.sleep(latency_ms / 1000)
+                if path == "/detect/batch":
+                    self._reply({"status": "success", "count": 0, "results": []})
+                    return
+                # Vary the count so the LCD, dashboard and scheduler see changes
+                occupancy = (count * 7) % (capacity + 5)
+                self._reply({
+                    "camera_id": "bus-1",
+                    "occupancy": occupancy,
+                    "capacity": capacity,
+                    "alert_level": "full" if occupancy >= capacity else "normal",
+                    "status": "success",
+                })
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+
+
+# ========================
+# MJPEG viewers
+# ========================
+class Viewer:
+    """Reads /video_feed in a thread, counting frames and bytes like a browser tab would."""
+
+    def __init__(self, url):
+        self.url = url
+        self.frames = 0
+        self.bytes = 0
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        with requests.get(self.url, stream=True, timeout=10) as response:
+            for chunk in response.iter_content(chunk_size=65536):
+                self.frames += chunk.count(b"--frame\r\n")
+                self.bytes += len(chunk)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", default=os.path.join(HERE, "..", "video.mp4"),
+                        help="video file or image directory replayed as the camera")
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="unmeasured seconds after startup")
+    parser.add_argument("--viewers", type=int, default=1, help="concurrent /video_feed clients")
+    parser.add_argument("--stream-fps", type=float, help="override STREAM_FPS")
+    parser.add_argument("--capture-interval", type=float, default=1.0,
+                        help="fixed seconds between captures; 0 keeps the adaptive scheduler")
+    parser.add_argument("--api-latency-ms", type=float, default=50.0, help="stand-in /detect response time")
+    parser.add_argument("--edge-model", help="ONNX/TFLite model for on-device counting")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    stand_in = StandInDetector(args.api_latency_ms)
+    data_dir = tempfile.mkdtemp(prefix="capture-bench-")
+    # capture.py reads these at import
+    os.environ["SIMULATE_SOURCE"] = os.path.abspath(args.source)
+    os.environ["API_BASE"] = stand_in.url
+    os.environ["DATA_DIR"] = data_dir
+    sys.path.insert(0, HERE)
+    import capture
+    from scheduler import CaptureScheduler
+    from werkzeug.serving import make_server
+
+    if args.capture_interval:
+        interval = args.capture_interval
+        capture.scheduler = CaptureScheduler(interval, interval, interval)
+    if args.stream_fps:
+        capture.producer.interval = 1.0 / args.stream_fps
+    if args.edge_model:
+        capture.EDGE_MODEL_PATH = args.edge_model
+
+    capture.picam2 = capture.initialize_camera()
+    capture.producer.start()
+    capture.initialize_edge_detector()
+    if capture.display:
+        capture.display.start()
+    capture.check_server_health()
+    threading.Thread(target=capture.drain_spool, daemon=True).start()
+    threading.Thread(target=capture.capture_loop, daemon=True).start()
+
+    web = make_server("127.0.0.1", 0, capture.app, threaded=True)
+    threading.Thread(target=web.serve_forever, daemon=True).start()
+    viewers = [Viewer(f"http://127.0.0.1:{web.server_port}/video_feed") for _ in range(args.viewers)]
+
+    print(f"[bench] Warming up for {args.warmup:.0f}s ({args.viewers} viewers, source {args.source})")
+    time.sleep(args.warmup)
+    with capture.telemetry.lock:
+        capture.telemetry.timings.clear()
+        capture.telemetry.counters.clear()
+    frames_before = capture.producer.seq
+    viewed_before = [(viewer.frames, viewer.bytes) for viewer in viewers]
+    lcd_before = capture.display.stats()["writes"] if capture.display else 0
+    cpu_before, wall_before = os.times(), time.monotonic()
+
+    print(f"[bench] Measuring for {args.duration:.0f}s")
+    time.sleep(args.duration)
+
+    cpu_after, elapsed = os.times(), time.monotonic() - wall_before
+    telemetry = capture.telemetry.snapshot()
+    counters = telemetry["counters"]
+    cpu_seconds = (cpu_after.user - cpu_before.user) + (cpu_after.system - cpu_before.system)
+    result = {
+        "duration_s": round(elapsed, 1),
+        "stream_fps": round((capture.producer.seq - frames_before) / elapsed, 1),
+        "viewer_fps": [round((viewer.frames - frames) / elapsed, 1) for viewer, (frames, _) in zip(viewers, viewed_before)],
+        "viewer_mbps": [round((viewer.bytes - sent) * 8 / elapsed / 1e6, 2) for viewer, (_, sent) in zip(viewers, viewed_before)],
+        "uploads_per_min": round(sum(counters.get(f"{kind}_success", 0) for kind in ("upload", "report")) * 60 / elapsed, 1),
+        "upload_failures": sum(counters.get(f"{kind}_failure", 0) for kind in ("upload", "report")),
+        "cpu_percent": round(cpu_seconds / elapsed * 100, 1),
+        "lcd_writes": (capture.display.stats()["writes"] - lcd_before) if capture.display else 0,
+        "timings_ms": telemetry["timings_ms"],
+        "frame_producer_errors": capture.producer.errors,
+    }
+
+    capture.producer.stop()
+    web.shutdown()
+    stand_in.close()
+    shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "host": {"platform": platform.platform(), "cpus": os.cpu_count(), "python": platform.python_version()},
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "stand_in_requests": stand_in.requests,
+        "result": result,
+    }
+    for key, value in result.items():
+        if key != "timings_ms":
+            print(f"[bench] {key}: {value}")
+    for name, timing in sorted(result["timings_ms"].items()):
+        print(f"[bench] {name:>16}: {timing}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[bench] Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,86 +1,144 @@
 import os
+import json
 import time
+import queue
 import threading
 import requests
 import cv2
-import numpy as np
-import geocoder
-from picamera2 import Picamera2
 from datetime import datetime
-from flask import Flask, Response, render_template_string
-from RPLCD.i2c import CharLCD
+from flask import Flask, Response, jsonify, request
+
+from edge import EdgeDetector
+from spool import FrameSpool
+from scheduler import CaptureScheduler
+from frames import FrameProducer
+from telemetry import Telemetry, cpu_temperature, throttle_state
+from state import NodeState, StateStore
+from display import LcdWriter
+from location import LocationService, SerialGpsProvider, ReplayGpsProvider, IpLocationProvider
+from simulate import SimulatedCamera, SimulatedLcd
 
 # ========================
 # Configuration
 # ========================
-API_URL = "http://192.168.137.1:8000/detect"
+# Video file or image directory to replay instead of the Pi camera and LCD (no hardware needed)
+SIMULATE_SOURCE = os.getenv("SIMULATE_SOURCE")
+API_BASE = os.getenv("API_BASE", "http://192.168.137.1:8000")
+API_URL = f"{API_BASE}/detect"
+REPORT_URL = f"{API_BASE}/report"  # Counts made on the Pi
+BATCH_URL = f"{API_BASE}/detect/batch"  # Catch-up uploads of spooled frames
+HEALTH_URL = f"{API_BASE}/health"
+HEALTH_CHECK_INTERVAL = 30  # seconds
+BUSY_STATUSES = (429, 503)  # Server is up but overloaded; back off rather than mark the API down
 CAMERA_ID = "bus-1"
-IMAGE_DIR = "/home/admin/images"
+DATA_DIR = os.getenv("DATA_DIR", "/home/admin")
+IMAGE_DIR = os.path.join(DATA_DIR, "images")
+SPOOL_DIR = os.path.join(DATA_DIR, "spool")  # Frames waiting for the API to come back
 STREAM_PORT = 8001
+STREAM_FPS = 15  # Frames captured, annotated and encoded per second, shared by all viewers
+STREAM_JPEG_QUALITY = 80
+EVENTS_KEEPALIVE = 15  # seconds between keep-alives on an idle /events stream
 I2C_ADDRESS = 0x27  # Common addresses: 0x27 or 0x3F
+LCD_MIN_INTERVAL = 0.5  # seconds between LCD writes; updates in between are coalesced
 MAX_RETRIES = 5
-CAPTURE_INTERVAL = 5  # seconds
-LOCATION_UPDATE_INTERVAL = 60  # Update location every minute
+CAPTURE_INTERVAL = 5  # seconds, starting point for the adaptive scheduler
+CAPTURE_MIN_INTERVAL = 1  # seconds between captures while the bus is busy
+CAPTURE_MAX_INTERVAL = 30  # seconds between captures while nothing changes
+MOTION_SAMPLE_INTERVAL = 1  # seconds between motion checks on the video stream
+JPEG_QUALITY = 90
+ARCHIVE_IMAGES = False  # Also keep every captured frame in IMAGE_DIR (written in the background)
+ARCHIVE_QUEUE_SIZE = 16  # Frames waiting to be written before new ones are dropped
+ARCHIVE_MAX_MB = 2048  # Oldest archived frames are deleted beyond this
+SPOOL_MAX_MB = 512  # Disk budget for frames captured while offline
+SPOOL_MAX_AGE = 24 * 3600  # seconds; older spooled frames are dropped
+DRAIN_BATCH_SIZE = 16  # Spooled frames per /detect/batch upload
+DRAIN_INTERVAL = 2  # seconds between catch-up uploads, so live captures keep priority
+LOCATION_UPDATE_INTERVAL = 5  # seconds between refreshes of the shown location from the cached fix
+GPS_SERIAL_PORT = None if SIMULATE_SOURCE else "/dev/serial0"  # NMEA GPS receiver; None to use IP location only
+GPS_BAUDRATE = 9600
+GPS_REPLAY_FILE = os.getenv("GPS_REPLAY_FILE")  # e.g. "/home/admin/route.nmea" to play back a recorded log instead
+GPS_MAX_FIX_AGE = 10  # seconds before a fix counts as lost
+IP_LOCATION_TTL = 600  # seconds between IP lookups while there is no fix
+DEFAULT_CAPACITY = 40  # Shown until the detection service reports this bus's capacity
+EDGE_MODEL_PATH = None  # e.g. "/home/admin/models/yolov8n_int8.onnx" to count people on the Pi
+EDGE_IMGSZ = 320
+EDGE_MIN_CONFIDENCE = 0.8  # Less sure frames are uploaded for server inference
 os.makedirs(IMAGE_DIR, exist_ok=True)
+os.makedirs(SPOOL_DIR, exist_ok=True)
 
 # ========================
 # System State
 # ========================
-app = Flask(_name_)
+app = Flask(__name__)
 picam2 = None
-current_occupancy = 0
-current_capacity = 40
-last_update = "Not yet updated"
-system_status = "Initializing"
-camera_ready = False
-api_available = False
-location_info = "Locating..."
-last_location_update = "Never"
+edge_detector = None
+archive_queue = queue.Queue(maxsize=ARCHIVE_QUEUE_SIZE)
+archive = FrameSpool(IMAGE_DIR, max_bytes=ARCHIVE_MAX_MB * 1024 * 1024, max_age=float("inf"))
+spool = FrameSpool(SPOOL_DIR, max_bytes=SPOOL_MAX_MB * 1024 * 1024, max_age=SPOOL_MAX_AGE)
+scheduler = CaptureScheduler(CAPTURE_MIN_INTERVAL, CAPTURE_MAX_INTERVAL, CAPTURE_INTERVAL)
+telemetry = Telemetry()
+# Occupancy, status, location and readiness; read with state.current, change with state.update()
+state = StateStore(NodeState(capacity=DEFAULT_CAPACITY))
 
 # ========================
 # Initialize Hardware
 # ========================
 try:
-    lcd = CharLCD('PCF8574', I2C_ADDRESS)
+    if SIMULATE_SOURCE:
+        lcd = SimulatedLcd()
+    else:
+        from RPLCD.i2c import CharLCD
+        lcd = CharLCD('PCF8574', I2C_ADDRESS)
     lcd.clear()
     lcd.write_string("System Startup")
 except Exception as e:
     print(f"[!] LCD initialization failed: {e}")
     lcd = None
+display = LcdWriter(lcd, min_interval=LCD_MIN_INTERVAL) if lcd else None
 
 # ========================
 # GPS/Location Functions
 # ========================
-def get_ip_location():
-    global location_info, last_location_update
-    try:
-        g = geocoder.ip('me')
-        if g.ok:
-            location_info = f"{g.city}, {g.country}"
-            last_location_update = datetime.now().strftime("%H:%M:%S")
-            print(f"[GPS] Location updated: {location_info}")
-        else:
-            location_info = "Location unknown"
-            print("[!] GPS: Could not get location data")
-    except Exception as e:
-        print(f"[!] GPS Error: {e}")
-        location_info = "GPS Error"
+if GPS_REPLAY_FILE:
+    gps = ReplayGpsProvider(GPS_REPLAY_FILE)
+elif GPS_SERIAL_PORT:
+    gps = SerialGpsProvider(GPS_SERIAL_PORT, GPS_BAUDRATE)
+else:
+    gps = None
+# GPS fix when there is one, IP geolocation only without
+locator = LocationService(gps, None if SIMULATE_SOURCE else IpLocationProvider(), GPS_MAX_FIX_AGE, IP_LOCATION_TTL)
+
+def update_location():
+    """Show the cached position; never waits on the GPS or the network."""
+    fix = locator.current()
+    if fix is None:
+        return
+    state.update(location=fix.label,
+                 location_update=datetime.fromtimestamp(fix.received_at).strftime("%H:%M:%S"))
+
+def location_fields():
+    """lat/lon of a live GPS fix for an upload; nothing when the fix is stale or only IP based."""
+    fix = locator.fresh()
+    return {"lat": round(fix.latitude, 6), "lon": round(fix.longitude, 6)} if fix else {}
 
 def location_updater():
     while True:
-        get_ip_location()
-        update_lcd()  # Update LCD with new location info
+        update_location()
         time.sleep(LOCATION_UPDATE_INTERVAL)
 
 # ========================
 # Camera Functions
 # ========================
 def initialize_camera():
-    global picam2, camera_ready
+    global picam2
 
     for attempt in range(MAX_RETRIES):
         try:
-            picam2 = Picamera2()
+            if SIMULATE_SOURCE:
+                picam2 = SimulatedCamera(SIMULATE_SOURCE)
+            else:
+                from picamera2 import Picamera2
+                picam2 = Picamera2()
             video_config = picam2.create_video_configuration(
                 main={"size": (640, 480)},
                 controls={"FrameRate": 30}
@@ -88,7 +146,7 @@ def initialize_camera():
             picam2.configure(video_config)
             picam2.start()
             time.sleep(2)  # Camera warm-up
-            camera_ready = True
+            state.update(camera_ready=True)
             print("[+] Camera initialized successfully")
             return picam2
         except Exception as e:
@@ -100,367 +158,625 @@ def initialize_camera():
 # ========================
 # Core Functions
 # ========================
-def update_system_status(occupancy, capacity):
-    global current_occupancy, current_capacity, last_update, system_status
-    current_occupancy = occupancy
-    current_capacity = capacity
-    last_update = datetime.now().strftime("%H:%M:%S")
-
-    if occupancy >= capacity:
-        system_status = "FULL!"
-    elif occupancy >= capacity * 0.8:
-        system_status = "NEAR FULL"
+def update_system_status(occupancy, capacity, alert_level=None):
+    # Prefer the alert level from the server's per-bus rules
+    if alert_level == "full" or (alert_level is None and occupancy >= capacity):
+        status = "FULL!"
+    elif alert_level == "near_full" or (alert_level is None and occupancy >= capacity * 0.8):
+        status = "NEAR FULL"
     else:
-        system_status = "OK"
+        status = "OK"
 
-    update_lcd()
+    state.update(occupancy=occupancy, capacity=capacity, status=status,
+                 last_update=datetime.now().strftime("%H:%M:%S"))
 
-def update_lcd():
-    if not lcd:
+def update_lcd(snapshot):
+    """Hand the display worker the lines for a state snapshot; never blocks on I2C."""
+    if not display:
         return
+    status = snapshot.status.replace(" ", "")  # Remove spaces for LCD
+    # First line: Occupancy and status; second line: Location (cut to the LCD's 16 columns)
+    display.show([f"Occ:{snapshot.occupancy}/{snapshot.capacity} {status}", snapshot.location])
 
+state.subscribe(update_lcd)
+
+def initialize_edge_detector():
+    global edge_detector
+    if not EDGE_MODEL_PATH:
+        return
     try:
-        lcd.clear()
-        status = system_status.replace(" ", "")  # Remove spaces for LCD
-        # First line: Occupancy and status
-        lcd.write_string(f"Occ:{current_occupancy}/{current_capacity} {status}")
-        # Second line: Location (truncated if too long)
-        lcd.cursor_pos = (1, 0)
-        location_short = location_info[:16]  # LCD typically has 16 columns
-        lcd.write_string(location_short)
+        edge_detector = EdgeDetector(EDGE_MODEL_PATH, imgsz=EDGE_IMGSZ)
+        print(f"[+] On-device counting enabled ({edge_detector.name})")
     except Exception as e:
-        print(f"[!] LCD update error: {e}")
+        print(f"[!] Edge model load failed, using server inference only: {e}")
+        edge_detector = None
 
-def capture_and_process_image():
-    if not camera_ready:
+def observe_backpressure(response):
+    """Pass the server's load hints on to the capture scheduler."""
+    try:
+        retry_after = float(response.headers.get("Retry-After", 0))
+        scheduler.observe_backpressure(float(response.headers.get("X-Backpressure", 0)), retry_after)
+    except ValueError:
+        pass
+
+def record_upload(kind, started, error=None):
+    """Time a call to the detection service and derive API availability from its outcome."""
+    telemetry.time(kind, (time.monotonic() - started) * 1000)
+    telemetry.upload_result(kind, error is None, str(error) if error else None)
+    # A 4xx means the service is up but refused this request, and 429/503 that it
+    # is busy; observe_backpressure has already slowed capture down for those
+    state.update(api_available=error is None or (
+        isinstance(error, requests.exceptions.HTTPError)
+        and error.response is not None
+        and (error.response.status_code < 500 or error.response.status_code in BUSY_STATUSES)
+    ))
+
+def report_edge_count(frame):
+    """Count people on the Pi and report only the number; False if the server should count."""
+    result = edge_detector.count(frame[:, :, :3])
+    if result.confidence < EDGE_MIN_CONFIDENCE:
+        print(f"[EDGE] Unsure ({result.ambiguous}/{result.count} ambiguous), asking the server")
         return False
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{CAMERA_ID}_{timestamp}.jpg"
-    image_path = os.path.join(IMAGE_DIR, filename)
+    report = {
+        "camera_id": CAMERA_ID,
+        "occupancy": result.count,
+        "confidence": round(result.confidence, 3),
+        "model": edge_detector.name,
+        "inference_ms": round(result.inference_ms, 1),
+        **location_fields(),
+    }
+    telemetry.time("edge_inference", result.inference_ms)
+    started = time.monotonic()
+    try:
+        response = requests.post(REPORT_URL, json=report, timeout=10)
+        observe_backpressure(response)
+        response.raise_for_status()
+        record_upload("report", started)
+        data = response.json()
+        print(f"[EDGE] Reported {result.count} people ({result.inference_ms:.0f}ms): {data}")
+        update_system_status(data["occupancy"], data["capacity"], data.get("alert_level"))
+        return True
+    except requests.exceptions.RequestException as e:
+        record_upload("report", started, e)
+        print(f"[!] Count report failed: {e}")
+        return False
 
+def frame_to_bgr(frame):
+    """Picamera2 video frames are RGB (or RGBX); OpenCV wants BGR."""
+    return cv2.cvtColor(frame, cv2.COLOR_RGBA2BGR if frame.shape[2] == 4 else cv2.COLOR_RGB2BGR)
+
+def encode_jpeg(frame):
+    started = time.monotonic()
+    ret, buffer = cv2.imencode('.jpg', frame_to_bgr(frame), [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    if not ret:
+        raise Exception("Frame encoding failed")
+    telemetry.time("encode", (time.monotonic() - started) * 1000)
+    return buffer.tobytes()
+
+def archive_image(filename, jpeg, captured_at):
+    """Queue a JPEG for the archive writer; dropped rather than stalling capture."""
     try:
-        # Capture high-quality still image
-        still_config = picam2.create_still_configuration()
-        picam2.switch_mode_and_capture_file(still_config, image_path)
-        print(f"[+] Captured {filename}")
+        archive_queue.put_nowait((filename, jpeg, captured_at))
+    except queue.Full:
+        print(f"[!] Archive queue full, not saving {filename}")
 
-        # Send to API
-        with open(image_path, "rb") as img_file:
-            files = {"image": (filename, img_file, "image/jpeg")}
-            params = {"camera_id": CAMERA_ID}
+def archive_writer():
+    while True:
+        filename, jpeg, captured_at = archive_queue.get()
+        try:
+            archive.put(CAMERA_ID, jpeg, captured_at)
+        except OSError as e:
+            print(f"[!] Archive write failed for {filename}: {e}")
 
-            try:
-                response = requests.post(API_URL, files=files, params=params, timeout=10)
+def spool_frame(jpeg, captured_at):
+    """Keep a frame that could not be uploaded until the API is back."""
+    try:
+        spool.put(CAMERA_ID, jpeg, captured_at)
+        print(f"[SPOOL] Stored frame for later upload ({len(spool)} pending)")
+    except OSError as e:
+        print(f"[!] Spool write failed: {e}")
+
+def drain_spool():
+    """Upload spooled frames through /detect/batch, oldest first, once the API is reachable."""
+    batch_size = DRAIN_BATCH_SIZE
+    while True:
+        time.sleep(DRAIN_INTERVAL)
+        if not state.current.api_available or not len(spool):
+            continue
+        batch = spool.peek(batch_size)
+        if not batch:
+            continue
+
+        files = [("images", (frame.name, jpeg, "image/jpeg")) for frame, jpeg in batch]
+        metadata = [{"camera_id": frame.camera_id, "timestamp": frame.timestamp} for frame, _ in batch]
+        started = time.monotonic()
+        try:
+            response = requests.post(BATCH_URL, files=files, data={"metadata": json.dumps(metadata)}, timeout=60)
+            if response.status_code in BUSY_STATUSES:
+                # Server is busy, not down; back off as asked and keep the frames
+                telemetry.time("batch_upload", (time.monotonic() - started) * 1000)
+                telemetry.count("spool_busy")
+                observe_backpressure(response)
+                try:
+                    time.sleep(float(response.headers.get("Retry-After", DRAIN_INTERVAL)))
+                except ValueError:
+                    pass
+                continue
+            if response.status_code == 413 and len(batch) > 1:
+                batch_size = max(1, len(batch) // 2)
+                print(f"[SPOOL] Batch of {len(batch)} frames too large, sending {batch_size} at a time")
+                telemetry.time("batch_upload", (time.monotonic() - started) * 1000)
+                telemetry.count("spool_split")
+                continue
+            if response.status_code in (400, 413, 422):
+                # The frames themselves are refused (a lone frame over the size limit included)
+                print(f"[!] Spooled batch rejected (HTTP {response.status_code}), dropping {len(batch)} frames")
+                telemetry.count("spool_dropped", len(batch))
+            else:
+                # Other 4xx (408 and the like) and 5xx keep the frames for the next round
                 response.raise_for_status()
+                print(f"[SPOOL] Uploaded {len(batch)} spooled frames, {len(spool) - len(batch)} left")
+                telemetry.count("spool_uploaded", len(batch))
+            record_upload("batch_upload", started)
+            spool.discard([frame for frame, _ in batch])
+        except requests.exceptions.RequestException as e:
+            record_upload("batch_upload", started, e)
+            print(f"[!] Spooled upload failed: {e}")
+
+def capture_and_process_image(frame=None):
+    if not state.current.camera_ready:
+        return False
 
-                data = response.json()
-                print(f"[+] Detection result: {data}")
-                update_system_status(data["occupancy"], data["capacity"])
-                return True
+    captured_at = time.time()
+    timestamp = datetime.fromtimestamp(captured_at).strftime("%Y%m%d_%H%M%S")
+    filename = f"{CAMERA_ID}_{timestamp}.jpg"
 
-            except requests.exceptions.RequestException as e:
-                print(f"[!] API request failed: {e}")
+    try:
+        # Take the newest frame of the running video stream, no still-mode switch
+        if frame is None:
+            latest = producer.latest()
+            if latest is None:
                 return False
+            frame = latest.raw
+        print(f"[+] Captured {filename}")
+
+        # Encode once; the same bytes are archived and uploaded
+        jpeg = None
+        if ARCHIVE_IMAGES:
+            jpeg = encode_jpeg(frame)
+            archive_image(filename, jpeg, captured_at)
+
+        # Count on the Pi when possible; the server only sees uncertain frames
+        if edge_detector and report_edge_count(frame):
+            return True
+
+        # Send to API straight from memory
+        if jpeg is None:
+            jpeg = encode_jpeg(frame)
+        files = {"image": (filename, jpeg, "image/jpeg")}
+        params = {"camera_id": CAMERA_ID, **location_fields()}
+
+        started = time.monotonic()
+        try:
+            response = requests.post(API_URL, files=files, params=params, timeout=10)
+            observe_backpressure(response)
+            response.raise_for_status()
+            record_upload("upload", started)
+
+            data = response.json()
+            print(f"[+] Detection result: {data}")
+            update_system_status(data["occupancy"], data["capacity"], data.get("alert_level"))
+            return True
+
+        except requests.exceptions.RequestException as e:
+            print(f"[!] API request failed: {e}")
+            record_upload("upload", started, e)
+            spool_frame(jpeg, captured_at)
+            return False
 
     except Exception as e:
         print(f"[!] Image capture/processing error: {e}")
         return False
 
-# ========================
-# Video Streaming
-# ========================
-def generate_frames():
+def capture_loop():
+    """Check the stream for motion every second and capture when the scheduler says so."""
+    last_capture = 0.0
+    last_interval = None
     while True:
-        if not camera_ready:
-            time.sleep(1)
-            continue
-
         try:
-            # Capture frame
-            frame = picam2.capture_array()
-
-            # Convert color space (PiCamera uses RGB, OpenCV uses BGR)
-            frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-
-            # Add information overlay
-            overlay_height = 120  # Increased height for GPS info
-            overlay = np.zeros((overlay_height, frame.shape[1], 3), dtype=np.uint8)
-            cv2.rectangle(overlay, (0,0), (frame.shape[1], overlay_height), (0,0,0), -1)
-
-            # Add text to overlay
-            info_text = f"Occupancy: {current_occupancy}/{current_capacity}"
-            status_text = f"Status: {system_status} | Last Update: {last_update}"
-            location_text = f"Location: {location_info}"
-            update_text = f"GPS Updated: {last_location_update}"
-            camera_text = f"Camera: {CAMERA_ID}"
-
-            cv2.putText(frame, info_text, (10, 30),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-            cv2.putText(frame, status_text, (10, 60),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-            cv2.putText(frame, location_text, (10, 90),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-            cv2.putText(frame, update_text, (10, 110),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.4, (200, 200, 200), 1)
-            cv2.putText(frame, camera_text, (frame.shape[1]-200, 30),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.4, (200, 200, 200), 1)
-
-            # Encode frame
-            ret, buffer = cv2.imencode('.jpg', frame)
-            if not ret:
-                raise Exception("Frame encoding failed")
-
-            frame_bytes = buffer.tobytes()
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-
+            latest = producer.latest()
+            frame = latest.raw if latest is not None else None
+            if frame is not None:
+                scheduler.observe_frame(frame)
+            if time.monotonic() >= scheduler.next_capture(last_capture):
+                last_capture = time.monotonic()
+                if capture_and_process_image(frame):
+                    scheduler.observe_occupancy(state.current.occupancy)
+            interval = round(scheduler.interval)
+            if interval != last_interval:
+                print(f"[SCHED] Capturing every {scheduler.interval:.1f}s ({scheduler.stats()})")
+                last_interval = interval
         except Exception as e:
-            print(f"[!] Frame generation error: {e}")
-            time.sleep(1)
+            print(f"[!] Capture loop error: {e}")
+        time.sleep(MOTION_SAMPLE_INTERVAL)
+
+# ========================
+# Video Streaming
+# ========================
+def annotate_frame(raw):
+    """BGR copy of a camera frame with the status overlay drawn on it."""
+    frame = frame_to_bgr(raw)
+    snapshot = state.current
+
+    info_text = f"Occupancy: {snapshot.occupancy}/{snapshot.capacity}"
+    status_text = f"Status: {snapshot.status} | Last Update: {snapshot.last_update}"
+    location_text = f"Location: {snapshot.location}"
+    update_text = f"GPS Updated: {snapshot.location_update}"
+    camera_text = f"Camera: {CAMERA_ID}"
+
+    cv2.putText(frame, info_text, (10, 30),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+    cv2.putText(frame, status_text, (10, 60),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+    cv2.putText(frame, location_text, (10, 90),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+    cv2.putText(frame, update_text, (10, 110),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.4, (200, 200, 200), 1)
+    cv2.putText(frame, camera_text, (frame.shape[1]-200, 30),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.4, (200, 200, 200), 1)
+    return frame
+
+# One camera reader for the MJPEG viewers and the capture loop
+producer = FrameProducer(
+    lambda: picam2.capture_array("main"),
+    annotate_frame,
+    fps=STREAM_FPS,
+    quality=STREAM_JPEG_QUALITY,
+    timings=telemetry.time,
+    idle_fps=1 / MOTION_SAMPLE_INTERVAL,  # Enough for the capture loop while nobody watches the stream
+)
 
 @app.route('/video_feed')
 def video_feed():
-    return Response(generate_frames(),
+    return Response(producer.stream(),
                    mimetype='multipart/x-mixed-replace; boundary=frame')
 
 # ========================
 # System Monitoring
 # ========================
-def monitor_system():
-    global api_available
+def check_server_health():
+    """Ask the detection service's /health whether it is ready to count."""
+    started = time.monotonic()
+    try:
+        response = requests.get(HEALTH_URL, timeout=5)
+        body = response.json() if response.headers.get("content-type", "").startswith("application/json") else {}
+        telemetry.server_health = {"http": response.status_code, "status": body.get("status"), "checked": time.time()}
+        state.update(api_available=response.status_code == 200)
+    except requests.exceptions.RequestException as e:
+        telemetry.server_health = {"http": None, "status": "unreachable", "error": str(e), "checked": time.time()}
+        state.update(api_available=False)
+    telemetry.time("health", (time.monotonic() - started) * 1000)
+    return telemetry.server_health
+
+def disk_status():
+    stat = os.statvfs(SPOOL_DIR)
+    return {
+        "free_bytes": stat.f_bavail * stat.f_frsize,
+        "spool_bytes": spool.bytes,
+        "spool_budget_bytes": spool.max_bytes,
+        "archive_bytes": archive.bytes,
+        "archive_budget_bytes": archive.max_bytes,
+    }
 
+def monitor_system():
     while True:
         try:
-            # Check API availability with HEAD request
-            try:
-                response = requests.head(API_URL, timeout=5)
-                api_available = response.status_code < 400
-                status = "Connected" if api_available else "Disconnected"
-                print(f"[SYSTEM] API Status: {status} (HTTP {response.status_code})")
-            except Exception as e:
-                api_available = False
-                print(f"[!] API check failed: {e}")
-
-            # Check disk space
-            stat = os.statvfs(IMAGE_DIR)
-            free_gb = (stat.f_bavail * stat.f_frsize) / (1024**3)
-            print(f"[SYSTEM] Disk Space: {free_gb:.2f}GB free")
-
-            # Check camera status
-            print(f"[SYSTEM] Camera Status: {'Ready' if camera_ready else 'Not ready'}")
-
+            health = check_server_health()
+            snapshot = state.current
+            print(f"[SYSTEM] API: {'Connected' if snapshot.api_available else 'Disconnected'} ({health})")
+            disk = disk_status()
+            print(f"[SYSTEM] Disk Space: {disk['free_bytes'] / (1024**3):.2f}GB free, "
+                  f"spool {len(spool)} frames, temperature {cpu_temperature()}C")
+            print(f"[SYSTEM] Camera Status: {'Ready' if snapshot.camera_ready else 'Not ready'} ({producer.stats()})")
         except Exception as e:
             print(f"[!] System monitor error: {e}")
 
-        time.sleep(30)
+        time.sleep(HEALTH_CHECK_INTERVAL)
+
+@app.route('/status')
+def status():
+    """Current state of the node: occupancy, API health, camera and capture schedule."""
+    snapshot = state.current
+    return jsonify({
+        "camera_id": CAMERA_ID,
+        "status": snapshot.status,
+        "occupancy": snapshot.occupancy,
+        "capacity": snapshot.capacity,
+        "last_update": snapshot.last_update,
+        "location": snapshot.location,
+        "api": {"available": snapshot.api_available, **telemetry.api_status()},
+        "camera": {"ready": snapshot.camera_ready, **producer.stats()},
+        "capture": scheduler.stats(),
+        "gps": locator.stats(),
+        "edge_model": edge_detector.name if edge_detector else None,
+    })
+
+@app.route('/metrics')
+def metrics():
+    """Counters and timings of capture, encoding and uploads, plus queue, disk and SoC health."""
+    return jsonify({
+        **telemetry.snapshot(),
+        "camera": producer.stats(),
+        "capture": scheduler.stats(),
+        "queues": {"spool": spool.stats(), "archive_pending": archive_queue.qsize()},
+        "disk": disk_status(),
+        "cpu_temperature_c": cpu_temperature(),
+        "throttle": throttle_state(),
+        "lcd": display.stats() if display else None,
+    })
 
 # ========================
 # Web Dashboard
 # ========================
-@app.route('/')
-def dashboard():
-    """Web dashboard with live video and status"""
-    status_class = system_status.lower().replace(" ", "-")
-    current_time = datetime.now().strftime('%H:%M:%S')
-
-    return render_template_string('''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Bus Monitoring System</title>
-        <meta name="viewport" content="width=device-width, initial-scale=1">
-        <style>
-            body {
-                font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                margin: 0;
-                padding: 20px;
-                background-color: #f5f5f5;
-                color: #333;
-            }
-            .header {
-                text-align: center;
-                margin-bottom: 20px;
-                padding-bottom: 10px;
-                border-bottom: 2px solid #ddd;
-            }
+# Compiled once at import; the page then follows /events instead of reloading
+DASHBOARD_TEMPLATE = app.jinja_env.from_string('''
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Bus Monitoring System</title>
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    <style>
+        body {
+            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+            margin: 0;
+            padding: 20px;
+            background-color: #f5f5f5;
+            color: #333;
+        }
+        .header {
+            text-align: center;
+            margin-bottom: 20px;
+            padding-bottom: 10px;
+            border-bottom: 2px solid #ddd;
+        }
+        .container {
+            display: flex;
+            flex-wrap: wrap;
+            gap: 20px;
+            justify-content: center;
+        }
+        .video-panel {
+            flex: 2;
+            min-width: 640px;
+            background: white;
+            border-radius: 8px;
+            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
+            padding: 15px;
+        }
+        .status-panel {
+            flex: 1;
+            min-width: 300px;
+            background: white;
+            border-radius: 8px;
+            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
+            padding: 20px;
+        }
+        .status-item {
+            margin-bottom: 15px;
+            padding-bottom: 15px;
+            border-bottom: 1px solid #eee;
+        }
+        .location-item {
+            margin-bottom: 15px;
+            padding-bottom: 15px;
+            border-bottom: 1px solid #eee;
+        }
+        .status-label {
+            font-weight: bold;
+            color: #666;
+            display: block;
+            margin-bottom: 5px;
+        }
+        .status-value {
+            font-size: 1.2em;
+        }
+        .ok { color: #4CAF50; }
+        .near-full { color: #FFC107; }
+        .full { color: #F44336; }
+        .video-container {
+            position: relative;
+            padding-top: 56.25%; /* 16:9 Aspect Ratio */
+        }
+        .video-stream {
+            position: absolute;
+            top: 0;
+            left: 0;
+            width: 100%;
+            height: 100%;
+        }
+        .buttons {
+            margin-top: 20px;
+            display: flex;
+            gap: 10px;
+        }
+        button {
+            padding: 10px 15px;
+            background: #2196F3;
+            color: white;
+            border: none;
+            border-radius: 4px;
+            cursor: pointer;
+            font-size: 0.9em;
+        }
+        button:hover {
+            background: #0b7dda;
+        }
+        .timestamp {
+            font-size: 0.9em;
+            color: #888;
+            text-align: right;
+            margin-top: 10px;
+        }
+        .location-map {
+            width: 100%;
+            height: 200px;
+            background-color: #eee;
+            margin-top: 10px;
+            border-radius: 4px;
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            color: #666;
+        }
+        @media (max-width: 768px) {
             .container {
-                display: flex;
-                flex-wrap: wrap;
-                gap: 20px;
-                justify-content: center;
-            }
-            .video-panel {
-                flex: 2;
-                min-width: 640px;
-                background: white;
-                border-radius: 8px;
-                box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-                padding: 15px;
-            }
-            .status-panel {
-                flex: 1;
-                min-width: 300px;
-                background: white;
-                border-radius: 8px;
-                box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-                padding: 20px;
-            }
-            .status-item {
-                margin-bottom: 15px;
-                padding-bottom: 15px;
-                border-bottom: 1px solid #eee;
-            }
-            .location-item {
-                margin-bottom: 15px;
-                padding-bottom: 15px;
-                border-bottom: 1px solid #eee;
-            }
-            .status-label {
-                font-weight: bold;
-                color: #666;
-                display: block;
-                margin-bottom: 5px;
-            }
-            .status-value {
-                font-size: 1.2em;
+                flex-direction: column;
             }
-            .ok { color: #4CAF50; }
-            .near-full { color: #FFC107; }
-            .full { color: #F44336; }
-            .video-container {
-                position: relative;
-                padding-top: 56.25%; /* 16:9 Aspect Ratio */
+            .video-panel, .status-panel {
+                min-width: 100%;
             }
-            .video-stream {
-                position: absolute;
-                top: 0;
-                left: 0;
-                width: 100%;
-                height: 100%;
-            }
-            .buttons {
-                margin-top: 20px;
-                display: flex;
-                gap: 10px;
-            }
-            button {
-                padding: 10px 15px;
-                background: #2196F3;
-                color: white;
-                border: none;
-                border-radius: 4px;
-                cursor: pointer;
-                font-size: 0.9em;
-            }
-            button:hover {
-                background: #0b7dda;
-            }
-            .timestamp {
-                font-size: 0.9em;
-                color: #888;
-                text-align: right;
-                margin-top: 10px;
-            }
-            .location-map {
-                width: 100%;
-                height: 200px;
-                background-color: #eee;
-                margin-top: 10px;
-                border-radius: 4px;
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                color: #666;
-            }
-            @media (max-width: 768px) {
-                .container {
-                    flex-direction: column;
-                }
-                .video-panel, .status-panel {
-                    min-width: 100%;
-                }
-            }
-        </style>
-    </head>
-    <body>
-        <div class="header">
-            <h1>Bus Occupancy Monitoring System</h1>
-        </div>
-
-        <div class="container">
-            <div class="video-panel">
-                <div class="video-container">
-                    <img src="/video_feed" class="video-stream">
-                </div>
-                <div class="timestamp">
-                    System refresh: {{ current_time }}
-                </div>
+        }
+    </style>
+</head>
+<body>
+    <div class="header">
+        <h1>Bus Occupancy Monitoring System</h1>
+    </div>
+
+    <div class="container">
+        <div class="video-panel">
+            <div class="video-container">
+                <img src="/video_feed" class="video-stream">
             </div>
+            <div class="timestamp">
+                Last change: <span id="changed">{{ current_time }}</span>
+                <span id="connection"></span>
+            </div>
+        </div>
 
-            <div class="status-panel">
-                <h2>System Status</h2>
+        <div class="status-panel">
+            <h2>System Status</h2>
 
-                <div class="status-item">
-                    <span class="status-label">Camera ID</span>
-                    <span class="status-value">{{ camera_id }}</span>
-                </div>
+            <div class="status-item">
+                <span class="status-label">Camera ID</span>
+                <span class="status-value">{{ state.camera_id }}</span>
+            </div>
 
-                <div class="status-item">
-                    <span class="status-label">Occupancy</span>
-                    <span class="status-value">{{ occupancy }}/{{ capacity }}</span>
-                </div>
+            <div class="status-item">
+                <span class="status-label">Occupancy</span>
+                <span class="status-value"><span id="occupancy">{{ state.occupancy }}</span>/<span id="capacity">{{ state.capacity }}</span></span>
+            </div>
 
-                <div class="status-item">
-                    <span class="status-label">Status</span>
-                    <span class="status-value {{ status_class }}">{{ status }}</span>
-                </div>
+            <div class="status-item">
+                <span class="status-label">Status</span>
+                <span id="status" class="status-value {{ state.status_class }}">{{ state.status }}</span>
+            </div>
 
-                <div class="location-item">
-                    <span class="status-label">Current Location</span>
-                    <span class="status-value">{{ location }}</span>
-                    <span class="status-label" style="font-size:0.8em">Last Updated: {{ location_update }}</span>
-                    <div class="location-map">
-                        Map View<br>({{ location }})
-                    </div>
+            <div class="location-item">
+                <span class="status-label">Current Location</span>
+                <span id="location" class="status-value">{{ state.location }}</span>
+                <span class="status-label" style="font-size:0.8em">Last Updated: <span id="location_update">{{ state.location_update }}</span></span>
+                <div class="location-map">
+                    Map View<br>(<span id="map_location">{{ state.location }}</span>)
                 </div>
+            </div>
 
-                <div class="status-item">
-                    <span class="status-label">Last Update</span>
-                    <span class="status-value">{{ last_update }}</span>
-                </div>
+            <div class="status-item">
+                <span class="status-label">Last Update</span>
+                <span id="last_update" class="status-value">{{ state.last_update }}</span>
+            </div>
 
-                <div class="status-item">
-                    <span class="status-label">API Status</span>
-                    <span class="status-value">{{ "Connected" if api_available else "Disconnected" }}</span>
-                </div>
+            <div class="status-item">
+                <span class="status-label">API Status</span>
+                <span id="api" class="status-value">{{ "Connected" if state.api_available else "Disconnected" }}</span>
+            </div>
 
-                <div class="buttons">
-                    <button onclick="location.reload()">Refresh</button>
-                    <button onclick="window.open('/video_feed', '_blank')">Fullscreen Video</button>
-                </div>
+            <div class="buttons">
+                <button onclick="refresh()">Refresh</button>
+                <button onclick="window.open('/video_feed', '_blank')">Fullscreen Video</button>
             </div>
         </div>
+    </div>
+
+    <script>
+        // Update the page in place from /events; the video stream is never reopened
+        function show(state) {
+            document.getElementById("occupancy").textContent = state.occupancy;
+            document.getElementById("capacity").textContent = state.capacity;
+            var status = document.getElementById("status");
+            status.textContent = state.status;
+            status.className = "status-value " + state.status_class;
+            document.getElementById("location").textContent = state.location;
+            document.getElementById("map_location").textContent = state.location;
+            document.getElementById("location_update").textContent = state.location_update;
+            document.getElementById("last_update").textContent = state.last_update;
+            document.getElementById("api").textContent = state.api_available ? "Connected" : "Disconnected";
+            document.getElementById("changed").textContent = new Date().toLocaleTimeString();
+        }
+
+        function refresh() {
+            fetch("/events?once=1").then(function (r) { return r.json(); }).then(show);
+        }
+
+        var connection = document.getElementById("connection");
+        if (window.EventSource) {
+            var events = new EventSource("/events");
+            events.onmessage = function (e) { show(JSON.parse(e.data)); };
+            events.onopen = function () { connection.textContent = ""; };
+            events.onerror = function () { connection.textContent = "(reconnecting)"; };
+        } else {
+            // No SSE support: fall back to polling the same state as JSON
+            setInterval(refresh, 15000);
+        }
+    </script>
+</body>
+</html>
+''')
+
+def dashboard_state(snapshot):
+    """The fields the dashboard shows, as sent to /events."""
+    return {
+        "camera_id": CAMERA_ID,
+        "occupancy": snapshot.occupancy,
+        "capacity": snapshot.capacity,
+        "status": snapshot.status,
+        "status_class": snapshot.status.lower().replace(" ", "-").rstrip("!"),
+        "last_update": snapshot.last_update,
+        "location": snapshot.location,
+        "location_update": snapshot.location_update,
+        "api_available": snapshot.api_available,
+    }
+
+def dashboard_events():
+    """Server-Sent Events generator for one viewer: the state whenever it changes, else keep-alives."""
+    snapshot = state.current
+    sent = dashboard_state(snapshot)
+    yield f"data: {json.dumps(sent)}\n\n"
+    while True:
+        newer = state.wait_newer(snapshot.version, EVENTS_KEEPALIVE)
+        if newer is None:
+            # Keeps proxies and the browser from timing out an idle stream
+            yield ": keep-alive\n\n"
+            continue
+        snapshot = newer
+        current = dashboard_state(snapshot)
+        if current != sent:
+            sent = current
+            yield f"data: {json.dumps(sent)}\n\n"
 
-        <script>
-            // Auto-refresh every 15 seconds
-            setTimeout(function() {
-                location.reload();
-            }, 15000);
-        </script>
-    </body>
-    </html>
-    ''',
-    camera_id=CAMERA_ID,
-    occupancy=current_occupancy,
-    capacity=current_capacity,
-    status=system_status,
-    status_class=status_class,
-    last_update=last_update,
-    api_available=api_available,
-    current_time=current_time,
-    location=location_info,
-    location_update=last_location_update)
+@app.route('/')
+def dashboard():
+    """Web dashboard with live video and status"""
+    return DASHBOARD_TEMPLATE.render(state=dashboard_state(state.current), current_time=datetime.now().strftime('%H:%M:%S'))
+
+@app.route('/events')
+def events():
+    """Dashboard state as an SSE stream, or as one JSON object with ?once=1."""
+    if request.args.get("once"):
+        return jsonify(dashboard_state(state.current))
+    return Response(dashboard_events(), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # ========================
 # Main Execution
@@ -471,11 +787,15 @@ def main():
     try:
         # Initialize hardware
         picam2 = initialize_camera()
-        if lcd:
-            update_lcd()
+        producer.start()
+        initialize_edge_detector()
+        if display:
+            display.start()
+            update_lcd(state.current)
 
-        # Initial location update
-        get_ip_location()
+        # Start the GPS reader and show whatever position is known
+        locator.start()
+        update_location()
 
         # Start system monitor thread
         threading.Thread(target=monitor_system, daemon=True).start()
@@ -483,12 +803,14 @@ def main():
         # Start location updater thread
         threading.Thread(target=location_updater, daemon=True).start()
 
-        # Start periodic capture thread
-        def capture_loop():
-            while True:
-                capture_and_process_image()
-                time.sleep(CAPTURE_INTERVAL)
+        # Start spool drainer thread
+        threading.Thread(target=drain_spool, daemon=True).start()
+
+        # Start archive writer thread
+        if ARCHIVE_IMAGES:
+            threading.Thread(target=archive_writer, daemon=True).start()
 
+        # Start adaptive capture thread
         threading.Thread(target=capture_loop, daemon=True).start()
 
         # Start web interface
@@ -500,12 +822,15 @@ def main():
     except Exception as e:
         print(f"[!] Fatal error: {e}")
     finally:
+        producer.stop()
         if picam2:
             picam2.close()
+        if display:
+            display.stop()
         if lcd:
             lcd.clear()
             lcd.close()
         print("[+] System shutdown complete")
 
-if _name_ == "_main_":
+if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,111 @@
+import threading
+import time
+
+
+class LcdWriter:
+    """
+    Owns the character LCD and writes to it from one background thread.
+
+    Callers hand over the wanted lines with show() and return at once. The
+    worker coalesces whatever arrived since its last write, keeps at least
+    min_interval between writes, and compares against what the display
+    already holds, so only the characters that changed cross the I2C bus
+    instead of a clear() and full rewrite per update.
+    """
+
+    def __init__(self, lcd, cols=16, rows=2, min_interval=0.5):
+        self.lcd = lcd
+        self.cols = cols
+        self.rows = rows
+        self.min_interval = min_interval
+        self.lock = threading.Lock()
+        self.pending = None
+        self.shown = None  # What the display holds; None forces a full write
+        self.requests = 0
+        self.writes = 0
+        self.chars_written = 0
+        self.errors = 0
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="lcd-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the worker after it writes anything still pending."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+
+    def show(self, lines):
+        """Ask for lines to be displayed; only the latest request before a write is used."""
+        padded = tuple(str(line)[:self.cols].ljust(self.cols) for line in lines[:self.rows])
+        padded += (" " * self.cols,) * (self.rows - len(padded))
+        with self.lock:
+            self.pending = padded
+            self.requests += 1
+        self._wakeup.set()
+
+    def _changed_runs(self, row, line):
+        """(column, text) spans of line that differ from what row shows."""
+        if self.shown is None:
+            return [(0, line)]
+        old = self.shown[row]
+        runs = []
+        col = 0
+        while col < self.cols:
+            if line[col] == old[col]:
+                col += 1
+                continue
+            start = col
+            # A cursor move costs about as much as one character, so bridge single-character gaps
+            while col < self.cols and (line[col] != old[col] or (col + 1 < self.cols and line[col + 1] != old[col + 1])):
+                col += 1
+            runs.append((start, line[start:col]))
+        return runs
+
+    def _write(self, lines):
+        for row, line in enumerate(lines):
+            for col, text in self._changed_runs(row, line):
+                self.lcd.cursor_pos = (row, col)
+                self.lcd.write_string(text)
+                self.chars_written += len(text)
+        self.shown = lines
+        self.writes += 1
+
+    def _run(self):
+        last_write = 0.0
+        while True:
+            self._wakeup.wait()
+            if not self._stopping.is_set():
+                # Rate limit; requests arriving meanwhile replace the pending lines
+                self._stopping.wait(max(0.0, last_write + self.min_interval - time.monotonic()))
+            self._wakeup.clear()
+            with self.lock:
+                lines, self.pending = self.pending, None
+            if lines is not None and lines != self.shown:
+                try:
+                    self._write(lines)
+                except Exception as e:
+                    self.errors += 1
+                    self.shown = None
+                    print(f"[!] LCD update error: {e}")
+                    with self.lock:
+                        # Retry with a full write unless newer lines already arrived
+                        if self.pending is None:
+                            self.pending = lines
+                            self._wakeup.set()
+                last_write = time.monotonic()
+            if self._stopping.is_set():
+                return
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "writes": self.writes,
+            "chars_written": self.chars_written,
+            "errors": self.errors,
+        }
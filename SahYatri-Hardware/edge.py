@@ -0,0 +1,93 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+PERSON_CLASS = 0
+
+
+class EdgeResult:
+    """Person count of one frame plus how sure the on-device model is about it."""
+
+    def __init__(self, count, confidence, ambiguous, inference_ms):
+        self.count = count
+        self.confidence = confidence
+        self.ambiguous = ambiguous
+        self.inference_ms = inference_ms
+
+
+class EdgeDetector:
+    """
+    Tiny YOLO person counter running on the Pi's CPU.
+
+    Loads an Ultralytics ONNX export (e.g. yolov8n, INT8-quantized) with
+    onnxruntime, or a .tflite export with tflite_runtime. Both produce the raw
+    (1, 4 + classes, anchors) head output, which is filtered to person boxes
+    and run through NMS here.
+
+    Boxes scoring between conf and sure_conf are ambiguous: the small model can
+    not tell whether they are people. confidence is the share of counted boxes
+    that are not ambiguous, so the capture loop can hand uncertain frames to
+    the server's larger model.
+    """
+
+    def __init__(self, model_path, imgsz=320, conf=0.25, sure_conf=0.5, iou=0.7, threads=4):
+        self.model_path = model_path
+        self.imgsz = imgsz
+        self.conf = conf
+        self.sure_conf = sure_conf
+        self.iou = iou
+        self.name = os.path.basename(model_path)
+
+        if model_path.endswith(".tflite"):
+            from tflite_runtime.interpreter import Interpreter
+            self._interpreter = Interpreter(model_path=model_path, num_threads=threads)
+            self._interpreter.allocate_tensors()
+            self._input = self._interpreter.get_input_details()[0]
+            self._output = self._interpreter.get_output_details()[0]
+            self._session = None
+        else:
+            import onnxruntime as ort
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = threads
+            self._session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+            self._input_name = self._session.get_inputs()[0].name
+
+    def _preprocess(self, frame):
+        """Letterbox an RGB frame to imgsz x imgsz, scaled to 0-1."""
+        height, width = frame.shape[:2]
+        scale = self.imgsz / max(height, width)
+        resized = cv2.resize(frame, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_LINEAR)
+        canvas = np.full((self.imgsz, self.imgsz, 3), 114, dtype=np.uint8)
+        top = (self.imgsz - resized.shape[0]) // 2
+        left = (self.imgsz - resized.shape[1]) // 2
+        canvas[top:top + resized.shape[0], left:left + resized.shape[1]] = resized
+        return canvas.astype(np.float32)[None] / 255.0
+
+    def _infer(self, tensor):
+        if self._session is None:
+            # TFLite exports take NHWC input
+            self._interpreter.set_tensor(self._input["index"], tensor)
+            self._interpreter.invoke()
+            return self._interpreter.get_tensor(self._output["index"])[0]
+        return self._session.run(None, {self._input_name: tensor.transpose(0, 3, 1, 2)})[0][0]
+
+    def count(self, frame):
+        """Count people in an RGB frame."""
+        started = time.perf_counter()
+        prediction = self._infer(self._preprocess(frame))
+        inference_ms = (time.perf_counter() - started) * 1000
+
+        candidates = np.flatnonzero(prediction[4 + PERSON_CLASS] > self.conf)
+        candidates = candidates[prediction[4:, candidates].argmax(axis=0) == PERSON_CLASS]
+        if candidates.size == 0:
+            return EdgeResult(0, 1.0, 0, inference_ms)
+        xywh = prediction[:4, candidates]
+        boxes = np.stack((xywh[0] - xywh[2] / 2, xywh[1] - xywh[3] / 2, xywh[2], xywh[3]), axis=1)
+        scores = prediction[4 + PERSON_CLASS, candidates]
+        kept = np.asarray(cv2.dnn.NMSBoxes(boxes.tolist(), scores.tolist(), self.conf, self.iou)).reshape(-1)
+        if kept.size == 0:
+            return EdgeResult(0, 1.0, 0, inference_ms)
+        ambiguous = int((scores[kept] < self.sure_conf).sum())
+        return EdgeResult(len(kept), 1.0 - ambiguous / len(kept), ambiguous, inference_ms)
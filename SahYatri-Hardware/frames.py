@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+
+
+class Frame:
+    """One captured frame: the raw camera array and its annotated JPEG (None while nobody watches)."""
+
+    __slots__ = ("seq", "captured_at", "raw", "jpeg")
+
+    def __init__(self, seq, captured_at, raw, jpeg):
+        self.seq = seq
+        self.captured_at = captured_at
+        self.raw = raw
+        self.jpeg = jpeg
+
+
+class FrameProducer:
+    """
+    Single camera reader shared by every consumer.
+
+    One thread captures at fps, draws the overlay and encodes the JPEG once per
+    frame into a small ring buffer. MJPEG viewers and the capture loop read
+    from the buffer instead of each driving the camera, so N viewers cost N
+    socket writes rather than N captures and encodes. Slow viewers skip to the
+    newest frame instead of falling behind.
+
+    With no viewer connected nothing is annotated or encoded, and frames are
+    only captured at idle_fps, the rate the capture loop samples them at.
+    """
+
+    def __init__(self, capture, annotate, fps=15, quality=80, ring_size=4, timings=None, idle_fps=1):
+        self.capture = capture  # () -> raw frame array
+        self.annotate = annotate  # (raw frame) -> BGR frame with overlay
+        self.timings = timings  # Optional (stage name, ms) -> None, e.g. Telemetry.time
+        self.interval = 1.0 / fps
+        self.idle_interval = 1.0 / idle_fps
+        self.viewers = 0
+        self.quality = quality
+        self.ring = deque(maxlen=ring_size)
+        self.condition = threading.Condition()
+        self.seq = 0
+        self.errors = 0
+        self.capture_ms = 0.0
+        self.encode_ms = 0.0
+        self.fps = 0.0
+        self._stopping = threading.Event()
+        self._viewer_joined = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, name="frame-producer", daemon=True).start()
+
+    def stop(self):
+        self._stopping.set()
+        self._viewer_joined.set()
+
+    def _run(self):
+        next_due = time.monotonic()
+        window_start, window_frames = next_due, 0
+        while not self._stopping.is_set():
+            watched = self.viewers > 0
+            try:
+                started = time.monotonic()
+                raw = self.capture()
+                captured = time.monotonic()
+                jpeg = None
+                if watched:
+                    ret, buffer = cv2.imencode('.jpg', self.annotate(raw), [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+                    if not ret:
+                        raise Exception("Frame encoding failed")
+                    jpeg = buffer.tobytes()
+                encoded = time.monotonic()
+                self.capture_ms = (captured - started) * 1000
+                if self.timings:
+                    self.timings("stream_capture", self.capture_ms)
+                if watched:
+                    self.encode_ms = (encoded - captured) * 1000
+                    if self.timings:
+                        self.timings("stream_encode", self.encode_ms)
+                with self.condition:
+                    self.seq += 1
+                    self.ring.append(Frame(self.seq, time.time(), raw, jpeg))
+                    self.condition.notify_all()
+
+                window_frames += 1
+                if encoded - window_start >= 5:
+                    self.fps = window_frames / (encoded - window_start)
+                    window_start, window_frames = encoded, 0
+            except Exception as e:
+                self.errors += 1
+                print(f"[!] Frame producer error: {e}")
+                self._stopping.wait(1)
+            next_due = max(next_due + (self.interval if watched else self.idle_interval), time.monotonic())
+            # A new viewer cuts an idle wait short
+            self._viewer_joined.wait(next_due - time.monotonic())
+            if self._viewer_joined.is_set():
+                self._viewer_joined.clear()
+                next_due = time.monotonic()
+
+    def latest(self):
+        """Newest frame, or None before the first one."""
+        with self.condition:
+            return self.ring[-1] if self.ring else None
+
+    def wait_newer(self, seq, timeout=5.0):
+        """Block until a frame newer than seq is available and return the newest."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.ring and self.ring[-1].seq > seq, timeout)
+            return self.ring[-1] if self.ring and self.ring[-1].seq > seq else None
+
+    def stream(self):
+        """Multipart MJPEG generator for one viewer; frames are encoded while at least one is connected."""
+        with self.condition:
+            self.viewers += 1
+        self._viewer_joined.set()
+        try:
+            seq = 0
+            while not self._stopping.is_set():
+                frame = self.wait_newer(seq)
+                if frame is None:
+                    continue
+                seq = frame.seq
+                if frame.jpeg is None:
+                    continue  # Captured before this viewer joined
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + frame.jpeg + b'\r\n')
+        finally:
+            with self.condition:
+                self.viewers -= 1
+
+    def stats(self):
+        return {
+            "fps": round(self.fps, 1),
+            "viewers": self.viewers,
+            "frames": self.seq,
+            "errors": self.errors,
+            "capture_ms": round(self.capture_ms, 1),
+            "encode_ms": round(self.encode_ms, 1),
+        }
@@ -0,0 +1,255 @@
+import threading
+import time
+from typing import NamedTuple, Optional
+
+KNOTS_TO_KMH = 1.852
+
+
+class Fix(NamedTuple):
+    """One position, from the GPS receiver or an IP lookup."""
+
+    latitude: float
+    longitude: float
+    source: str  # "gps", "replay" or "ip"
+    received_at: float  # epoch seconds
+    speed_kmh: Optional[float] = None
+    course: Optional[float] = None
+    satellites: Optional[int] = None
+    place: Optional[str] = None  # City name from an IP lookup
+
+    @property
+    def label(self):
+        """Short text for the LCD and dashboard (fits 16 columns for GPS fixes)."""
+        return self.place or f"{self.latitude:.4f},{self.longitude:.4f}"
+
+
+def _coordinate(value, hemisphere):
+    """NMEA ddmm.mmmm / dddmm.mmmm plus N/S/E/W to signed decimal degrees."""
+    dot = value.index(".") if "." in value else len(value)
+    degrees = int(value[:dot - 2]) + float(value[dot - 2:]) / 60
+    return -degrees if hemisphere in ("S", "W") else degrees
+
+
+class NmeaParser:
+    """
+    Incremental NMEA 0183 parser.
+
+    feed() takes whatever bytes the serial port had ready, keeps a partial
+    sentence for the next call and returns the fixes completed so far. RMC
+    sentences give position, speed and course (only when the receiver flags
+    them valid); GGA supplies the satellite count. Sentences with a bad
+    checksum are dropped.
+    """
+
+    MAX_SENTENCE = 128  # NMEA allows 82 characters; anything longer is line noise
+
+    def __init__(self, source="gps"):
+        self.source = source
+        self._buffer = b""
+        self.satellites = None
+        self.sentences = 0
+        self.bad_sentences = 0
+
+    def feed(self, data):
+        self._buffer += data
+        *lines, self._buffer = self._buffer.split(b"\n")
+        if len(self._buffer) > self.MAX_SENTENCE:
+            self._buffer = b""
+        fixes = []
+        for line in lines:
+            fix = self.parse(line.strip().decode("ascii", "replace"))
+            if fix is not None:
+                fixes.append(fix)
+        return fixes
+
+    def parse(self, sentence):
+        """Parse one sentence; returns a Fix for a valid RMC, else None."""
+        if not sentence.startswith("$"):
+            return None
+        body, _, checksum = sentence[1:].partition("*")
+        if checksum:
+            calculated = 0
+            for char in body:
+                calculated ^= ord(char)
+            if checksum[:2].upper() != f"{calculated:02X}":
+                self.bad_sentences += 1
+                return None
+        fields = body.split(",")
+        kind = fields[0][2:]  # Drop the talker (GP, GN, GL, ...)
+        self.sentences += 1
+        try:
+            if kind == "GGA" and len(fields) > 7:
+                self.satellites = int(fields[7]) if fields[7] else None
+            elif kind == "RMC" and len(fields) > 8 and fields[2] == "A":
+                return Fix(
+                    _coordinate(fields[3], fields[4]),
+                    _coordinate(fields[5], fields[6]),
+                    self.source,
+                    time.time(),
+                    speed_kmh=float(fields[7]) * KNOTS_TO_KMH if fields[7] else None,
+                    course=float(fields[8]) if fields[8] else None,
+                    satellites=self.satellites,
+                )
+        except ValueError:
+            self.bad_sentences += 1
+        return None
+
+
+class SerialGpsProvider:
+    """
+    Reads a GPS receiver's NMEA stream on a serial port in a background thread.
+
+    Reads return whatever bytes are waiting, so the thread never sits on a
+    half-received sentence, and the newest fix is kept for latest(). The port
+    is reopened if the receiver is unplugged.
+    """
+
+    def __init__(self, port="/dev/serial0", baudrate=9600):
+        self.port = port
+        self.baudrate = baudrate
+        self.parser = NmeaParser("gps")
+        self.fix = None
+        self.errors = 0
+
+    def start(self):
+        threading.Thread(target=self._run, name="gps-reader", daemon=True).start()
+
+    def _run(self):
+        import serial  # pyserial, only needed with a receiver attached
+        while True:
+            try:
+                with serial.Serial(self.port, self.baudrate, timeout=0.5) as port:
+                    print(f"[GPS] Reading NMEA from {self.port}")
+                    while True:
+                        data = port.read(port.in_waiting or 1)
+                        for fix in self.parser.feed(data):
+                            self.fix = fix
+            except Exception as e:
+                self.errors += 1
+                print(f"[!] GPS serial error on {self.port}: {e}")
+                time.sleep(5)
+
+    def latest(self):
+        return self.fix
+
+
+class ReplayGpsProvider:
+    """
+    Plays back a recorded NMEA log as if it came from a receiver.
+
+    One RMC sentence is one receiver epoch, so the replay waits interval
+    seconds after each; GGA and other sentences in between are fed straight
+    through. The log restarts from the top when loop is set, at most once
+    per interval so a log without a valid fix does not spin.
+    """
+
+    def __init__(self, path, interval=1.0, loop=True):
+        self.path = path
+        self.interval = interval
+        self.loop = loop
+        self.parser = NmeaParser("replay")
+        self.fix = None
+
+    def start(self):
+        threading.Thread(target=self._run, name="gps-replay", daemon=True).start()
+
+    def _run(self):
+        while True:
+            with open(self.path, "rb") as log:
+                for line in log:
+                    for fix in self.parser.feed(line):
+                        self.fix = fix
+                        time.sleep(self.interval)
+            if not self.loop:
+                return
+            time.sleep(self.interval)
+
+    def latest(self):
+        return self.fix
+
+
+class IpLocationProvider:
+    """City-level position from an IP geolocation lookup; a network round trip, so call rarely."""
+
+    def lookup(self):
+        import geocoder  # Only needed when there is no GPS fix
+        g = geocoder.ip('me')
+        if not g.ok or not g.latlng:
+            return None
+        return Fix(g.latlng[0], g.latlng[1], "ip", time.time(), place=f"{g.city}, {g.country}")
+
+
+class LocationService:
+    """
+    Cached position for the rest of the node; current() never blocks.
+
+    The provider's newest fix is used while it is younger than max_fix_age
+    seconds. Without one, the IP fallback is looked up in a background thread
+    at most once per fallback_ttl seconds, and the newer of its cached result
+    and the last (stale) fix is returned meanwhile. That is fine for the LCD,
+    but uploads should use fresh(), which only returns a live receiver fix.
+    """
+
+    def __init__(self, provider=None, fallback=None, max_fix_age=10, fallback_ttl=600):
+        self.provider = provider
+        self.fallback = fallback
+        self.max_fix_age = max_fix_age
+        self.fallback_ttl = fallback_ttl
+        self.fallback_fix = None
+        self.lookups = 0
+        self._last_lookup = 0.0
+        self._lookup_running = threading.Lock()
+
+    def start(self):
+        if self.provider:
+            self.provider.start()
+
+    def current(self):
+        fix = self.fresh()
+        if fix is not None:
+            return fix
+        self._refresh_fallback()
+        fix = self.provider.latest() if self.provider else None
+        known = [candidate for candidate in (fix, self.fallback_fix) if candidate is not None]
+        return max(known, key=lambda candidate: candidate.received_at) if known else None
+
+    def fresh(self):
+        """The provider's fix if younger than max_fix_age, else None; never a stale or IP position."""
+        fix = self.provider.latest() if self.provider else None
+        if fix is not None and time.time() - fix.received_at <= self.max_fix_age:
+            return fix
+        return None
+
+    def _refresh_fallback(self):
+        if self.fallback is None or time.monotonic() - self._last_lookup < self.fallback_ttl:
+            return
+        if not self._lookup_running.acquire(blocking=False):
+            return
+        self._last_lookup = time.monotonic()
+        threading.Thread(target=self._lookup, name="ip-location", daemon=True).start()
+
+    def _lookup(self):
+        try:
+            self.lookups += 1
+            fix = self.fallback.lookup()
+            if fix is not None:
+                self.fallback_fix = fix
+                print(f"[GPS] No fix, IP location: {fix.place}")
+            else:
+                print("[!] GPS: Could not get location data")
+        except Exception as e:
+            print(f"[!] IP location error: {e}")
+        finally:
+            self._lookup_running.release()
+
+    def stats(self):
+        fix = self.provider.latest() if self.provider else None
+        parser = getattr(self.provider, "parser", None)
+        return {
+            "source": fix.source if fix else None,
+            "fix_age": round(time.time() - fix.received_at, 1) if fix else None,
+            "satellites": fix.satellites if fix else None,
+            "sentences": parser.sentences if parser else 0,
+            "bad_sentences": parser.bad_sentences if parser else 0,
+            "ip_lookups": self.lookups,
+        }
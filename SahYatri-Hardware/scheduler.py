@@ -0,0 +1,94 @@
+import time
+
+import cv2
+import numpy as np
+
+THUMBNAIL_SIZE = (64, 48)
+
+
+class CaptureScheduler:
+    """
+    Picks the time between captures from cheap on-device signals.
+
+    Activity is the larger of two scores between 0 and 1: motion energy (mean
+    difference between blurred thumbnails of consecutive sampled frames, above
+    a sensor-noise floor) and the change in occupancy since the previous
+    capture. Full activity captures every min_interval seconds, none every
+    max_interval. The interval drops at once when activity rises but relaxes
+    gradually, so a busy stop is sampled immediately and a short lull does
+    not stop sampling.
+
+    The server's backpressure hint (inference queue fill, 0-1) stretches the
+    interval by up to backpressure_factor, and a Retry-After is honoured as a
+    floor for the next capture.
+    """
+
+    def __init__(self, min_interval=1.0, max_interval=30.0, start_interval=5.0, motion_floor=2.0,
+                 motion_full=12.0, occupancy_full=3, relax=0.25, backpressure_factor=4.0):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.activity_interval = min(max(start_interval, min_interval), max_interval)
+        self.motion_floor = motion_floor
+        self.motion_full = motion_full
+        self.occupancy_full = occupancy_full
+        self.relax = relax
+        self.backpressure_factor = backpressure_factor
+        self.motion = 0.0
+        self.motion_activity = 0.0
+        self.occupancy_activity = 0.0
+        self.backpressure = 0.0
+        self.not_before = 0.0
+        self._thumbnail = None
+        self._occupancy = None
+
+    def observe_frame(self, frame):
+        """Update motion energy from a sampled video frame."""
+        small = cv2.resize(frame[:, :, :3], THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_RGB2GRAY), (3, 3), 0).astype(np.int16)
+        if self._thumbnail is not None:
+            self.motion = float(np.abs(gray - self._thumbnail).mean())
+            span = self.motion_full - self.motion_floor
+            self.motion_activity = min(1.0, max(0.0, (self.motion - self.motion_floor) / span))
+        self._thumbnail = gray
+        self._update()
+
+    def observe_occupancy(self, occupancy):
+        """Update occupancy change from the latest detection result."""
+        if self._occupancy is not None:
+            self.occupancy_activity = min(1.0, abs(occupancy - self._occupancy) / self.occupancy_full)
+        self._occupancy = occupancy
+        self._update()
+
+    def observe_backpressure(self, backpressure, retry_after=None):
+        """Update from the server's X-Backpressure and Retry-After headers."""
+        self.backpressure = min(1.0, max(0.0, backpressure))
+        if retry_after:
+            self.not_before = time.monotonic() + retry_after
+
+    def _update(self):
+        activity = max(self.motion_activity, self.occupancy_activity)
+        target = self.max_interval - activity * (self.max_interval - self.min_interval)
+        if target < self.activity_interval:
+            self.activity_interval = target
+        else:
+            self.activity_interval += self.relax * (target - self.activity_interval)
+
+    @property
+    def interval(self):
+        """Current seconds between captures, including backpressure."""
+        stretched = self.activity_interval * (1 + self.backpressure_factor * self.backpressure)
+        return min(self.max_interval, stretched)
+
+    def next_capture(self, last_capture):
+        """Monotonic time at which the capture after last_capture is due."""
+        return max(last_capture + self.interval, self.not_before)
+
+    def stats(self):
+        return {
+            "interval": round(self.interval, 2),
+            "rate_per_min": round(60 / self.interval, 1),
+            "motion": round(self.motion, 2),
+            "motion_activity": round(self.motion_activity, 2),
+            "occupancy_activity": round(self.occupancy_activity, 2),
+            "backpressure": self.backpressure,
+        }
@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+
+import cv2
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class SimulatedCamera:
+    """
+    Stand-in for Picamera2 that replays a video file or a directory of images.
+
+    Implements the calls capture.py makes (create_video_configuration,
+    configure, start, capture_array, close). Frames are decoded once up front
+    (at most max_frames, resized to the configured size and converted to RGB
+    like the Pi's video stream) and looped. capture_array blocks until the
+    next frame is due at the configured FrameRate, as the real camera does, so
+    timings measure the node's own work rather than decoding the source.
+    """
+
+    def __init__(self, source, max_frames=150):
+        self.source = source
+        self.max_frames = max_frames
+        self.size = (640, 480)
+        self.frame_rate = 30
+        self.frames = []
+        self.index = 0
+        self.lock = threading.Lock()
+        self._next_due = 0.0
+
+    def create_video_configuration(self, main=None, controls=None):
+        return {"main": main or {}, "controls": controls or {}}
+
+    def configure(self, config):
+        self.size = tuple(config["main"].get("size", self.size))
+        self.frame_rate = config["controls"].get("FrameRate", self.frame_rate)
+
+    def _load(self):
+        if os.path.isdir(self.source):
+            names = sorted(name for name in os.listdir(self.source) if name.lower().endswith(IMAGE_EXTENSIONS))
+            images = (cv2.imread(os.path.join(self.source, name)) for name in names)
+        else:
+            images = self._video_frames()
+        for image in images:
+            if image is None:
+                continue
+            self.frames.append(cv2.cvtColor(cv2.resize(image, self.size), cv2.COLOR_BGR2RGB))
+            if len(self.frames) >= self.max_frames:
+                break
+        if not self.frames:
+            raise RuntimeError(f"No frames could be read from {self.source}")
+
+    def _video_frames(self):
+        video = cv2.VideoCapture(self.source)
+        try:
+            while True:
+                ok, image = video.read()
+                if not ok:
+                    return
+                yield image
+        finally:
+            video.release()
+
+    def start(self):
+        self._load()
+        self._next_due = time.monotonic()
+        print(f"[SIM] Camera replaying {len(self.frames)} frames from {self.source} at {self.frame_rate} fps")
+
+    def capture_array(self, name="main"):
+        with self.lock:
+            now = time.monotonic()
+            if self._next_due > now:
+                time.sleep(self._next_due - now)
+            self._next_due = max(self._next_due + 1.0 / self.frame_rate, time.monotonic() - 1.0 / self.frame_rate)
+            frame = self.frames[self.index]
+            self.index = (self.index + 1) % len(self.frames)
+        return frame
+
+    def close(self):
+        self.frames = []
+
+
+class SimulatedLcd:
+    """
+    Stand-in for RPLCD's CharLCD that keeps the screen in memory.
+
+    Each character and cursor move costs write_delay seconds, roughly what a
+    PCF8574 backpack on a 100 kHz I2C bus needs, so display traffic shows up
+    in timings. text() returns what the screen shows.
+    """
+
+    def __init__(self, cols=16, rows=2, write_delay=0.001):
+        self.cols = cols
+        self.rows = rows
+        self.write_delay = write_delay
+        self.buffer = [[" "] * cols for _ in range(rows)]
+        self.position = (0, 0)
+        self.commands = 0
+        self.chars = 0
+
+    def _cost(self, units):
+        if self.write_delay:
+            time.sleep(units * self.write_delay)
+
+    def clear(self):
+        self.buffer = [[" "] * self.cols for _ in range(self.rows)]
+        self.position = (0, 0)
+        self.commands += 1
+        self._cost(2)  # The HD44780 clear command takes about 2 ms
+
+    @property
+    def cursor_pos(self):
+        return self.position
+
+    @cursor_pos.setter
+    def cursor_pos(self, position):
+        self.position = position
+        self.commands += 1
+        self._cost(1)
+
+    def write_string(self, text):
+        row, col = self.position
+        for char in text:
+            if col < self.cols:
+                self.buffer[row][col] = char
+            col += 1
+        self.position = (row, col)
+        self.chars += len(text)
+        self._cost(len(text))
+
+    def close(self):
+        pass
+
+    def text(self):
+        return ["".join(row) for row in self.buffer]
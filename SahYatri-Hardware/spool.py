@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+
+class SpooledFrame:
+    """One JPEG waiting in a spool directory."""
+
+    def __init__(self, name, camera_id, captured_at, size):
+        self.name = name
+        self.camera_id = camera_id
+        self.captured_at = captured_at  # epoch seconds
+        self.size = size
+
+    @property
+    def timestamp(self):
+        return datetime.fromtimestamp(self.captured_at).astimezone().isoformat(timespec="seconds")
+
+
+class FrameSpool:
+    """
+    Directory of JPEG frames kept within a size and age budget.
+
+    Files are named <capture time in ms>_<camera id>.jpg, so the queue survives
+    a reboot: the directory is scanned on startup and the in-memory index is
+    rebuilt in capture order. When a new frame would exceed max_bytes the
+    oldest frames are evicted first, and frames older than max_age seconds are
+    expired, so the SD card never fills up.
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024, max_age=24 * 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.frames = deque()
+        self.bytes = 0
+        self.evicted = 0
+        self.expired = 0
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        found = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                # Left over from a write interrupted by a power cut
+                os.remove(os.path.join(self.directory, name))
+                continue
+            millis, _, rest = name.partition("_")
+            if not millis.isdigit() or not rest.endswith(".jpg"):
+                continue
+            size = os.path.getsize(os.path.join(self.directory, name))
+            found.append(SpooledFrame(name, rest[:-4], int(millis) / 1000, size))
+        found.sort(key=lambda frame: frame.captured_at)
+        self.frames.extend(found)
+        self.bytes = sum(frame.size for frame in found)
+
+    def _remove_oldest(self):
+        frame = self.frames.popleft()
+        self.bytes -= frame.size
+        try:
+            os.remove(os.path.join(self.directory, frame.name))
+        except FileNotFoundError:
+            pass
+
+    def _expire(self, now):
+        while self.frames and now - self.frames[0].captured_at > self.max_age:
+            self._remove_oldest()
+            self.expired += 1
+
+    def put(self, camera_id, jpeg, captured_at=None):
+        """Store a frame, evicting the oldest ones to stay within budget."""
+        captured_at = time.time() if captured_at is None else captured_at
+        name = f"{int(captured_at * 1000):013d}_{camera_id}.jpg"
+        path = os.path.join(self.directory, name)
+        with self.lock:
+            self._expire(time.time())
+            while self.frames and self.bytes + len(jpeg) > self.max_bytes:
+                self._remove_oldest()
+                self.evicted += 1
+            # Write then rename, so a power cut never leaves a truncated JPEG in the queue
+            with open(path + ".tmp", "wb") as f:
+                f.write(jpeg)
+            os.replace(path + ".tmp", path)
+            self.frames.append(SpooledFrame(name, camera_id, captured_at, len(jpeg)))
+            self.bytes += len(jpeg)
+
+    def peek(self, count):
+        """Oldest frames with their JPEG bytes, without removing them."""
+        with self.lock:
+            self._expire(time.time())
+            batch = list(self.frames)[:count]
+        result = []
+        for frame in batch:
+            try:
+                with open(os.path.join(self.directory, frame.name), "rb") as f:
+                    result.append((frame, f.read()))
+            except FileNotFoundError:
+                self.discard([frame])
+        return result
+
+    def discard(self, frames):
+        """Remove frames that were delivered (or can never be)."""
+        names = {frame.name for frame in frames}
+        with self.lock:
+            kept = deque()
+            for frame in self.frames:
+                if frame.name in names:
+                    self.bytes -= frame.size
+                    try:
+                        os.remove(os.path.join(self.directory, frame.name))
+                    except FileNotFoundError:
+                        pass
+                else:
+                    kept.append(frame)
+            self.frames = kept
+
+    def __len__(self):
+        return len(self.frames)
+
+    def stats(self):
+        return {
+            "pending": len(self.frames),
+            "bytes": self.bytes,
+            "oldest": self.frames[0].timestamp if self.frames else None,
+            "evicted": self.evicted,
+            "expired": self.expired,
+        }
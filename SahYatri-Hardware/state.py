@@ -0,0 +1,75 @@
+import threading
+from typing import NamedTuple
+
+
+class NodeState(NamedTuple):
+    """Everything the node shows about itself, as one immutable snapshot."""
+
+    occupancy: int = 0
+    capacity: int = 40
+    status: str = "Initializing"
+    last_update: str = "Not yet updated"
+    location: str = "Locating..."
+    location_update: str = "Never"
+    camera_ready: bool = False
+    api_available: bool = False
+    version: int = 0
+
+
+class StateStore:
+    """
+    Holds the current NodeState and publishes changes atomically.
+
+    Writers from any thread call update(); it builds a new snapshot under a
+    lock and swaps it in, so readers always see a consistent set of fields
+    from the single reference read of `current` without locking. Updates that
+    change nothing are not published. Subscribers are called one update at a
+    time and only ever with a newer snapshot than their last, so a slow
+    update() racing a faster one cannot leave an older state on the LCD.
+    wait_newer() lets streams block until the next snapshot.
+    """
+
+    def __init__(self, initial=None):
+        self._current = initial or NodeState()
+        self._condition = threading.Condition()
+        self._subscribers = []
+        self._dispatching = threading.Lock()
+        self._delivered = -1  # Version subscribers last saw
+
+    @property
+    def current(self):
+        return self._current
+
+    def subscribe(self, callback):
+        """Call callback(snapshot) after published changes, in version order."""
+        self._subscribers.append(callback)
+
+    def update(self, **changes):
+        """Apply changes and publish the new snapshot; returns the current one."""
+        with self._condition:
+            previous = self._current
+            updated = previous._replace(**changes)
+            if updated == previous:
+                return previous
+            self._current = updated._replace(version=previous.version + 1)
+            self._condition.notify_all()
+            published = self._current
+        with self._dispatching:
+            # Deliver the newest snapshot; a concurrent update may already have
+            # delivered this one or a later one
+            latest = self._current
+            if latest.version > self._delivered:
+                self._delivered = latest.version
+                for callback in self._subscribers:
+                    try:
+                        callback(latest)
+                    except Exception as e:
+                        print(f"[!] State subscriber error: {e}")
+        return published
+
+    def wait_newer(self, version, timeout=None):
+        """Block until a snapshot newer than version is published; None on timeout."""
+        with self._condition:
+            if self._condition.wait_for(lambda: self._current.version > version, timeout):
+                return self._current
+            return None
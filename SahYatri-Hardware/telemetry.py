@@ -0,0 +1,115 @@
+import subprocess
+import threading
+import time
+from collections import deque
+
+# Bits of `vcgencmd get_throttled`
+THROTTLE_FLAGS = {
+    0: "under_voltage",
+    1: "arm_frequency_capped",
+    2: "throttled",
+    3: "soft_temperature_limit",
+    16: "under_voltage_occurred",
+    17: "arm_frequency_capping_occurred",
+    18: "throttling_occurred",
+    19: "soft_temperature_limit_occurred",
+}
+
+
+class Timing:
+    """Recent samples of one duration, in milliseconds."""
+
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+        self.last = None
+
+    def add(self, ms):
+        self.last = ms
+        self.samples.append(ms)
+
+    def summary(self):
+        if not self.samples:
+            return {"count": 0}
+        ordered = sorted(self.samples)
+        return {
+            "count": len(ordered),
+            "last": round(self.last, 1),
+            "p50": round(ordered[len(ordered) // 2], 1),
+            "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+            "max": round(ordered[-1], 1),
+        }
+
+
+class Telemetry:
+    """
+    Counters and timings of the capture node, filled in by the code doing the work.
+
+    API health comes from real traffic: the outcome of every upload, and the
+    detection service's /health checked by the system monitor.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = {}
+        self.counters = {}
+        self.last_success = None
+        self.last_failure = None
+        self.last_error = None
+        self.consecutive_failures = 0
+        self.server_health = None
+
+    def time(self, name, ms):
+        with self.lock:
+            self.timings.setdefault(name, Timing()).add(ms)
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def upload_result(self, kind, ok, error=None):
+        """Record the outcome of a call to the detection service."""
+        with self.lock:
+            key = f"{kind}_{'success' if ok else 'failure'}"
+            self.counters[key] = self.counters.get(key, 0) + 1
+            if ok:
+                self.last_success = time.time()
+                self.consecutive_failures = 0
+            else:
+                self.last_failure = time.time()
+                self.last_error = error
+                self.consecutive_failures += 1
+
+    def api_status(self):
+        return {
+            "server_health": self.server_health,
+            "last_success": self.last_success,
+            "last_failure": self.last_failure,
+            "last_error": self.last_error,
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "counters": dict(self.counters),
+                "timings_ms": {name: timing.summary() for name, timing in self.timings.items()},
+            }
+
+
+def cpu_temperature():
+    """SoC temperature in degrees Celsius, or None off a Pi."""
+    try:
+        with open("/sys/class/thermal/thermal_zone0/temp") as f:
+            return int(f.read().strip()) / 1000
+    except (OSError, ValueError):
+        return None
+
+
+def throttle_state():
+    """Decoded `vcgencmd get_throttled`, or None when vcgencmd is unavailable."""
+    try:
+        output = subprocess.run(["vcgencmd", "get_throttled"], capture_output=True, text=True, timeout=2).stdout
+        value = int(output.strip().split("=")[1], 16)
+    except (OSError, subprocess.SubprocessError, IndexError, ValueError):
+        return None
+    return {"raw": hex(value), "flags": [name for bit, name in THROTTLE_FLAGS.items() if value & (1 << bit)]}